@@ -0,0 +1,209 @@
+"""Stateless HMAC-signed access tokens.
+
+A token looks like `v1.<payload>.<signature>` where payload is base64url JSON carrying the
+user id, username, role, church, issue time, expiry and a random `jti`. Verifying a token
+needs no database read; the only shared state is a small revocation list that every worker
+refreshes every `TOKEN_REVOCATION_REFRESH` seconds. Async callers refresh it off the event loop
+(`revocations_stale` / `refresh_revocations`) and then verify with `refresh=False`.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .db import (
+    get_or_create_setting,
+    add_token_revocation,
+    list_token_revocations,
+    purge_expired_tokens,
+)
+
+TOKEN_PREFIX = 'v1.'
+# Lifetime of an access token in seconds (matches the previous 1-hour expiry of opaque tokens)
+TOKEN_TTL = int(os.getenv('TOKEN_TTL', '3600'))
+TOKEN_REVOCATION_REFRESH = float(os.getenv('TOKEN_REVOCATION_REFRESH', '15'))
+TOKEN_PURGE_INTERVAL = float(os.getenv('TOKEN_PURGE_INTERVAL', '600'))
+
+_secret: Optional[bytes] = None
+_secret_lock = threading.Lock()
+
+# revocation snapshot: jti -> exp, user_id -> not_before (epoch seconds)
+_revoked_jti = {}
+_revoked_users = {}
+_revocations_loaded_at = 0.0
+_revocations_lock = threading.Lock()
+
+
+def _b64e(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64d(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _get_secret() -> bytes:
+    """Signing key from TOKEN_SECRET, or a random key generated once and shared through `app_settings`."""
+    global _secret
+    if _secret is not None:
+        return _secret
+    with _secret_lock:
+        if _secret is None:
+            env = os.getenv('TOKEN_SECRET')
+            if env:
+                _secret = env.encode('utf-8')
+            else:
+                _secret = get_or_create_setting('token_secret', lambda: secrets.token_hex(32)).encode('utf-8')
+    return _secret
+
+
+def _sign(payload_b64: str) -> str:
+    return _b64e(hmac.new(_get_secret(), payload_b64.encode('ascii'), hashlib.sha256).digest())
+
+
+def is_access_token(token: str) -> bool:
+    return bool(token) and token.startswith(TOKEN_PREFIX)
+
+
+def issue_access_token(user: dict) -> str:
+    """Return a signed token for a user dict as returned by `verify_user`."""
+    now = int(time.time())
+    payload = {
+        'sub': user['id'],
+        'usr': user.get('username'),
+        'role': user.get('role'),
+        'church': user.get('church'),
+        'iat': now,
+        'exp': now + TOKEN_TTL,
+        'jti': secrets.token_hex(8),
+    }
+    body = _b64e(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return TOKEN_PREFIX + body + '.' + _sign(body)
+
+
+def _decode(token: str) -> Optional[dict]:
+    if not is_access_token(token):
+        return None
+    try:
+        body, sig = token[len(TOKEN_PREFIX):].split('.', 1)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(sig, _sign(body)):
+        return None
+    try:
+        return json.loads(_b64d(body))
+    except Exception:
+        return None
+
+
+def revocations_stale() -> bool:
+    """True when the revocation snapshot is older than TOKEN_REVOCATION_REFRESH."""
+    return time.monotonic() - _revocations_loaded_at >= TOKEN_REVOCATION_REFRESH
+
+
+def refresh_revocations(force: bool = False) -> None:
+    """Reload the revocation snapshot when stale (or `force`). Reads the database: not for the event loop."""
+    global _revocations_loaded_at
+    now = time.monotonic()
+    if not force and not revocations_stale():
+        return
+    with _revocations_lock:
+        if not force and not revocations_stale():
+            return
+        try:
+            rows = list_token_revocations()
+        except Exception:
+            # keep the previous snapshot if the database is unavailable
+            _revocations_loaded_at = now
+            return
+        jtis = {}
+        users = {}
+        for r in rows:
+            if r.get('jti'):
+                jtis[r['jti']] = r['expires_at']
+            if r.get('user_id') is not None and r.get('not_before') is not None:
+                nb = r['not_before']
+                if isinstance(nb, str):
+                    nb = datetime.fromisoformat(nb)
+                ts = (nb - datetime(1970, 1, 1)).total_seconds()
+                users[r['user_id']] = max(ts, users.get(r['user_id'], 0))
+        _revoked_jti.clear()
+        _revoked_jti.update(jtis)
+        _revoked_users.clear()
+        _revoked_users.update(users)
+        _revocations_loaded_at = now
+
+
+def verify_access_token(token: str, refresh: bool = True) -> Optional[dict]:
+    """Return `{id, username, church, role}` for a valid, unexpired, unrevoked signed token, else None.
+
+    With `refresh=False` the current revocation snapshot is used as is (no database read).
+    """
+    payload = _decode(token)
+    if not payload:
+        return None
+    if payload.get('exp', 0) < time.time():
+        return None
+    if refresh:
+        refresh_revocations()
+    if payload.get('jti') in _revoked_jti:
+        return None
+    cutoff = _revoked_users.get(payload.get('sub'))
+    if cutoff is not None and payload.get('iat', 0) <= cutoff:
+        return None
+    return {'id': payload['sub'], 'username': payload.get('usr'), 'church': payload.get('church'), 'role': payload.get('role')}
+
+
+def revoke_access_token(token: str) -> bool:
+    """Revoke a single signed token (e.g. on logout). Returns False if the token is not a valid signed token."""
+    payload = _decode(token)
+    if not payload or not payload.get('jti'):
+        return False
+    expires_at = datetime.utcfromtimestamp(payload.get('exp', time.time()))
+    add_token_revocation(expires_at, jti=payload['jti'])
+    _revoked_jti[payload['jti']] = expires_at
+    return True
+
+
+def revoke_user_tokens(user_id: int) -> None:
+    """Revoke every token issued to `user_id` up to now (role/password changes)."""
+    now = datetime.utcnow()
+    # iat has one-second resolution; tokens issued in this same second are revoked too
+    add_token_revocation(now + timedelta(seconds=TOKEN_TTL), user_id=user_id, not_before=now)
+    _revoked_users[user_id] = max(time.time(), _revoked_users.get(user_id, 0))
+
+
+_purger_stop = threading.Event()
+_purger_thread: Optional[threading.Thread] = None
+
+
+def _purge_loop(interval: float) -> None:
+    while not _purger_stop.wait(interval):
+        try:
+            purge_expired_tokens(timedelta(seconds=TOKEN_TTL))
+        except Exception:
+            pass
+
+
+def start_token_purger(interval: float = TOKEN_PURGE_INTERVAL) -> None:
+    """Start a daemon thread that periodically deletes expired rows from `tokens` and `revoked_tokens`."""
+    global _purger_thread
+    if interval <= 0 or (_purger_thread is not None and _purger_thread.is_alive()):
+        return
+    try:
+        purge_expired_tokens(timedelta(seconds=TOKEN_TTL))
+    except Exception:
+        pass
+    _purger_stop.clear()
+    _purger_thread = threading.Thread(target=_purge_loop, args=(interval,), name='token-purger', daemon=True)
+    _purger_thread.start()
+
+
+def stop_token_purger() -> None:
+    _purger_stop.set()
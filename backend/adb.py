@@ -0,0 +1,156 @@
+"""Async data-access layer built on SQLAlchemy's asyncio extension.
+
+Mirrors the read-heavy helpers of `db.py` (auth lookups, member inserts, table/report reads)
+so endpoints can await the database instead of holding a threadpool slot while they wait.
+Uses aiosqlite for SQLite and asyncpg for PostgreSQL; enable with ASYNC_DB=1.
+"""
+import os
+from typing import List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy import insert as sql_insert
+
+from .db import (
+    DATABASE_URL,
+    DB_ENGINE,
+    UPLOADER_BY_KEY_SQL,
+    USER_BY_TOKEN_SQL,
+    _user_from_token_row,
+    get_target_columns,
+    members,
+    non_null_columns_sql,
+    table_versions,
+    table_versions_query,
+)
+from . import money
+from .metrics import instrument_engine
+
+ASYNC_DB = os.getenv("ASYNC_DB", "0").lower() in ("1", "true", "yes")
+
+_engine = None
+
+
+def async_database_url(url: str = DATABASE_URL) -> str:
+    """Map the sync DATABASE_URL onto its async driver (sqlite+aiosqlite / postgresql+asyncpg)."""
+    scheme, sep, rest = url.partition('://')
+    base = scheme.split('+', 1)[0]
+    if base in ('sqlite', 'sqlite3'):
+        return f'sqlite+aiosqlite{sep}{rest}'
+    if base in ('postgres', 'postgresql'):
+        return f'postgresql+asyncpg{sep}{rest}'
+    return url
+
+
+def get_async_engine():
+    global _engine
+    if _engine is None:
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            kwargs = {}
+            if DB_ENGINE not in ("sqlite", "sqlite3"):
+                kwargs = {"pool_size": int(os.getenv("ASYNC_DB_POOL_SIZE", "10")), "max_overflow": int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))}
+            _engine = create_async_engine(async_database_url(), **kwargs)
+            instrument_engine(_engine)
+        except ImportError as e:
+            raise RuntimeError("Async DB layer needs `aiosqlite` (SQLite) or `asyncpg` (PostgreSQL). Install via pip.") from e
+    return _engine
+
+
+async def dispose():
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+
+async def get_uploader_by_key(api_key: str) -> Optional[dict]:
+    async with get_async_engine().connect() as conn:
+        try:
+            res = await conn.execute(text(UPLOADER_BY_KEY_SQL), {'k': api_key})
+            row = res.fetchone()
+            if not row:
+                return None
+            return {'id': row[0], 'name': row[1], 'api_key': row[2], 'church': row[3]}
+        except Exception:
+            return None
+
+
+async def get_user_by_token(token: str) -> Optional[dict]:
+    async with get_async_engine().connect() as conn:
+        res = await conn.execute(text(USER_BY_TOKEN_SQL), {'tok': token})
+        return _user_from_token_row(res.fetchone())
+
+
+async def get_table_versions(table_names: List[str]) -> dict:
+    out = {t: 0 for t in table_names}
+    if not table_names:
+        return out
+    try:
+        async with get_async_engine().connect() as conn:
+            stmt, params = table_versions_query(table_names)
+            res = await conn.execute(stmt, params)
+            for r in res.fetchall():
+                out[r[0]] = int(r[1] or 0)
+    except Exception:
+        pass
+    return out
+
+
+async def bump_table_version(*table_names: str) -> None:
+    """Async twin of `db.bump_table_version`."""
+    try:
+        async with get_async_engine().begin() as conn:
+            for t in table_names:
+                res = await conn.execute(text('UPDATE table_versions SET version = version + 1 WHERE table_name=:t'), {'t': t})
+                if getattr(res, 'rowcount', 0) == 0:
+                    await conn.execute(sql_insert(table_versions).values(table_name=t, version=1))
+    except Exception:
+        # versions are a cache hint only; never fail the write because of them
+        pass
+
+
+async def insert_member(**fields) -> Optional[int]:
+    """Async twin of `db.insert_member`: assigns the next free `sno` when missing or taken."""
+    sno = fields.pop('sno', None)
+    money.row_to_storage('members', fields)
+    async with get_async_engine().begin() as conn:
+        if sno is not None:
+            res = await conn.execute(text('SELECT COUNT(*) FROM members WHERE sno = :s'), {'s': sno})
+            if int(res.scalar() or 0) > 0:
+                sno = None
+        if sno is None:
+            res = await conn.execute(text('SELECT MAX(sno) FROM members'))
+            sno = int(res.scalar() or 0) + 1
+        res = await conn.execute(sql_insert(members).values(sno=sno, **fields))
+        try:
+            pk = res.inserted_primary_key[0]
+        except Exception:
+            pk = None
+    await bump_table_version('members')
+    return pk
+
+
+async def non_null_columns(table_name: str, columns: List[str]) -> List[str]:
+    if not columns:
+        return []
+    async with get_async_engine().connect() as conn:
+        row = (await conn.execute(non_null_columns_sql(table_name, columns))).fetchone()
+    if row is None:
+        return []
+    return [c for c, n in zip(columns, row) if n]
+
+
+async def read_table(table_name: str, columns: Optional[List[str]] = None, drop_null_columns: bool = False) -> pd.DataFrame:
+    """Async twin of `db.read_table` (explicit SELECT list, optional all-NULL column pruning)."""
+    cols = list(columns) if columns else get_target_columns(table_name)
+    if not cols:
+        raise ValueError(f"Table not found: {table_name}")
+    if drop_null_columns:
+        cols = await non_null_columns(table_name, cols)
+        if not cols:
+            return pd.DataFrame()
+    async with get_async_engine().connect() as conn:
+        # pandas needs a sync connection; run_sync hands it one backed by the async driver
+        df = await conn.run_sync(lambda sync_conn: pd.read_sql_table(table_name, con=sync_conn, columns=cols))
+    return money.frame_from_storage(df, table_name)
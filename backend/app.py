@@ -1,15 +1,30 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+import os
+import hashlib
+import time
 import pandas as pd
 from .db import (
     get_target_columns,
-    insert_dataframe,
+    upsert_dataframe,
+    upsert_dataframes,
+    find_upload,
+    record_upload,
     get_sqlite_path,
     engine,
     create_tables,
     insert_member,
-    insert_members_collection,
+    coerce_row,
+    update_rows,
+    read_changes,
+    purge_tombstones,
+    collection_totals,
+    contribution_rollups,
+    member_ledger_entries,
+    pledge_progress,
     get_header_mappings,
     upsert_header_mappings,
     create_uploader,
@@ -17,11 +32,61 @@ from .db import (
     list_uploaders,
     create_user,
     verify_user,
-    create_token_for_user,
+    delete_token,
+    update_user_account,
     get_user_by_token,
+    bump_table_version,
+    get_table_versions,
+    resolve_fields,
+    read_table,
+)
+from .cache import TTLCache
+from . import adb, money
+from .workers import POOLS, PoolBusy, parse_pool, db_pool, shutdown_pools
+from .startup import run_startup_once
+from .writebehind import committer as write_behind, stop_write_behind, write_row, write_row_async
+from .ratelimit import RateLimited, ingest_limiter, ingest_subject
+from .metrics import (
+    add_rows,
+    end_request,
+    ensure_tracing,
+    instrument_engine,
+    log_memory,
+    observe_request,
+    phase,
+    register as register_metric,
+    render_metrics,
+    run_pool_timed,
+    server_timing,
+    start_request,
+    Counter,
+    GaugeSource,
+)
+from .profiler import QUERY_BUDGET, QUERY_PROFILE, profiled, recent_reports as recent_query_reports, report as report_query_profile
+from .ingest import (
+    DEFAULT_CHURCH,
+    UploadTooLarge,
+    estimate_upload_memory,
+    fill_s1,
+    iter_upload_chunks,
+    prepare_upload_frame,
+    prepare_preview,
+)
+from .access_tokens import (
+    is_access_token,
+    issue_access_token,
+    verify_access_token,
+    refresh_revocations,
+    revocations_stale,
+    revoke_access_token,
+    revoke_user_tokens,
+    start_token_purger,
+    stop_token_purger,
 )
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from pydantic import BaseModel, ValidationError
 from decimal import Decimal
@@ -33,19 +98,95 @@ app = FastAPI(title="KSC Migration API")
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# Resolved principals keyed by a hash of the bearer token / API key. Only successful lookups are cached.
+auth_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "30")),
+)
+
+
+# Computed /reports/rollups keyed by (church, period, table versions): a write changes the key
+rollup_cache = TTLCache(
+    maxsize=int(os.getenv("ROLLUP_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("ROLLUP_CACHE_TTL", "300")),
+)
+
+
+def _auth_cache_key(kind: str, secret: str) -> str:
+    return kind + ':' + hashlib.sha256(secret.encode('utf-8')).hexdigest()
+
+
+async def _db_call(sync_fn, async_fn, *args, **kwargs):
+    """Await the async-layer helper when ASYNC_DB is on, otherwise run the sync helper in the threadpool."""
+    if adb.ASYNC_DB:
+        return await async_fn(*args, **kwargs)
+    return await run_in_threadpool(sync_fn, *args, **kwargs)
+
+
+def _cached_user_by_token(token: str) -> Optional[dict]:
+    # signed tokens are verified locally; only legacy opaque tokens need the database (and the cache)
+    if is_access_token(token):
+        return verify_access_token(token)
+    key = _auth_cache_key('token', token)
+    hit = auth_cache.get(key)
+    if hit is not None:
+        return dict(hit)
+    user = get_user_by_token(token)
+    if user:
+        auth_cache.set(key, dict(user))
+    return user
+
+
+async def _resolve_user(token: str) -> Optional[dict]:
+    """Async variant of `_cached_user_by_token` used by the auth dependencies."""
+    if is_access_token(token):
+        if revocations_stale():
+            # the snapshot reload reads the database: keep it off the event loop
+            await run_in_threadpool(refresh_revocations)
+        return verify_access_token(token, refresh=False)
+    key = _auth_cache_key('token', token)
+    hit = auth_cache.get(key)
+    if hit is not None:
+        return dict(hit)
+    user = await _db_call(get_user_by_token, adb.get_user_by_token, token)
+    if user:
+        auth_cache.set(key, dict(user))
+    return user
+
+
+async def _resolve_uploader(api_key: str) -> Optional[dict]:
+    key = _auth_cache_key('api_key', api_key)
+    hit = auth_cache.get(key)
+    if hit is not None:
+        return dict(hit)
+    uploader = await _db_call(get_uploader_by_key, adb.get_uploader_by_key, api_key)
+    if uploader:
+        auth_cache.set(key, dict(uploader))
+    return uploader
+
+
+def invalidate_auth_cache(user_id: Optional[int] = None, uploader_id: Optional[int] = None) -> int:
+    """Drop cached principals for a changed user or uploader so the next request re-reads the database."""
+    def _match(key, value):
+        if user_id is not None and key.startswith('token:') and value.get('id') == user_id:
+            return True
+        if uploader_id is not None and key.startswith('api_key:') and value.get('id') == uploader_id:
+            return True
+        return False
+    return auth_cache.invalidate(_match)
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
     if not credentials:
         raise HTTPException(status_code=401, detail="Missing or invalid authorization token")
     token = credentials.credentials
-    user = get_user_by_token(token)
+    user = await _resolve_user(token)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid token")
     return user
 
 
-def require_api_key_or_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
-    """Allow either an X-API-KEY uploader key or a Bearer user token. Return a dict with keys: api_key, uploader, user."""
+async def _authenticate_api_key_or_user(request: Request, credentials: Optional[HTTPAuthorizationCredentials]) -> dict:
     api_key = None
     uploader = None
     user = None
@@ -55,7 +196,7 @@ def require_api_key_or_user(request: Request, credentials: HTTPAuthorizationCred
         api_key = None
 
     if api_key:
-        uploader = get_uploader_by_key(api_key)
+        uploader = await _resolve_uploader(api_key)
         if not uploader:
             raise HTTPException(status_code=401, detail='Invalid API key')
         return {'api_key': api_key, 'uploader': uploader, 'user': None}
@@ -63,13 +204,54 @@ def require_api_key_or_user(request: Request, credentials: HTTPAuthorizationCred
     # try bearer token
     if credentials and credentials.credentials:
         token = credentials.credentials
-        user = get_user_by_token(token)
+        user = await _resolve_user(token)
         if not user:
             raise HTTPException(status_code=401, detail='Invalid token')
         return {'api_key': None, 'uploader': None, 'user': user}
 
     raise HTTPException(status_code=401, detail='Missing authentication (API key or Bearer token)')
 
+
+# Endpoints that write uploaded batches; callers there are rate limited per uploader/user and church.
+# /upload/headers only previews a sheet and is not charged.
+INGEST_PATHS = {'/upload', '/members_collections/bulk'}
+
+
+async def require_api_key_or_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    """Allow either an X-API-KEY uploader key or a Bearer user token. Return a dict with keys: api_key, uploader, user.
+
+    On ingestion paths the caller also holds an `ingest_limiter` slot until the endpoint finishes.
+    """
+    auth = await _authenticate_api_key_or_user(request, credentials)
+    route = request.scope.get('route')
+    path = getattr(route, 'path', None) or request.url.path
+    if path not in INGEST_PATHS:
+        yield auth
+        return
+    subject, church = ingest_subject(auth)
+    with ingest_limiter.admit(subject, church):
+        yield auth
+
+
+@app.exception_handler(RateLimited)
+def rate_limited_handler(request: Request, exc: RateLimited):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Too many ingestion requests ({exc.reason} limit for {exc.scope}), retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(PoolBusy)
+def pool_busy_handler(request: Request, exc: PoolBusy):
+    """A bounded worker pool is full: ask the client to retry instead of queueing without limit."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy ({exc.pool}), retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 app.add_middleware(
     CORSMiddleware,
     # Allow all origins for local development to avoid CORS issues from different localhost variants
@@ -80,23 +262,83 @@ app.add_middleware(
 )
 
 
-def _read_upload_file(file: UploadFile):
-    name = file.filename or "upload"
+# Count SQL statements / DB time per request (see metrics.py)
+instrument_engine(engine)
+
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """Add a Server-Timing header with per-phase durations and feed the /metrics histograms."""
+    stats, token = start_request()
+    started = time.perf_counter()
+    status = 500
     try:
-        if name.lower().endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(file.file)
-        elif name.lower().endswith('.csv') or file.content_type == 'text/csv':
-            df = pd.read_csv(file.file)
-        else:
-            # try excel first
-            try:
-                df = pd.read_excel(file.file)
-            except Exception:
-                file.file.seek(0)
-                df = pd.read_csv(file.file)
-        return df
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to parse upload: {e}")
+        response = await call_next(request)
+        status = response.status_code
+        response.headers['Server-Timing'] = server_timing(stats, time.perf_counter() - started)
+        return response
+    finally:
+        route = getattr(request.scope.get('route'), 'path', None) or 'unmatched'
+        observe_request(route, request.method, status, time.perf_counter() - started, stats)
+        log_memory(route, request.method, stats)
+        end_request(token)
+
+
+if QUERY_PROFILE:
+    @app.middleware("http")
+    async def query_profile(request: Request, call_next):
+        """Record statement shapes per request and warn when a route goes over its query budget."""
+        started = time.perf_counter()
+        with profiled() as prof:
+            response = await call_next(request)
+        route = getattr(request.scope.get('route'), 'path', None) or 'unmatched'
+        if report_query_profile(route, request.method, prof, time.perf_counter() - started) is not None:
+            response.headers['X-Query-Count'] = str(prof.count)
+        return response
+
+
+def _pool_gauges():
+    for name, pool in POOLS.items():
+        st = pool.stats()
+        yield (name, 'in_flight'), st['in_flight']
+        yield (name, 'completed'), st['completed']
+        yield (name, 'rejected'), st['rejected']
+
+
+def _auth_cache_gauges():
+    for k, v in auth_cache.stats().items():
+        yield (k,), v
+
+
+def _rollup_cache_gauges():
+    for k, v in rollup_cache.stats().items():
+        yield (k,), v
+
+
+def _ingest_gauges():
+    st = ingest_limiter.stats()
+    for k in ('admitted', 'rejected_rate', 'rejected_inflight'):
+        yield (k,), st[k]
+
+
+def _write_behind_gauges():
+    for k, v in write_behind.stats().items():
+        yield (k,), v
+
+
+register_metric(GaugeSource('ksc_worker_pool', 'Worker pool counters (see workers.py).', _pool_gauges, ('pool', 'stat')))
+register_metric(GaugeSource('ksc_auth_cache', 'Auth cache counters.', _auth_cache_gauges, ('stat',)))
+register_metric(GaugeSource('ksc_rollup_cache', 'Contribution rollup cache counters.', _rollup_cache_gauges, ('stat',)))
+register_metric(GaugeSource('ksc_ingest_admission', 'Ingestion admission counters.', _ingest_gauges, ('stat',)))
+register_metric(GaugeSource('ksc_write_behind', 'Write-behind group commit counters (see writebehind.py).', _write_behind_gauges, ('stat',)))
+upload_memory_budget = Counter('ksc_upload_memory_budget_total', 'Uploads estimated over UPLOAD_MEMORY_BUDGET_MB, by outcome.', ('route', 'outcome'))
+register_metric(upload_memory_budget)
+
+
+@app.get('/metrics')
+def metrics():
+    """Prometheus text exposition of request, phase, DB and pool metrics."""
+    return Response(content=render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 def _serializable_value(v):
@@ -142,109 +384,189 @@ def _serializable_value(v):
         return str(v)
 
 
-def _guess_s1_column(df):
-    """Guess which dataframe column holds the serial number (s1/sno).
-    Heuristics: look for header names containing 's1', 'sno', 'serial', 's.no', or 'sno.' (case-insensitive).
-    Fallback: use the first column name.
-    """
-    if df is None or df.shape[1] == 0:
+# Seconds clients may reuse a cached list response without revalidating. 0 means always revalidate via ETag.
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "0"))
+
+
+def _make_etag(tables: List[str], versions: dict, variant) -> str:
+    raw = ';'.join(f"{t}:{versions.get(t, 0)}" for t in tables) + '|' + '|'.join(str(v) for v in variant)
+    return 'W/"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20] + '"'
+
+
+def _etag_for(tables: List[str], *variant) -> str:
+    """Build a weak ETag from the change versions of `tables` plus any request variant (query params)."""
+    return _make_etag(tables, get_table_versions(tables), variant)
+
+
+def _cache_headers(etag: str) -> dict:
+    return {
+        'ETag': etag,
+        'Cache-Control': f'private, max-age={CACHE_MAX_AGE}' if CACHE_MAX_AGE > 0 else 'no-cache',
+    }
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    inm = request.headers.get('if-none-match') if request is not None else None
+    if not inm:
+        return False
+    tags = [t.strip() for t in inm.split(',')]
+    return '*' in tags or etag in tags
+
+
+def _cached_json(request: Request, tables: List[str], build, *variant):
+    """Return 304 when the client's If-None-Match matches the current table versions, else call `build()`."""
+    etag = _etag_for(tables, *variant)
+    headers = _cache_headers(etag)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=jsonable_encoder(build()), headers=headers)
+
+
+async def _cached_json_async(request: Request, tables: List[str], load, shape, *variant):
+    """Async `_cached_json`: `load()` is awaited for the data, `shape(data)` (CPU work) runs in the threadpool."""
+    versions = await _db_call(get_table_versions, adb.get_table_versions, tables)
+    etag = _make_etag(tables, versions, variant)
+    headers = _cache_headers(etag)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    with phase('query'):
+        data = await load()
+    with phase('serialize'):
+        out = await run_in_threadpool(lambda: jsonable_encoder(shape(data)))
+    add_rows(len(out) if isinstance(out, list) else 0)
+    return JSONResponse(content=out, headers=headers)
+
+
+# Estimated parsed-frame size an upload may reach before it is chunked (CSV) or refused (0 = no limit)
+UPLOAD_MEMORY_BUDGET_MB = float(os.getenv("UPLOAD_MEMORY_BUDGET_MB", "0"))
+
+
+async def _check_upload_memory(route: str, data: bytes, batch: UploadFile, chunkable: bool = False):
+    """Return None when the upload fits `UPLOAD_MEMORY_BUDGET_MB`, the estimate when it should be chunked; raise 413 otherwise."""
+    if UPLOAD_MEMORY_BUDGET_MB <= 0:
+        return None
+    budget = int(UPLOAD_MEMORY_BUDGET_MB * 1024 * 1024)
+    try:
+        est = await run_pool_timed(parse_pool, estimate_upload_memory, data, batch.filename, batch.content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse upload: {e}")
+    if est['bytes'] <= budget:
         return None
-    for c in df.columns:
-        lc = str(c).lower()
-        if 's1' in lc or 'sno' in lc or 'serial' in lc or 's.no' in lc or 'sr#' in lc or 's no' in lc:
-            return c
-    # fallback to first column
-    return df.columns[0]
+    if chunkable and est['format'] == 'csv' and est['row_bytes']:
+        upload_memory_budget.inc((route, 'chunked'))
+        return est
+    upload_memory_budget.inc((route, 'refused'))
+    raise HTTPException(status_code=413, detail=str(UploadTooLarge(est['bytes'], budget)) + (
+        "; split the file or upload it as CSV" if est['format'] != 'csv' else "; split the file"))
+
+
+def _caller_church(auth: dict) -> int:
+    """Church for collection rows that name none: the uploader's, else the user's, else DEFAULT_CHURCH."""
+    principal = (auth.get('uploader') or auth.get('user')) if isinstance(auth, dict) else None
+    return (principal or {}).get('church') or DEFAULT_CHURCH
 
 
 @app.post('/upload')
-async def upload(batch: UploadFile = File(...), auth: dict = Depends(require_api_key_or_user), request: Request = None):
-    df = _read_upload_file(batch)
-    if df is None:
-        raise HTTPException(status_code=400, detail="No data parsed from file")
+async def upload(batch: UploadFile = File(...), auth: dict = Depends(require_api_key_or_user), request: Request = None, force: bool = False):
+    """Upsert an Excel/CSV file into `members_collection` on (s1, church).
 
-    target_cols = get_target_columns()
+    Answers `inserted`/`updated`/`skipped` row counts. A file with the same content already ingested
+    for the same church is not parsed again (`duplicate: true`) unless `force=true`.
+    """
+    # Parsing runs on parse_pool (processes) and DB calls on db_pool (threads) so the event loop stays free
+    with phase('read_body'):
+        data = await batch.read()
+    target_cols = await db_pool.run_async(get_target_columns)
     if not target_cols:
         raise HTTPException(status_code=500, detail="members_collection table not found in SQLite. Run migration first.")
 
-    # Case-insensitive column mapping: map df columns to target columns by lowercase matching
-    df_cols_map = {c.lower(): c for c in df.columns}
-    mapped = {}
-    for tc in target_cols:
-        lc = tc.lower()
-        if lc in df_cols_map:
-            mapped[tc] = df[df_cols_map[lc]]
-        else:
-            mapped[tc] = pd.Series([None] * len(df))
-
-    out_df = pd.DataFrame(mapped)
     # If an uploader API key is provided, use uploader's church and source
     uploader = auth.get('uploader') if isinstance(auth, dict) else None
-    # if uploader provided, apply defaults
-    if uploader:
+    church = _caller_church(auth)
+    with phase('hash'):
+        content_hash = await run_in_threadpool(lambda: hashlib.sha256(data).hexdigest())
+    if not force:
+        previous = await db_pool.run_async(find_upload, content_hash, church)
+        if previous:
+            rows = previous['inserted'] + previous['updated'] + previous['skipped']
+            return {"inserted": 0, "updated": 0, "skipped": rows, "duplicate": True, "table": "members_collection",
+                    "first_uploaded_at": previous['created_at'], "first_filename": previous['filename']}
+
+    def _record(counts: dict) -> None:
+        record_upload(content_hash, church, counts, batch.filename, uploader.get('name') if uploader else None)
+
+    over_budget = await _check_upload_memory('/upload', data, batch, chunkable=True)
+    if over_budget:
+        # Parse and insert a CSV too big for the budget chunk by chunk, in one transaction. Half the
+        # budget per chunk leaves room for the mapped copy and the insert buffer.
+        budget = UPLOAD_MEMORY_BUDGET_MB * 1024 * 1024
+        chunk_rows = max(1, int(budget / 2 / over_budget['row_bytes']))
         try:
-            if uploader.get('church'):
-                out_df['church'] = out_df.get('church', pd.Series([uploader.get('church')] * len(out_df)))
-            if uploader.get('name'):
-                out_df['source'] = out_df.get('source', pd.Series([uploader.get('name')] * len(out_df)))
-        except Exception:
-            pass
-    # Filter rows: only keep rows where the guessed S1/serial column has a non-empty value
-    s1_col = _guess_s1_column(out_df)
-    if s1_col is not None:
-        try:
-            mask = out_df[s1_col].notna() & (out_df[s1_col].astype(str).str.strip() != '')
-            out_df = out_df[mask]
-        except Exception:
-            # if anything goes wrong with filtering, fall back to original df
-            pass
+            with phase('insert'):
+                counts = await db_pool.run_async(upsert_dataframes, iter_upload_chunks(data, target_cols, uploader, chunk_rows, church))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Failed to parse upload: {e}")
+        await db_pool.run_async(_record, counts)
+        add_rows(sum(counts.values()))
+        return dict(counts, table="members_collection", chunk_rows=chunk_rows)
+    try:
+        # Case-insensitive column mapping, uploader defaults and S1 row filtering (see ingest.py)
+        with phase('parse'):
+            out_df = await run_pool_timed(parse_pool, prepare_upload_frame, data, batch.filename, batch.content_type, target_cols, uploader, church)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse upload: {e}")
 
-    insert_dataframe(out_df)
-    return {"inserted": len(out_df), "table": "members_collection"}
+    with phase('insert'):
+        counts = await db_pool.run_async(upsert_dataframe, out_df)
+    await db_pool.run_async(_record, counts)
+    add_rows(len(out_df))
+    return dict(counts, table="members_collection")
 
 
 @app.post('/upload/headers')
 async def upload_headers(batch: UploadFile = File(...), auth: dict = Depends(require_api_key_or_user), request: Request = None):
     """Receive an uploaded Excel/CSV and return headers and first 5 rows for preview without inserting."""
-    df = _read_upload_file(batch)
-    if df is None:
-        raise HTTPException(status_code=400, detail="No data parsed from file")
-    headers = list(df.columns)
-    # Provide both the full dataset and a filtered preview (rows with guessed S1 non-empty)
-    s1_col = _guess_s1_column(df)
-    df_filtered = df
-    if s1_col is not None:
-        try:
-            mask = df[s1_col].notna() & (df[s1_col].astype(str).str.strip() != '')
-            df_filtered = df[mask]
-        except Exception:
-            df_filtered = df
-
-    full_preview = df.fillna('').to_dict(orient='records')
-    # Return the filtered dataset (filled) so the client can preview and edit all rows by default
-    preview = df_filtered.fillna('').to_dict(orient='records')
+    with phase('read_body'):
+        data = await batch.read()
+    # the preview returns every row to the client, so an upload over the budget cannot be chunked
+    await _check_upload_memory('/upload/headers', data, batch)
+    try:
+        with phase('parse'):
+            parsed = await run_pool_timed(parse_pool, prepare_preview, data, batch.filename, batch.content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse upload: {e}")
+    headers = parsed["headers"]
+    preview = parsed["preview"]
     # fetch previous mappings for these headers and suggest mapped columns
+    add_rows(len(parsed["full_preview"]))
     try:
-        suggestions = get_header_mappings(headers)
+        with phase('header_mappings'):
+            suggestions = await db_pool.run_async(get_header_mappings, headers)
+    except PoolBusy:
+        raise
     except Exception:
         suggestions = {}
     # If API key present, return uploader info so frontend can preselect church/uploader
     uploader = auth.get('uploader') if isinstance(auth, dict) else None
 
-    return {"headers": headers, "full_preview": full_preview, "preview": preview, "suggestions": suggestions, "s1_column": s1_col, "preview_count": len(preview), "uploader": uploader}
+    return {"headers": headers, "full_preview": parsed["full_preview"], "preview": preview, "suggestions": suggestions, "s1_column": parsed["s1_column"], "preview_count": len(preview), "uploader": uploader}
 
 
 @app.post('/submit/{table_name}')
 async def submit_form(table_name: str, request: Request):
-    """Accept form-encoded or JSON submissions and insert into the named table.
+    """Accept form-encoded or JSON submissions and insert one row into the named table.
 
-    Allowed tables: `collection_codes`, `members_collections`, `members`.
-    The endpoint will create the table if it does not exist and append the submitted row.
+    Allowed tables: `collection_codes`, `members_collection` (alias `members_collections`), `members`.
+    Values are typed for the table's columns (400 on unknown columns or unparsable values).
+    `members_collection` rows are upserted on (s1, church). With WRITE_BEHIND=1 the row is
+    group-committed with other submissions and the response is sent once it is committed.
     """
     # accept both singular and plural table names for backward compatibility
+    aliases = {"members_collections": "members_collection"}
     allowed = {"collection_codes", "members_collection", "members_collections", "members"}
     if table_name not in allowed:
         raise HTTPException(status_code=400, detail=f"Table not allowed: {table_name}")
+    table_name = aliases.get(table_name, table_name)
 
     # Accept JSON or form data
     content_type = request.headers.get("content-type", "")
@@ -259,9 +581,22 @@ async def submit_form(table_name: str, request: Request):
 
     # Normalize: convert single-value lists to values
     row = {k: (v[0] if isinstance(v, (list, tuple)) and len(v) == 1 else v) for k, v in payload.items()}
-    df = pd.DataFrame([row])
-    insert_dataframe(df, table_name=table_name)
-    return {"inserted": 1, "table": table_name}
+    try:
+        row = coerce_row(table_name, row)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # keyed on (s1, church): a resubmitted members_collection row updates the stored one
+    op = 'upsert' if table_name == "members_collection" else 'insert'
+    if op == 'upsert':
+        fill_s1(row)
+    try:
+        with phase('write'):
+            result = await write_row_async(op, table_name, row)
+    except IntegrityError as e:
+        raise HTTPException(status_code=409, detail=f"Row violates a {table_name} constraint: {e.orig}")
+    if op == 'upsert':
+        return dict(result, table=table_name)
+    return {"inserted": 1, "id": result['id'], "table": table_name}
 
 
 class MemberIn(BaseModel):
@@ -291,36 +626,17 @@ class MemberCollectionIn(BaseModel):
 
 
 @app.post('/members')
-def create_member(payload: MemberIn):
+async def create_member(payload: MemberIn):
     """Create a member record and return its id."""
-    pk = insert_member(
-        sno=payload.sno,
-        MEMBER_NAME=payload.MEMBER_NAME,
-        MEMBER_ID=payload.MEMBER_ID,
-        FAMILY_ID=payload.FAMILY_ID,
-        DEFAULT_FAMILY_ID=payload.DEFAULT_FAMILY_ID,
-        OFFICIAL_MEMBER_ID=payload.OFFICIAL_MEMBER_ID,
-        pledge=payload.pledge,
-        GROUP_NAME=payload.GROUP_NAME,
-        GROUP_ALIAS=payload.GROUP_ALIAS,
-        DEFAULT_GROUP_ALIAS=payload.DEFAULT_GROUP_ALIAS,
-        GROUP_LEADER_ID=payload.GROUP_LEADER_ID,
-        DEFAULT_GROUP_LEADER_ID=payload.DEFAULT_GROUP_LEADER_ID,
-        STATUS=payload.STATUS,
-        PHONE=payload.PHONE,
-        PHONE2=payload.PHONE2,
-        EMAIL=payload.EMAIL,
-        RESIDENCE=payload.RESIDENCE,
-        church=payload.church,
-    )
+    pk = await _db_call(insert_member, adb.insert_member, **payload.dict())
     return {"id": pk}
 
 
 @app.post('/members_collection')
 def create_members_collection(payload: MemberCollectionIn):
     """Create a members_collection row. `member_id` may be omitted if you will link later."""
-    pk = insert_members_collection(collection_code=payload.collection_code, member_id=payload.member_id)
-    return {"id": pk}
+    row = {'collection_code': payload.collection_code, 'member_id': payload.member_id}
+    return {"id": write_row('insert', 'members_collection', row)['id']}
 
 @app.put('/members_collection/{row_id}')
 def update_members_collection(row_id: int, payload: dict):
@@ -334,7 +650,7 @@ def update_members_collection(row_id: int, payload: dict):
         if not update_cols:
             raise HTTPException(status_code=400, detail='No updatable columns provided')
         set_parts = ', '.join([f"{c}=:{c}" for c in update_cols.keys()])
-        params = dict(update_cols)
+        params = money.row_to_storage('members_collection', dict(update_cols))
         params['id'] = row_id
         with engine.connect() as conn:
             conn.execute(text(f"UPDATE members_collection SET {set_parts} WHERE id=:id"), params)
@@ -342,6 +658,7 @@ def update_members_collection(row_id: int, payload: dict):
                 conn.commit()
             except Exception:
                 pass
+        bump_table_version('members_collection')
         return {"ok": True}
     except HTTPException:
         raise
@@ -349,9 +666,54 @@ def update_members_collection(row_id: int, payload: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class MembersCollectionPatch(BaseModel):
+    id: int
+    changes: dict
+
+
+@app.patch('/members_collection')
+def patch_members_collection(rows: List[MembersCollectionPatch]):
+    """Update many members_collection rows by id in one transaction.
+
+    Rows with the same set of changed columns are written with one executemany UPDATE.
+    `results` follows the request order, one `{id, status}` per row: `updated`, `not_found`,
+    or `invalid` with an `error` (an unknown column or a value that does not parse). Invalid
+    rows are left out; a database error such as a duplicate (s1, church) rolls back the
+    whole request with 409. When no id exists at all the answer is 404.
+    """
+    if not rows:
+        raise HTTPException(status_code=400, detail='No rows provided')
+    results = [None] * len(rows)
+    updates, positions = [], []
+    for i, r in enumerate(rows):
+        try:
+            if not r.changes:
+                raise ValueError('No updatable columns provided')
+            if 'id' in r.changes:
+                raise ValueError('id cannot be changed')
+            changes = coerce_row('members_collection', r.changes)
+        except ValueError as e:
+            results[i] = {'id': r.id, 'status': 'invalid', 'error': str(e)}
+            continue
+        updates.append((r.id, changes))
+        positions.append(i)
+    if updates:
+        try:
+            with phase('update'):
+                statuses = update_rows('members_collection', updates)
+        except IntegrityError as e:
+            raise HTTPException(status_code=409, detail=f"Rows violate a members_collection constraint: {e.orig}")
+        for i, (pk, _), status in zip(positions, updates, statuses):
+            results[i] = {'id': pk, 'status': status}
+    counts = {k: sum(1 for r in results if r['status'] == k) for k in ('updated', 'not_found', 'invalid')}
+    if counts['not_found'] == len(rows):
+        raise HTTPException(status_code=404, detail=dict(counts, results=results))
+    return dict(counts, results=results)
+
+
 @app.post('/members_collections/bulk')
 def bulk_insert_members_collections(rows: List[dict], auth: dict = Depends(require_api_key_or_user), request: Request = None):
-    """Accept a list of dicts and insert into `members_collection` in bulk."""
+    """Accept a list of dicts and upsert them into `members_collection` on (s1, church)."""
     received_count = len(rows) if rows is not None else 0
     if not rows:
         raise HTTPException(status_code=400, detail={"message": "No rows provided", "received": received_count})
@@ -369,7 +731,7 @@ def bulk_insert_members_collections(rows: List[dict], auth: dict = Depends(requi
             row['church'] = uploader.get('church')
         if church_val is not None and not isinstance(church_val, int):
             try:
-                with engine.connect() as conn:
+                with phase('church_lookup'), engine.connect() as conn:
                     res = conn.execute(text('SELECT id FROM church WHERE name=:n'), {'n': str(church_val)})
                     try:
                         cid = res.scalar()
@@ -381,39 +743,8 @@ def bulk_insert_members_collections(rows: List[dict], auth: dict = Depends(requi
             except Exception:
                 pass
 
-        # compute s1 if missing or placeholder (e.g. 1)
-        try:
-            s1_raw = row.get('s1')
-        except Exception:
-            s1_raw = None
-        if not s1_raw or (isinstance(s1_raw, (int, str)) and str(s1_raw).strip() == '1'):
-            try:
-                s2val = row.get('s2')
-                if isinstance(s2val, str):
-                    s2dt = datetime.fromisoformat(s2val)
-                elif isinstance(s2val, datetime):
-                    s2dt = s2val
-                else:
-                    s2dt = None
-                s3val = row.get('s3')
-                s3int = int(s3val) if s3val is not None and str(s3val).strip() != '' else None
-                church_id = row.get('church') or (uploader.get('church') if uploader else 1)
-                if s2dt and s3int is not None:
-                    ymd = s2dt.strftime('%Y%m%d')
-                    row['s1'] = int(f"{ymd}{int(church_id):03d}{int(s3int):03d}")
-            except Exception:
-                pass
-        # coerce s1 to int for numeric s1 requirement
-        if row.get('s1') is not None and not isinstance(row.get('s1'), int):
-            try:
-                row['s1'] = int(row['s1'])
-            except Exception:
-                try:
-                    import re
-                    digs = re.sub(r'[^0-9]', '', str(row['s1']))
-                    row['s1'] = int(digs) if digs else row['s1']
-                except Exception:
-                    pass
+        # compute s1 (YYYYMMDD + church + s3) if missing or placeholder (e.g. 1) and coerce it to int
+        fill_s1(row, default_church=_caller_church(auth))
         # set source from uploader if not present
         try:
             if uploader and not row.get('source'):
@@ -422,11 +753,13 @@ def bulk_insert_members_collections(rows: List[dict], auth: dict = Depends(requi
             pass
 
         try:
-            validated = MembersCollectionRow(**row)
+            with phase('validate'):
+                validated = MembersCollectionRow(**row)
             valid_rows.append(validated.dict())
         except ValidationError as ve:
             errors.append({"index": i, "errors": ve.errors()})
 
+    add_rows(received_count)
     if errors:
         # echo received count and rows for debugging
         raise HTTPException(status_code=422, detail={"received": received_count, "validation_errors": errors, "rows": rows})
@@ -451,20 +784,23 @@ def bulk_insert_members_collections(rows: List[dict], auth: dict = Depends(requi
 
         df = pd.DataFrame(norm_rows)
         if df.empty:
-            return {"received": received_count, "valid": len(norm_rows), "inserted": 0, "message": "No rows to insert after normalization"}
-        insert_dataframe(df, table_name='members_collection')
-        return {"received": received_count, "valid": len(norm_rows), "inserted": len(df)}
+            return {"received": received_count, "valid": len(norm_rows), "inserted": 0, "updated": 0, "skipped": 0, "message": "No rows to insert after normalization"}
+        with phase('insert'):
+            counts = upsert_dataframe(df)
+        return dict(counts, received=received_count, valid=len(norm_rows))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get('/collection_codes')
-def list_collection_codes():
-    try:
+def list_collection_codes(request: Request):
+    def build():
         df = pd.read_sql_table('collection_codes', con=engine)
         rows = df.to_dict(orient='records')
-        out = [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
-        return out
+        return [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+
+    try:
+        return _cached_json(request, ['collection_codes'], build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -472,6 +808,8 @@ def list_collection_codes():
 class MembersCollectionRow(BaseModel):
     collection_code: Optional[str] = None
     member_id: Optional[int] = None
+    # with s1, the key rows are upserted on
+    church: Optional[int] = None
     # Required: s1,s2,s3,s4. s1 may be computed if missing or placeholder before validation.
     s1: int
     s2: datetime
@@ -583,41 +921,8 @@ def validate_members_collections(rows: List[dict], auth: dict = Depends(require_
                 # leave as-is; validation will catch missing church if required elsewhere
                 pass
 
-        # Compute s1 if missing or placeholder and s2/s3 present
-        try:
-            s1_raw = row.get('s1')
-        except Exception:
-            s1_raw = None
-        if not s1_raw or (isinstance(s1_raw, (int, str)) and str(s1_raw).strip() == '1'):
-            try:
-                s2val = row.get('s2')
-                if isinstance(s2val, str):
-                    s2dt = datetime.fromisoformat(s2val)
-                elif isinstance(s2val, datetime):
-                    s2dt = s2val
-                else:
-                    s2dt = None
-                s3val = row.get('s3')
-                s3int = int(s3val) if s3val is not None and str(s3val).strip() != '' else None
-                church_id = row.get('church') or 1
-                if s2dt and s3int is not None:
-                    ymd = s2dt.strftime('%Y%m%d')
-                    row['s1'] = int(f"{ymd}{int(church_id):03d}{int(s3int):03d}")
-            except Exception:
-                pass
-
-        # coerce s1 to int to satisfy numeric s1 requirement
-        if row.get('s1') is not None and not isinstance(row.get('s1'), int):
-            try:
-                row['s1'] = int(row['s1'])
-            except Exception:
-                try:
-                    # fallback: remove non-digits then parse
-                    import re
-                    digs = re.sub(r'[^0-9]', '', str(row['s1']))
-                    row['s1'] = int(digs) if digs else row['s1']
-                except Exception:
-                    pass
+        # Compute s1 if missing or placeholder and s2/s3 present, and coerce it to int
+        fill_s1(row)
 
         try:
             MembersCollectionRow(**row)
@@ -641,6 +946,7 @@ def create_collection_code(payload: CollectionCodeIn):
                 conn.commit()
             except Exception:
                 pass
+        bump_table_version('collection_codes')
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -672,10 +978,9 @@ def create_uploader_endpoint(payload: UploaderIn, current_user: dict = Depends(g
 
 
 @app.get('/uploaders')
-def list_uploaders_endpoint():
+def list_uploaders_endpoint(request: Request):
     try:
-        out = list_uploaders()
-        return out
+        return _cached_json(request, ['uploaders'], list_uploaders)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -715,13 +1020,13 @@ def register_user(payload: UserRegister, credentials: HTTPAuthorizationCredentia
             # require bearer token of an admin user to create non-uploader roles
             if not credentials or not credentials.credentials:
                 raise HTTPException(status_code=403, detail='Only admins can create users with elevated roles')
-            creator = get_user_by_token(credentials.credentials)
+            creator = _cached_user_by_token(credentials.credentials)
             if not creator or creator.get('role') != 'admin':
                 raise HTTPException(status_code=403, detail='Only admins can create users with elevated roles')
 
         out = create_user(payload.username, payload.password, payload.church, role=role)
         return out
-    except HTTPException:
+    except (HTTPException, PoolBusy):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -732,10 +1037,25 @@ def login_user(payload: UserIn):
     u = verify_user(payload.username, payload.password)
     if not u:
         raise HTTPException(status_code=401, detail='Invalid username or password')
-    token = create_token_for_user(u['id'])
+    token = issue_access_token(u)
     return {"token": token, "user": u}
 
 
+@app.post('/users/logout')
+def logout_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    """Revoke the presented signed token before it expires."""
+    if not credentials or not credentials.credentials:
+        raise HTTPException(status_code=401, detail="Missing or invalid authorization token")
+    token = credentials.credentials
+    if is_access_token(token):
+        if not revoke_access_token(token):
+            raise HTTPException(status_code=401, detail='Invalid token')
+    else:
+        delete_token(token)
+        auth_cache.pop(_auth_cache_key('token', token))
+    return {'ok': True}
+
+
 @app.get('/users')
 def list_users(current_user: dict = Depends(get_current_user)):
     # only admins may list users
@@ -744,7 +1064,7 @@ def list_users(current_user: dict = Depends(get_current_user)):
     try:
         with engine.connect() as conn:
             res = conn.execute(text('SELECT id, username, church, role, created_at FROM users'))
-            rows = [dict(r) for r in res.fetchall()]
+            rows = [dict(r._mapping) for r in res.fetchall()]
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -757,31 +1077,49 @@ def update_user(user_id: int, payload: UserRegister, current_user: dict = Depend
         raise HTTPException(status_code=403, detail='Not authorized')
     try:
         # update username, church, role, and optionally password
-        with engine.connect() as conn:
-            if payload.password:
-                # create new salt/hash
-                salt = os.urandom(16)
-                ph = _hash_password(payload.password, salt)
-                salt_hex = binascii.hexlify(salt).decode('ascii')
-                conn.execute(text('UPDATE users SET username=:u, password_hash=:ph, salt=:s, church=:c, role=:r WHERE id=:id'),
-                             {'u': payload.username, 'ph': ph, 's': salt_hex, 'c': payload.church, 'r': (payload.role or 'uploader'), 'id': user_id})
-            else:
-                conn.execute(text('UPDATE users SET username=:u, church=:c, role=:r WHERE id=:id'),
-                             {'u': payload.username, 'c': payload.church, 'r': (payload.role or 'uploader'), 'id': user_id})
-            try:
-                conn.commit()
-            except Exception:
-                pass
+        update_user_account(user_id, payload.username, payload.church, payload.role or 'uploader', password=payload.password)
+        # role/church/password may have changed: cached principals and issued tokens for this user are stale
+        invalidate_auth_cache(user_id=user_id)
+        revoke_user_tokens(user_id)
         return {'ok': True}
+    except PoolBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get('/auth/cache_stats')
+def auth_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit/miss counters of the in-process auth cache (admins only)."""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail='Not authorized')
+    return auth_cache.stats()
+
+
+@app.get('/ingest/limits')
+def ingest_limit_stats(current_user: dict = Depends(get_current_user)):
+    """Admission counters and current in-flight ingestions per uploader/church (admins only)."""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail='Not authorized')
+    return ingest_limiter.stats()
+
+
+@app.get('/debug/query_profile')
+def query_profile_reports(current_user: dict = Depends(get_current_user)):
+    """Recent requests that went over their query budget or repeated a statement (admins only, needs QUERY_PROFILE=1)."""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail='Not authorized')
+    return {"enabled": QUERY_PROFILE, "budget": QUERY_BUDGET, "reports": recent_query_reports()}
+
+
 @app.get('/churches')
-def list_churches():
-    try:
+def list_churches(request: Request):
+    def build():
         df = pd.read_sql_table('church', con=engine)
         return df.to_dict(orient='records')
+
+    try:
+        return _cached_json(request, ['church'], build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -795,32 +1133,80 @@ def update_collection_code(code_id: int, payload: CollectionCodeIn):
                 conn.commit()
             except Exception:
                 pass
+        bump_table_version('collection_codes')
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get('/members')
-def list_members(q: Optional[str] = None):
+async def list_members(request: Request, q: Optional[str] = None, fields: Optional[str] = None, drop_empty: bool = False,
+                       since: Optional[str] = None):
+    """List members. `fields` is a comma-separated column list; `drop_empty` omits columns that are NULL everywhere.
+
+    With `since` (a cursor from an earlier answer, or 0 for everything) the answer is
+    `{cursor, reset, changed, deleted}` instead: the rows changed since the cursor and the ids
+    deleted since then. Apply `deleted` before `changed`; `reset` means replace the local copy.
+    """
     try:
-        df = pd.read_sql_table('members', con=engine)
+        cols = resolve_fields(fields, 'members')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if since is not None:
+        if q or drop_empty:
+            raise HTTPException(status_code=400, detail='since cannot be combined with q or drop_empty')
+        return await _members_changes(since, cols)
+
+    # the search needs MEMBER_NAME / MEMBER_ID even when they were not requested
+    query_cols = cols
+    if cols is not None and q:
+        query_cols = cols + [c for c in ('MEMBER_NAME', 'MEMBER_ID') if c not in cols]
+
+    async def load():
+        return await _db_call(read_table, adb.read_table, 'members', query_cols, drop_null_columns=drop_empty)
+
+    def shape(df):
         if q:
             # Search MEMBER_NAME text or exact MEMBER_ID when numeric
             try:
                 qnum = int(q)
             except Exception:
                 qnum = None
-            mask = df['MEMBER_NAME'].astype(str).str.contains(q, case=False, na=False)
-            if qnum is not None:
+            mask = pd.Series(False, index=df.index)
+            if 'MEMBER_NAME' in df.columns:
+                mask = df['MEMBER_NAME'].astype(str).str.contains(q, case=False, na=False)
+            if qnum is not None and 'MEMBER_ID' in df.columns:
                 mask = mask | (df['MEMBER_ID'] == qnum)
             df = df[mask]
+        if cols is not None:
+            df = df[[c for c in cols if c in df.columns]]
+        if drop_empty:
+            df = df.dropna(axis=1, how='all')
         rows = df.to_dict(orient='records')
-        out = [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
-        return out
+        return [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+
+    try:
+        return await _cached_json_async(request, ['members'], load, shape, q or '', ','.join(cols or []), drop_empty)
+    except PoolBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _members_changes(since: str, cols: Optional[List[str]]):
+    try:
+        with phase('query'):
+            changes = await db_pool.run_async(read_changes, 'members', since, cols)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with phase('serialize'):
+        rows = changes['changed'].to_dict(orient='records')
+        changed = [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+    add_rows(len(changed) + len(changes['deleted']))
+    return {'cursor': changes['cursor'], 'reset': changes['reset'], 'changed': changed, 'deleted': changes['deleted']}
+
+
 @app.put('/members/{member_id}')
 def update_member(member_id: int, payload: MemberIn):
     try:
@@ -858,7 +1244,7 @@ def update_member(member_id: int, payload: MemberIn):
                     "fid": payload.FAMILY_ID,
                     "dfid": payload.DEFAULT_FAMILY_ID,
                     "omid": payload.OFFICIAL_MEMBER_ID,
-                    "pledge": payload.pledge,
+                    "pledge": money.amount_to_storage(payload.pledge),
                     "gname": payload.GROUP_NAME,
                     "galias": payload.GROUP_ALIAS,
                     "dgalias": payload.DEFAULT_GROUP_ALIAS,
@@ -877,45 +1263,177 @@ def update_member(member_id: int, payload: MemberIn):
                 conn.commit()
             except Exception:
                 pass
+        bump_table_version('members')
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get('/members/{member_id}/ledger')
+def member_ledger(request: Request, member_id: int, limit: int = 100, offset: int = 0):
+    """A member's contributions in date order with the running balance, from `member_ledger`."""
+    limit = max(1, min(limit, 1000))
+
+    def build():
+        with phase('query'):
+            progress = pledge_progress(member_id=member_id)
+            if not progress:
+                raise HTTPException(status_code=404, detail="Member not found")
+            entries = member_ledger_entries(member_id, limit, max(0, offset))
+        add_rows(len(entries))
+        return {
+            **{k: _serializable_value(v) for k, v in progress[0].items()},
+            'entries': [{k: _serializable_value(v) for k, v in e.items()} for e in entries],
+        }
+
+    return _cached_json(request, ['members', 'members_collection'], build, member_id, limit, offset)
+
+
+@app.get('/members/{member_id}/pledge_progress')
+def member_pledge_progress(request: Request, member_id: int):
+    """Pledge, amount given, remainder and percentage for one member, from `member_balances`."""
+    def build():
+        with phase('query'):
+            rows = pledge_progress(member_id=member_id)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Member not found")
+        return {k: _serializable_value(v) for k, v in rows[0].items()}
+
+    return _cached_json(request, ['members', 'members_collection'], build, member_id)
+
+
+@app.get('/reports/pledge_progress')
+def report_pledge_progress(request: Request, church: Optional[int] = None, group: Optional[str] = None):
+    """Pledge progress for every member of a church and/or GROUP_NAME in one query."""
+    def build():
+        with phase('query'):
+            rows = pledge_progress(church=church, group=group)
+        add_rows(len(rows))
+        return [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+
+    return _cached_json(request, ['members', 'members_collection'], build, church or '', group or '')
+
+
 @app.get('/reports/members_collections')
-def report_members_collections(start_date: Optional[str] = None, end_date: Optional[str] = None):
-    """Return members_collection rows, optionally filtered by s2 (date) range. Dates in ISO format."""
+async def report_members_collections(start_date: Optional[str] = None, end_date: Optional[str] = None, fields: Optional[str] = None, drop_empty: bool = False):
+    """Return members_collection rows, optionally filtered by s2 (date) range. Dates in ISO format.
+
+    `fields` (comma-separated) limits the columns selected from the database; `drop_empty`
+    leaves out columns that are NULL in every returned row (most of c1..c20 / l1..l41).
+    """
     try:
-        # Read full table into pandas then filter by s2 in Python to avoid SQL param dialect issues
-        df = pd.read_sql_table('members_collection', con=engine)
-        # Parse provided dates defensively. Accept either full ISO datetimes or simple YYYY-MM-DD.
         try:
-            start_dt = pd.to_datetime(start_date, errors='coerce') if start_date else None
-            end_dt = pd.to_datetime(end_date, errors='coerce') if end_date else None
-            # If user provided a date-only string like YYYY-MM-DD, extend end_dt to end of that day
-            if end_date and end_dt is not pd.NaT and len(str(end_date)) == 10:
-                end_dt = end_dt + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
-            # Apply filter if s2 column exists and at least one bound is provided
-            if 's2' in df.columns and (start_dt is not None or end_dt is not None):
-                df['s2'] = pd.to_datetime(df['s2'], errors='coerce')
-                mask = pd.Series([True] * len(df))
-                if start_dt is not None and start_dt is not pd.NaT:
-                    mask = mask & (df['s2'] >= start_dt)
-                if end_dt is not None and end_dt is not pd.NaT:
-                    mask = mask & (df['s2'] <= end_dt)
-                df = df[mask.fillna(False)]
-        except Exception as e:
-            # Return a helpful error for invalid date input rather than failing silently
-            raise HTTPException(status_code=400, detail=f"Invalid date filter: {e}")
-        rows = df.to_dict(orient='records')
-        out = [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+            cols = resolve_fields(fields, 'members_collection')
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        filtering = bool(start_date or end_date)
+        query_cols = cols
+        if cols is not None and filtering and 's2' not in cols:
+            query_cols = cols + ['s2']
+        # Read only the selected columns, then filter by s2 in Python to avoid SQL param dialect issues
+        with phase('query'):
+            df = await _db_call(read_table, adb.read_table, 'members_collection', query_cols, drop_null_columns=drop_empty)
+        with phase('shape'):
+            out = await run_in_threadpool(_shape_members_collection_report, df, start_date, end_date, cols, drop_empty)
+        add_rows(len(out))
         return out
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.on_event("startup")
-def on_startup():
+def _report_period(start_date: Optional[str], end_date: Optional[str]):
+    """ISO `start_date`/`end_date` as datetimes; a date-only `end_date` includes that whole day."""
+    try:
+        start = pd.Timestamp(start_date).to_pydatetime() if start_date else None
+        end = pd.Timestamp(end_date) if end_date else None
+        if end is not None and len(end_date) == 10:
+            end = end + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        end = end.to_pydatetime() if end is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date filter: {e}")
+    return start, end
+
+
+@app.get('/reports/collection_totals')
+def report_collection_totals(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                             church: Optional[int] = None):
+    """Total and row count per collection code over members_collection, filtered by s2 range and church.
+
+    Dates are ISO; a date-only `end_date` includes that whole day. Codes without amounts are left out.
+    """
+    start, end = _report_period(start_date, end_date)
+
+    def build():
+        with phase('query'):
+            rows = collection_totals(start, end, church)
+        add_rows(len(rows))
+        return [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+
+    return _cached_json(request, ['members_collection', 'collection_codes'], build, start_date or '', end_date or '', church or '')
+
+
+@app.get('/reports/rollups')
+def report_rollups(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                   church: Optional[int] = None):
+    """Contribution totals by GROUP_NAME, then GROUP_LEADER_ID, then FAMILY_ID, over an s2 range.
+
+    Computed in SQL from `member_ledger` and cached per (church, period) until members or
+    members_collection change.
+    """
+    start, end = _report_period(start_date, end_date)
+    tables = ['members', 'members_collection']
+
+    def build():
+        versions = get_table_versions(tables)
+        key = (church, start, end, tuple(versions.get(t) for t in tables))
+        out = rollup_cache.get(key)
+        if out is None:
+            with phase('query'):
+                out = jsonable_encoder(contribution_rollups(start, end, church))
+            rollup_cache.set(key, out)
+        add_rows(len(out['groups']))
+        return out
+
+    return _cached_json(request, tables, build, start_date or '', end_date or '', church or '')
+
+
+def _shape_members_collection_report(df, start_date, end_date, cols, drop_empty):
+    """Date filtering, projection and JSON conversion for the report (CPU work, runs in the threadpool)."""
+    filtering = bool(start_date or end_date)
+    if filtering and 's2' not in df.columns:
+        # s2 is NULL everywhere (and was pruned), so no row can match a date filter
+        df = df.iloc[0:0]
+    # Parse provided dates defensively. Accept either full ISO datetimes or simple YYYY-MM-DD.
+    try:
+        start_dt = pd.to_datetime(start_date, errors='coerce') if start_date else None
+        end_dt = pd.to_datetime(end_date, errors='coerce') if end_date else None
+        # If user provided a date-only string like YYYY-MM-DD, extend end_dt to end of that day
+        if end_date and end_dt is not pd.NaT and len(str(end_date)) == 10:
+            end_dt = end_dt + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        # Apply filter if s2 column exists and at least one bound is provided
+        if 's2' in df.columns and (start_dt is not None or end_dt is not None):
+            df['s2'] = pd.to_datetime(df['s2'], errors='coerce')
+            mask = pd.Series([True] * len(df))
+            if start_dt is not None and start_dt is not pd.NaT:
+                mask = mask & (df['s2'] >= start_dt)
+            if end_dt is not None and end_dt is not pd.NaT:
+                mask = mask & (df['s2'] <= end_dt)
+            df = df[mask.fillna(False)]
+    except Exception as e:
+        # Return a helpful error for invalid date input rather than failing silently
+        raise HTTPException(status_code=400, detail=f"Invalid date filter: {e}")
+    if cols is not None:
+        df = df[[c for c in cols if c in df.columns]]
+    if drop_empty:
+        df = df.dropna(axis=1, how='all')
+    rows = df.to_dict(orient='records')
+    return [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+
+
+def _initialize_database():
+    """Schema, seed and first-run member import; run by one worker via `run_startup_once`."""
     try:
         create_tables()
     except Exception:
@@ -945,8 +1463,45 @@ def on_startup():
         pass
 
 
+@app.on_event("startup")
+def on_startup():
+    # With several uvicorn workers only one does the schema/seed work; the rest wait for it
+    try:
+        run_startup_once(_initialize_database)
+    except Exception:
+        pass
+
+    # on every start, not only when `run_startup_once` initializes
+    try:
+        purge_tombstones()
+    except Exception:
+        pass
+
+    # Remove expired rows from `tokens` / `revoked_tokens` in the background
+    start_token_purger()
+
+    # MEMORY_PROFILE=1: trace allocations so phases report peak/retained bytes
+    ensure_tracing()
+
+    # Warm the column cache so `fields=` validation never reflects the schema on the event loop
+    for t in ('members', 'members_collection'):
+        try:
+            get_target_columns(t)
+        except Exception:
+            pass
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    stop_token_purger()
+    # commit submissions still waiting in the write-behind buffer before the pools go away
+    stop_write_behind()
+    shutdown_pools()
+    await adb.dispose()
+
+
 @app.get('/members_view')
-def get_members_view():
+def get_members_view(request: Request):
     """Return rows from `members_view`. If the view doesn't exist, attempt to create it
     from the `members` table (if present).
     """
@@ -967,11 +1522,13 @@ def get_members_view():
         else:
             raise HTTPException(status_code=404, detail="members_view not found and `members` table does not exist")
 
-    # Read the view and return JSON rows
-    try:
-        df = pd.read_sql_table('members_view', con=engine)
+    # Read the view and return JSON rows; the view is derived from `members`, so it shares its version
+    def build():
+        df = money.frame_from_storage(pd.read_sql_table('members_view', con=engine), 'members_view')
         rows = df.to_dict(orient='records')
-        out = [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
-        return out
+        return [{k: _serializable_value(v) for k, v in r.items()} for r in rows]
+
+    try:
+        return _cached_json(request, ['members'], build, 'members_view')
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read members_view: {e}")
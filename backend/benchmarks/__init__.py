@@ -0,0 +1 @@
+"""Benchmarks for the KSC backend. Run modules with `python -m backend.benchmarks.<name> --help`."""
@@ -0,0 +1,140 @@
+"""Helpers shared by the benchmark scripts: latency summaries, peak RSS and baseline comparison."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(latencies: List[float], elapsed: float, rows: int = 0, errors: int = 0) -> dict:
+    """Throughput and latency percentiles (ms) for a list of per-request durations in seconds."""
+    n = len(latencies)
+    out = {
+        'requests': n,
+        'errors': errors,
+        'error_rate': round(errors / n, 4) if n else 0.0,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(n / elapsed, 2) if elapsed else None,
+        'p50_ms': None,
+        'p95_ms': None,
+        'p99_ms': None,
+        'mean_ms': None,
+    }
+    if n:
+        out.update({
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'mean_ms': round(sum(latencies) / n * 1000, 2),
+        })
+    if rows:
+        out['rows'] = rows
+        out['rows_per_second'] = round(rows / elapsed, 1) if elapsed else None
+    return out
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """High-water resident set size of this process and of its reaped children (e.g. parse workers)."""
+    try:
+        import resource
+    except ImportError:
+        # Windows: no resource module
+        return {'self': None, 'children': None}
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def use_temp_database(prefix: str = 'ksc-bench-') -> str:
+    """Point db.py at a throwaway SQLite file. Must run before `backend.db` is imported."""
+    if 'backend.db' in sys.modules:
+        raise RuntimeError('backend.db was imported before the benchmark database was configured')
+    path = os.path.join(tempfile.mkdtemp(prefix=prefix), 'bench.db')
+    os.environ['DB_ENGINE'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = path
+    os.environ.pop('DATABASE_URL', None)
+    return path
+
+
+def run_metadata(**extra) -> dict:
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+    try:
+        meta['git_rev'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                         capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        meta['git_rev'] = None
+    meta.update(extra)
+    return meta
+
+
+def write_json(path: Optional[str], data: dict) -> None:
+    text = json.dumps(data, indent=2, default=str)
+    if path:
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+def load_json(path: str) -> dict:
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+# metric -> True when larger is better
+COMPARED_METRICS = {'throughput_rps': True, 'rows_per_second': True, 'p50_ms': False, 'p95_ms': False, 'ns_per_call': False}
+
+
+def compare(baseline: Dict[str, dict], current: Dict[str, dict], threshold: float) -> List[dict]:
+    """Compare per-scenario results; a row regresses when a metric is worse by more than `threshold` (0.2 = 20%)."""
+    rows = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            b, c = base.get(metric), cur.get(metric)
+            if not b or c is None:
+                continue
+            change = (c - b) / b
+            worse = -change if higher_is_better else change
+            rows.append({
+                'scenario': name,
+                'metric': metric,
+                'baseline': b,
+                'current': c,
+                'change_pct': round(change * 100, 1),
+                'regressed': worse > threshold,
+            })
+    return rows
+
+
+def print_comparison(rows: List[dict]) -> bool:
+    """Print a comparison table; return True if anything regressed."""
+    regressed = False
+    for r in rows:
+        flag = 'REGRESSED' if r['regressed'] else 'ok'
+        regressed = regressed or r['regressed']
+        print(f"{r['scenario']:<32} {r['metric']:<16} {r['baseline']:>12} -> {r['current']:>12} ({r['change_pct']:+.1f}%) {flag}")
+    return regressed
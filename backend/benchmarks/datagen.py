@@ -0,0 +1,236 @@
+"""Synthetic KSC-shaped datasets for benchmarks.
+
+Generates three kinds of files, shaped like the real ones:
+  - Members.xlsx: member register, with the fill rates of the real file.
+  - MATOLEO: weekly offering sheet, with the same headers and sparsity as `MATOLEO (1).xlsx`.
+  - members_collection: upload-ready rows using the column names and `collection_codes` labels
+    seeded by db.py. The fill rates of s/c/l columns follow the production table; most of
+    c1..c20 and l1..l41 are empty.
+
+Usage:
+  python -m backend.benchmarks.datagen --size 100k --out /tmp/ksc-data
+
+Sizes are 1k, 100k and 1m (or any integer). Files up to 10k rows are written as .xlsx, larger
+ones as .csv, because openpyxl is too slow and Excel caps a sheet at 1,048,576 rows.
+Output is deterministic for a given --seed.
+"""
+import argparse
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..db import default_collection_codes
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+XLSX_MAX_ROWS = 10_000
+CHURCHES = 4
+
+FIRST_NAMES = ['ABIGAIL', 'ADAM', 'ANDRONICO', 'BARAKA', 'CHADRACK', 'DAUDI', 'ELIZABETH', 'EMMANUEL', 'ESTHER',
+               'FURAHA', 'GRACE', 'HAPPYNESS', 'ISAYA', 'JOHN', 'JOYCE', 'KELVIN', 'LEAH', 'MASUDI', 'NEEMA',
+               'PENDO', 'REHEMA', 'SAMWEL', 'TUMAINI', 'UPENDO', 'YOHANA', 'ZAWADI']
+LAST_NAMES = ['PIUS', 'DANIEL', 'ONYANGO', 'NSYANGI', 'SABIBI', 'MABUBA', 'YANGO', 'MWAKALINGA', 'KIMARO',
+              'MSHANA', 'NYERERE', 'MOSHI', 'MASSAWE', 'LYIMO', 'TEMBA', 'MWANGI', 'OCHIENG', 'KAPINGA']
+
+# share of non-empty cells per column, measured on the production files/table
+MEMBER_FILL = {
+    'MEMBER_ID': 0.34, 'FAMILY_ID': 0.18, 'DEFAULT_FAMILY_ID': 0.24, 'OFFICIAL_MEMBER_ID': 0.04, 'PLEDGE': 0.03,
+    'GROUP_NAME': 0.03, 'GROUP_ALIAS': 0.03, 'DEFAULT_GROUP_ALIAS': 0.03, 'GROUP_LEADER_ID': 0.03,
+    'DEFAULT_GROUP_LEADER_ID': 0.03, 'STATUS': 0.28, 'PHONE': 0.02, 'PHONE2': 0.005, 'EMAIL': 0.005, 'RESIDENCE': 0.005,
+}
+MATOLEO_FILL = {
+    'ZAKA': 0.50, 'SADAKA': 0.72, 'M/KANISA': 0.06, 'SHUKRANI': 0.07, 'S/KAMBI': 0.02, 'MAHUBIRI': 0.01,
+    'M/MEZA': 0.01, 'KWAYA': 0.02, 'MAJENGO': 0.04, 'MENGINEYO': 0.01,
+}
+COLLECTION_FILL = {
+    's6': 0.736, 's7': 0.998, 's12': 0.041, 's13': 0.068, 'c1': 0.51, 'c5': 0.009,
+    'l2': 0.032, 'l17': 0.005, 'l24': 0.005, 'l33': 0.009,
+}
+# any other c/l column appears this rarely (kept so wide-but-sparse columns exist at all)
+RARE_FILL = 0.002
+RARE_COLUMNS = ['c2', 'c3', 'c8', 'l1', 'l4', 'l6', 'l20', 'l31']
+
+
+def parse_size(size) -> int:
+    if isinstance(size, int):
+        return size
+    return SIZES.get(str(size).lower()) or int(str(size).replace('_', ''))
+
+
+def _rng(seed: int) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+def _names(rng, n: int) -> np.ndarray:
+    first = rng.choice(FIRST_NAMES, n)
+    middle = rng.choice(FIRST_NAMES, n)
+    last = rng.choice(LAST_NAMES, n)
+    return np.char.add(np.char.add(np.char.add(np.char.add(first, ' '), middle), ' '), last)
+
+
+def _amounts(rng, n: int, fill: float, scale: float = 10_000) -> np.ndarray:
+    """Offering amounts rounded to 500 TZS; NaN where the cell is empty."""
+    values = np.round(rng.lognormal(np.log(scale), 1.0, n) / 500) * 500
+    values = np.maximum(values, 500)
+    values[rng.random(n) >= fill] = np.nan
+    return values
+
+
+def _sparse_ints(rng, n: int, fill: float, high: int) -> pd.Series:
+    values = pd.Series(rng.integers(1, high, n), dtype='Int64')
+    values[rng.random(n) >= fill] = pd.NA
+    return values
+
+
+def members_frame(n: int, seed: int = 1) -> pd.DataFrame:
+    """Rows shaped like Members.xlsx (note the `Sno` / `CHURCH` / `PLEDGE` headers of the real file)."""
+    rng = _rng(seed)
+    df = pd.DataFrame({
+        'Sno': np.arange(1, n + 1),
+        'MEMBER_NAME': _names(rng, n),
+        'CHURCH': rng.integers(1, CHURCHES + 1, n),
+    })
+    df['MEMBER_ID'] = _sparse_ints(rng, n, MEMBER_FILL['MEMBER_ID'], max(n, 2))
+    df['FAMILY_ID'] = _sparse_ints(rng, n, MEMBER_FILL['FAMILY_ID'], max(n // 3, 2))
+    df['DEFAULT_FAMILY_ID'] = _sparse_ints(rng, n, MEMBER_FILL['DEFAULT_FAMILY_ID'], max(n // 3, 2))
+    df['OFFICIAL_MEMBER_ID'] = _sparse_ints(rng, n, MEMBER_FILL['OFFICIAL_MEMBER_ID'], max(n, 2))
+    df['PLEDGE'] = _amounts(rng, n, MEMBER_FILL['PLEDGE'], scale=200_000)
+    groups = np.array([f'KIKUNDI {i}' for i in range(1, 41)])
+    has_group = rng.random(n) < MEMBER_FILL['GROUP_NAME']
+    group = np.where(has_group, rng.choice(groups, n), None)
+    df['GROUP_NAME'] = group
+    df['GROUP_ALIAS'] = group
+    df['DEFAULT_GROUP_ALIAS'] = group
+    leaders = pd.Series(rng.integers(1, max(n, 2), n), dtype='Int64').where(has_group)
+    df['GROUP_LEADER_ID'] = leaders
+    df['DEFAULT_GROUP_LEADER_ID'] = leaders
+    df['STATUS'] = np.where(rng.random(n) < MEMBER_FILL['STATUS'], rng.choice(['OLD', 'NEW'], n, p=[0.8, 0.2]), None)
+    phones = np.char.add('07', rng.integers(10_000_000, 99_999_999, n).astype(str))
+    df['PHONE'] = np.where(rng.random(n) < MEMBER_FILL['PHONE'], phones, None)
+    df['PHONE2'] = np.where(rng.random(n) < MEMBER_FILL['PHONE2'], phones, None)
+    df['EMAIL'] = np.where(rng.random(n) < MEMBER_FILL['EMAIL'], 'member@example.org', None)
+    df['RESIDENCE'] = np.where(rng.random(n) < MEMBER_FILL['RESIDENCE'], 'DAR ES SALAAM', None)
+    return df
+
+
+def matoleo_frame(n: int, seed: int = 2) -> pd.DataFrame:
+    """Rows shaped like the weekly MATOLEO sheet (headers exactly as in the real file, incl. 'S/N ')."""
+    rng = _rng(seed)
+    df = pd.DataFrame({'S/N ': np.arange(1, n + 1, dtype=float), 'JINA': _names(rng, n)})
+    for col, fill in MATOLEO_FILL.items():
+        df[col] = _amounts(rng, n, fill, scale=30_000 if col == 'ZAKA' else 3_000)
+    df['JUMLA'] = df[list(MATOLEO_FILL)].sum(axis=1, min_count=1)
+    df['DETAILS'] = np.where(rng.random(n) < 0.05, 'M-PESA', None)
+    # a few trailing rows without a serial, as when treasurers add totals at the bottom
+    blank = rng.random(n) < 0.08
+    df.loc[blank, 'S/N '] = np.nan
+    return df
+
+
+def collection_code_labels() -> Dict[str, str]:
+    """Column name -> label, from the default `collection_codes` seed."""
+    return dict(default_collection_codes())
+
+
+def members_collection_frame(n: int, seed: int = 3, per_service: int = 300) -> pd.DataFrame:
+    """Upload-ready `members_collection` rows with realistic s1/s2/s3 and sparse c/l amounts.
+
+    Only columns that carry data are emitted; `/upload` fills the remaining target columns with NULL.
+    """
+    rng = _rng(seed)
+    # churches take turns in blocks of `per_service` rows, so (s2, church, s3) and therefore s1 are unique
+    church = (np.arange(n) // per_service) % CHURCHES + 1
+    # one service (Saturday) per `per_service * CHURCHES` rows, going back in time from 2024-12-28
+    week = np.arange(n) // (per_service * CHURCHES)
+    last_sabbath = date(2024, 12, 28)
+    s2 = pd.to_datetime([last_sabbath - timedelta(weeks=int(w)) for w in range(int(week.max()) + 1 if n else 0)])
+    dates = s2[week] if n else pd.to_datetime([])
+    s3 = (np.arange(n) % per_service) + 1
+    ymd = dates.strftime('%Y%m%d').astype(np.int64) if n else np.array([], dtype=np.int64)
+    s1 = ymd * 1_000_000 + church * 1000 + s3
+    df = pd.DataFrame({
+        'collection_code': 'import',
+        's1': s1,
+        's2': dates,
+        's3': s3,
+        's4': _names(rng, n),
+    })
+    for col, fill in COLLECTION_FILL.items():
+        if col in ('s12',):
+            df[col] = np.where(rng.random(n) < fill, 'M-PESA', None)
+        else:
+            df[col] = _amounts(rng, n, fill, scale=30_000 if col == 'c1' else 5_000)
+    for col in RARE_COLUMNS:
+        df[col] = _amounts(rng, n, RARE_FILL)
+    money = [c for c in df.columns if c[0] in 'cl' and c[1:].isdigit()] + ['s6']
+    # nearly every receipt has at least one amount
+    empty = df[money].isna().all(axis=1) & (rng.random(n) < 0.98)
+    df.loc[empty, 's6'] = _amounts(rng, int(empty.sum()), 1.0, scale=2_000)
+    df['s7'] = df[money].sum(axis=1, min_count=1)
+    df['source'] = 'bench'
+    df['church'] = church
+    return df
+
+
+def labelled_collection_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """The same rows with headers replaced by their `collection_codes` labels (what treasurers type)."""
+    labels = collection_code_labels()
+    return df.rename(columns={c: labels[c] for c in df.columns if labels.get(c) and labels[c] != 'UNUSED'})
+
+
+def bulk_rows(df: pd.DataFrame) -> List[dict]:
+    """JSON-ready rows for `/members_collections/bulk` and `/validate` (NaN cells are omitted)."""
+    out = []
+    cols = list(df.columns)
+    for values in df.itertuples(index=False, name=None):
+        row = {}
+        for c, v in zip(cols, values):
+            if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NaT:
+                continue
+            if isinstance(v, pd.Timestamp):
+                v = v.isoformat()
+            elif isinstance(v, np.integer):
+                v = int(v)
+            elif isinstance(v, np.floating):
+                v = float(v)
+            row[c] = v
+        out.append(row)
+    return out
+
+
+def write_frame(df: pd.DataFrame, path_base: str, fmt: str = 'auto') -> str:
+    if fmt == 'auto':
+        fmt = 'xlsx' if len(df) <= XLSX_MAX_ROWS else 'csv'
+    path = f'{path_base}.{fmt}'
+    if fmt == 'xlsx':
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def write_dataset(size, out_dir: str, fmt: str = 'auto', seed: int = 1) -> Dict[str, str]:
+    n = parse_size(size)
+    os.makedirs(out_dir, exist_ok=True)
+    return {
+        'members': write_frame(members_frame(n, seed), os.path.join(out_dir, f'Members_{n}'), fmt),
+        'matoleo': write_frame(matoleo_frame(n, seed + 1), os.path.join(out_dir, f'MATOLEO_{n}'), fmt),
+        'members_collection': write_frame(members_collection_frame(n, seed + 2), os.path.join(out_dir, f'members_collection_{n}'), fmt),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', default='1k', help='1k, 100k, 1m or a row count')
+    parser.add_argument('--out', default='bench-data')
+    parser.add_argument('--format', choices=['auto', 'xlsx', 'csv'], default='auto')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    for kind, path in write_dataset(args.size, args.out, args.format, args.seed).items():
+        print(f'{kind}: {path}')
+
+
+if __name__ == '__main__':
+    main()
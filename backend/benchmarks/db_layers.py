@@ -0,0 +1,105 @@
+"""Compare the sync (`db.py`) and async (`adb.py`) data-access layers under concurrency.
+
+Usage:
+  python -m backend.benchmarks.db_layers --rows 5000 --requests 2000 --concurrency 50
+
+The sync layer runs on a thread pool the size of Starlette's default (40 threads), the way
+FastAPI runs sync endpoints; the async layer runs `concurrency` coroutines on one event loop.
+Uses a throwaway SQLite file unless --database-url is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import summarize, use_temp_database
+
+
+def _prepare(db, rows):
+    import pandas as pd
+    db.create_tables()
+    df = pd.DataFrame({
+        'sno': range(1, rows + 1),
+        'MEMBER_NAME': [f'MEMBER {i}' for i in range(1, rows + 1)],
+        'church': [1 + i % 4 for i in range(rows)],
+        'MEMBER_ID': range(100000, 100000 + rows),
+    })
+    db.insert_dataframe(df, table_name='members')
+    user = db.create_user('bench_user', 'bench-password')
+    return db.create_token_for_user(user['id'])
+
+
+def run(rows, requests, concurrency, threads, workload):
+    from backend import db, adb
+
+    token = _prepare(db, rows)
+
+    if workload == 'token':
+        sync_call = lambda: db.get_user_by_token(token)
+        async_call = lambda: adb.get_user_by_token(token)
+    else:
+        cols = ['id', 'sno', 'MEMBER_NAME']
+        sync_call = lambda: db.read_table('members', cols)
+        async_call = lambda: adb.read_table('members', cols)
+
+    # sync layer on a threadpool
+    def timed():
+        t0 = time.perf_counter()
+        sync_call()
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        sync_lat = list(ex.map(lambda _: timed(), range(requests)))
+    sync_res = {'layer': 'sync', **summarize(sync_lat, time.perf_counter() - t0)}
+
+    # async layer on one event loop
+    async def main():
+        sem = asyncio.Semaphore(concurrency)
+        lat = []
+
+        async def one():
+            async with sem:
+                t = time.perf_counter()
+                await async_call()
+                lat.append(time.perf_counter() - t)
+
+        await async_call()  # warm up the engine / pool
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+        await adb.dispose()
+        return lat, elapsed
+
+    async_lat, elapsed = asyncio.run(main())
+    async_res = {'layer': 'async', **summarize(async_lat, elapsed)}
+    return {'workload': workload, 'rows': rows, 'concurrency': concurrency, 'threads': threads, 'results': [sync_res, async_res]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000, help='members rows to create')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50, help='in-flight requests for the async layer')
+    parser.add_argument('--threads', type=int, default=40, help='threadpool size for the sync layer')
+    parser.add_argument('--workload', choices=['token', 'report'], default='token')
+    parser.add_argument('--database-url', help='benchmark an existing database instead of a temp SQLite file')
+    args = parser.parse_args(argv)
+
+    # db.py reads its configuration at import time, so point it at the benchmark database first
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+        os.environ['DB_ENGINE'] = 'sqlite' if args.database_url.startswith('sqlite') else 'postgres'
+    else:
+        use_temp_database('ksc-db-layers-')
+
+    out = run(args.rows, args.requests, args.concurrency, args.threads, args.workload)
+    json.dump(out, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""End-to-end API benchmark on synthetic data, run in-process through FastAPI's TestClient.
+
+Usage:
+  python -m backend.benchmarks.e2e --size 1k --repeat 5 --out baseline-1k.json
+  python -m backend.benchmarks.e2e --size 1k --repeat 5 --compare baseline-1k.json --threshold 0.25
+
+Each run uses a fresh temporary SQLite database seeded with `--size` generated members. It then
+exercises `/upload/headers` (MATOLEO sheet), `/upload` (members_collection file, forced past the
+repeat-upload check, then again as a duplicate),
+`/members_collections/validate` and `/bulk` (JSON rows, capped by `--bulk-rows`), the
+`/reports/members_collections` variants and `/members?q=`.
+
+For each scenario it records throughput, latency percentiles, rows/s and peak RSS. With
+`--compare`, the process exits with status 1 when any scenario is slower than the baseline by
+more than `--threshold`.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from .common import compare, load_json, peak_rss_mb, print_comparison, run_metadata, summarize, use_temp_database, write_json
+
+SCENARIOS = ['upload_headers', 'upload', 'upload_duplicate', 'validate', 'bulk', 'report_full', 'report_drop_empty', 'report_range', 'members_search']
+
+
+def _prepare_environment() -> str:
+    db_path = use_temp_database('ksc-e2e-')
+    # the benchmark is the only client: switch off per-uploader ingestion limits unless asked for
+    for var in ('INGEST_RATE', 'INGEST_CHURCH_RATE', 'INGEST_MAX_INFLIGHT_UPLOADER', 'INGEST_MAX_INFLIGHT_CHURCH'):
+        os.environ.setdefault(var, '0')
+    os.environ.setdefault('TOKEN_PURGE_INTERVAL', '0')
+    return db_path
+
+
+def _seed_members(members_df) -> None:
+    from ..db import create_tables, insert_dataframe
+    from ..init_members import map_columns
+
+    create_tables()
+    mapped = members_df.rename(columns=map_columns(list(members_df.columns)))
+    insert_dataframe(mapped, table_name='members')
+
+
+def _timed(call: Callable, repeat: int, rows_per_call: int = 0) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        resp = call()
+        latencies.append(time.perf_counter() - t0)
+        if resp.status_code >= 400:
+            errors += 1
+    out = summarize(latencies, time.perf_counter() - started, rows=rows_per_call * repeat, errors=errors)
+    out['last_status'] = resp.status_code if repeat else None
+    out['peak_rss_mb'] = peak_rss_mb()
+    return out
+
+
+def run(size, repeat: int = 3, bulk_rows: int = 5000, scenarios: Optional[List[str]] = None, seed: int = 1) -> dict:
+    db_path = _prepare_environment()
+    from . import datagen
+
+    n = datagen.parse_size(size)
+    work_dir = tempfile.mkdtemp(prefix='ksc-e2e-data-')
+    gen_started = time.perf_counter()
+    members_df = datagen.members_frame(n, seed)
+    matoleo_path = datagen.write_frame(datagen.matoleo_frame(n, seed + 1), os.path.join(work_dir, 'MATOLEO'))
+    collection_df = datagen.members_collection_frame(n, seed + 2)
+    collection_path = datagen.write_frame(collection_df, os.path.join(work_dir, 'members_collection'))
+    rows_json = datagen.bulk_rows(collection_df.head(min(n, bulk_rows)))
+    gen_seconds = time.perf_counter() - gen_started
+
+    _seed_members(members_df)
+
+    from fastapi.testclient import TestClient
+    from ..app import app
+    from ..db import create_uploader
+
+    def file_payload(path: str):
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        ctype = 'text/csv' if path.endswith('.csv') else 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return {'batch': (os.path.basename(path), data, ctype)}
+
+    matoleo_files = file_payload(matoleo_path)
+    collection_files = file_payload(collection_path)
+    last_week = collection_df['s2'].max()
+    date_range = {'start_date': (last_week - pd.Timedelta(weeks=4)).strftime('%Y-%m-%d'), 'end_date': last_week.strftime('%Y-%m-%d')}
+
+    results: Dict[str, dict] = {}
+    with TestClient(app) as client:
+        headers = {'X-API-KEY': create_uploader('benchmark', 1)}
+        calls = {
+            'upload_headers': (lambda: client.post('/upload/headers', files=matoleo_files, headers=headers), n),
+            # force=true re-parses and upserts every time; upload_duplicate measures the content-hash short cut
+            'upload': (lambda: client.post('/upload', files=collection_files, headers=headers, params={'force': 'true'}), n),
+            'upload_duplicate': (lambda: client.post('/upload', files=collection_files, headers=headers), n),
+            'validate': (lambda: client.post('/members_collections/validate', json=rows_json, headers=headers), len(rows_json)),
+            'bulk': (lambda: client.post('/members_collections/bulk', json=rows_json, headers=headers), len(rows_json)),
+            'report_full': (lambda: client.get('/reports/members_collections'), 0),
+            'report_drop_empty': (lambda: client.get('/reports/members_collections', params={'drop_empty': 'true'}), 0),
+            'report_range': (lambda: client.get('/reports/members_collections', params=date_range), 0),
+            'members_search': (lambda: client.get('/members', params={'q': 'NEEMA'}), 0),
+        }
+        for name in scenarios or SCENARIOS:
+            call, rows = calls[name]
+            results[name] = _timed(call, repeat, rows)
+            print(f"{name:<18} {results[name]['p50_ms']:>10} ms p50  {results[name].get('rows_per_second') or '':>10} rows/s", file=sys.stderr)
+
+    return {
+        'meta': run_metadata(benchmark='e2e', size=n, repeat=repeat, bulk_rows=len(rows_json), datagen_seconds=round(gen_seconds, 2),
+                             upload_format=os.path.splitext(collection_path)[1][1:], database=db_path),
+        'scenarios': results,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', default='1k', help='1k, 100k, 1m or a row count')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--bulk-rows', type=int, default=5000, help='rows per /validate and /bulk request')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='run only these scenarios (repeatable)')
+    parser.add_argument('--out', help='write results JSON here (default: stdout)')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown before a scenario counts as regressed')
+    args = parser.parse_args(argv)
+
+    result = run(args.size, args.repeat, args.bulk_rows, args.scenario)
+    write_json(args.out, result)
+    if args.compare:
+        baseline = load_json(args.compare)
+        if print_comparison(compare(baseline.get('scenarios', {}), result['scenarios'], args.threshold)):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
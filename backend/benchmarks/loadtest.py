@@ -0,0 +1,256 @@
+"""Concurrent load test against a real uvicorn server on localhost.
+
+Usage:
+  python -m backend.benchmarks.loadtest --treasurers 8 --admins 4 --logins 2 --duration 30
+  python -m backend.benchmarks.loadtest --workers 4 --database-url postgresql://... --out load.json
+  python -m backend.benchmarks.loadtest --url http://127.0.0.1:8000 --api-key ... --username ... --password ...
+
+Unless `--url` is given, the tool seeds a temporary SQLite database (or the `--database-url`
+database), starts `uvicorn backend.app:app` with `--workers` processes on a free port, and stops
+it at the end. Virtual users run in mixed scenarios for `--duration` seconds:
+  - treasurers: `/upload/headers` then `/upload` of a generated batch, each with their own key
+  - admins: `/members`, `/members?q=` and `/reports/members_collections`
+  - logins: `/users/login`
+
+The report gives p50/p95/p99, error rate, status codes and throughput per endpoint. Ingestion
+rate limits are off unless `--keep-limits` is passed; with it, 429s are counted separately.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from .common import BACKEND_DIR, compare, load_json, print_comparison, run_metadata, summarize, write_json
+
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+LOAD_PASSWORD = 'load-test-password'
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _server_env(database_url: Optional[str], keep_limits: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    if database_url:
+        env['DATABASE_URL'] = database_url
+        env['DB_ENGINE'] = 'sqlite' if database_url.startswith('sqlite') else 'postgres'
+    else:
+        env['DB_ENGINE'] = 'sqlite'
+        env['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='ksc-load-'), 'load.db')
+        env.pop('DATABASE_URL', None)
+    if not keep_limits:
+        for var in ('INGEST_RATE', 'INGEST_CHURCH_RATE', 'INGEST_MAX_INFLIGHT_UPLOADER', 'INGEST_MAX_INFLIGHT_CHURCH'):
+            env[var] = '0'
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def _seed(env: Dict[str, str], members: int, treasurers: int, admins: int) -> dict:
+    """Create tables, members, one uploader key per treasurer and the admin logins in the server's database."""
+    if 'backend.db' in sys.modules:
+        raise RuntimeError('backend.db was imported before the load-test database was configured')
+    os.environ.update({k: v for k, v in env.items() if k in ('DB_ENGINE', 'SQLITE_PATH', 'DATABASE_URL')})
+    from .. import db
+    from ..init_members import map_columns
+    from . import datagen
+
+    db.create_tables()
+    df = datagen.members_frame(members)
+    db.insert_dataframe(df.rename(columns=map_columns(list(df.columns))), table_name='members')
+    keys = [db.create_uploader(f'treasurer-{i}', i % datagen.CHURCHES + 1) for i in range(treasurers)]
+    users = []
+    for i in range(admins):
+        name = f'load-admin-{i}'
+        db.create_user(name, LOAD_PASSWORD, church_id=1, role='admin')
+        users.append(name)
+    db.engine.dispose()
+    return {'keys': keys, 'users': users}
+
+
+def _start_server(env: Dict[str, str], port: int, workers: int, log_path: str) -> subprocess.Popen:
+    log = open(log_path, 'w')
+    cmd = [sys.executable, '-m', 'uvicorn', 'backend.app:app', '--host', '127.0.0.1', '--port', str(port),
+           '--workers', str(workers), '--log-level', 'warning']
+    return subprocess.Popen(cmd, env=env, cwd=ROOT_DIR, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def _wait_ready(client, proc: Optional[subprocess.Popen], timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError('uvicorn exited during startup')
+        try:
+            resp = await client.get('/collection_codes')
+            if resp.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError('server did not become ready')
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    async def call(self, name: str, coro):
+        t0 = time.perf_counter()
+        try:
+            resp = await coro
+            status = resp.status_code
+        except Exception as e:
+            resp, status = None, type(e).__name__
+        self.latencies[name].append(time.perf_counter() - t0)
+        self.statuses[name][status] += 1
+        return resp
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        out = {}
+        for name, lat in sorted(self.latencies.items()):
+            statuses = self.statuses[name]
+            errors = sum(n for s, n in statuses.items() if not isinstance(s, int) or (s >= 400 and s != 429))
+            res = summarize(lat, elapsed, errors=errors)
+            res['throttled'] = statuses.get(429, 0)
+            res['statuses'] = {str(k): v for k, v in statuses.items()}
+            out[name] = res
+        return out
+
+
+async def _treasurer(client, rec: Recorder, api_key: str, files: dict, stop: float, think: float):
+    headers = {'X-API-KEY': api_key}
+    while time.monotonic() < stop:
+        await rec.call('POST /upload/headers', client.post('/upload/headers', files=files['matoleo'], headers=headers))
+        # force=true: every iteration parses and upserts instead of hitting the repeat-upload short cut
+        await rec.call('POST /upload', client.post('/upload', files=files['collection'], headers=headers, params={'force': 'true'}))
+        await asyncio.sleep(think)
+
+
+async def _admin(client, rec: Recorder, token: str, stop: float, think: float):
+    headers = {'Authorization': f'Bearer {token}'}
+    names = ['NEEMA', 'JOHN', 'GRACE', 'MOSHI', 'PENDO']
+    while time.monotonic() < stop:
+        await rec.call('GET /members', client.get('/members', params={'fields': 'id,sno,MEMBER_NAME,church'}, headers=headers))
+        await rec.call('GET /members?q=', client.get('/members', params={'q': random.choice(names)}, headers=headers))
+        await rec.call('GET /reports/members_collections', client.get('/reports/members_collections', params={'drop_empty': 'true'}, headers=headers))
+        await asyncio.sleep(think)
+
+
+async def _login(client, rec: Recorder, username: str, password: str, stop: float, think: float):
+    while time.monotonic() < stop:
+        await rec.call('POST /users/login', client.post('/users/login', json={'username': username, 'password': password}))
+        await asyncio.sleep(think)
+
+
+def _upload_files(rows: int, seed: int) -> dict:
+    from . import datagen
+    matoleo = datagen.matoleo_frame(rows, seed).to_csv(index=False).encode('utf-8')
+    collection = datagen.members_collection_frame(rows, seed + 1).to_csv(index=False).encode('utf-8')
+    return {
+        'matoleo': {'batch': ('MATOLEO.csv', matoleo, 'text/csv')},
+        'collection': {'batch': ('members_collection.csv', collection, 'text/csv')},
+    }
+
+
+async def _run_load(base_url: str, proc, keys: List[str], users: List[str], password: str, args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.treasurers + args.admins + args.logins + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        await _wait_ready(client, proc)
+        tokens = []
+        for u in users:
+            resp = await client.post('/users/login', json={'username': u, 'password': password})
+            resp.raise_for_status()
+            tokens.append(resp.json()['token'])
+        files = _upload_files(args.upload_rows, args.seed)
+        rec = Recorder()
+        started = time.monotonic()
+        stop = started + args.duration
+        tasks = []
+        for i in range(args.treasurers):
+            tasks.append(_treasurer(client, rec, keys[i % len(keys)], files, stop, args.think))
+        for i in range(args.admins):
+            tasks.append(_admin(client, rec, tokens[i % len(tokens)], stop, args.think))
+        for i in range(args.logins):
+            tasks.append(_login(client, rec, users[i % len(users)], password, stop, args.think))
+        await asyncio.gather(*tasks)
+        return rec.report(time.monotonic() - started)
+
+
+def run(args) -> dict:
+    proc = None
+    log_path = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        keys, users, password = [args.api_key], [args.username], args.password
+        if not (args.api_key and args.username and args.password):
+            raise SystemExit('--url needs --api-key, --username and --password')
+    else:
+        env = _server_env(args.database_url, args.keep_limits)
+        seeded = _seed(env, args.members, max(args.treasurers, 1), max(args.admins, args.logins, 1))
+        keys, users, password = seeded['keys'], seeded['users'], LOAD_PASSWORD
+        port = _free_port()
+        log_path = os.path.join(tempfile.mkdtemp(prefix='ksc-load-log-'), 'uvicorn.log')
+        proc = _start_server(env, port, args.workers, log_path)
+        base_url = f'http://127.0.0.1:{port}'
+    try:
+        endpoints = asyncio.run(_run_load(base_url, proc, keys, users, password, args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {
+        'meta': run_metadata(benchmark='loadtest', url=base_url, workers=args.workers, treasurers=args.treasurers,
+                             admins=args.admins, logins=args.logins, duration=args.duration, upload_rows=args.upload_rows,
+                             members=args.members, database=args.database_url or 'sqlite (temporary)', server_log=log_path),
+        'endpoints': endpoints,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--treasurers', type=int, default=8, help='concurrent uploading users')
+    parser.add_argument('--admins', type=int, default=4, help='concurrent users browsing members/reports')
+    parser.add_argument('--logins', type=int, default=2, help='concurrent users logging in repeatedly')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--think', type=float, default=0.0, help='pause between iterations of a virtual user')
+    parser.add_argument('--upload-rows', type=int, default=200, help='rows per uploaded batch')
+    parser.add_argument('--members', type=int, default=5000, help='members seeded into the temporary database')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--database-url', help='run the server against this database instead of a temporary SQLite file')
+    parser.add_argument('--keep-limits', action='store_true', help='keep ingestion rate limits on (429s are reported separately)')
+    parser.add_argument('--request-timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--api-key')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--out', help='write results JSON here (default: stdout)')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    write_json(args.out, result)
+    if args.compare:
+        baseline = load_json(args.compare)
+        if print_comparison(compare(baseline.get('endpoints', {}), result['endpoints'], args.threshold)):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Microbenchmarks for the ingestion hot-path helpers, with stored baselines.
+
+Usage:
+  python -m backend.benchmarks.micro                    # run and print results
+  python -m backend.benchmarks.micro --save             # (re)write the stored baseline
+  python -m backend.benchmarks.micro --compare          # fail (exit 1) on a regression past --threshold
+  python -m backend.benchmarks.micro -k s1 --compare    # only cases whose name contains "s1"
+
+Covered helpers, each on realistic inputs from `datagen`:
+  - `ingest.guess_s1_column`
+  - `app._serializable_value`
+  - `ingest.fill_s1` / `ingest.derive_s1`
+  - `init_members.map_columns`
+  - the upload column-mapping loop (`ingest.map_upload_frame`)
+
+Each case reports the best of `--repeat` timings in nanoseconds per call; cases that look
+regressed are re-measured before `--compare` fails. Timings depend on the machine, so no
+baseline is committed: `--save` writes one to `benchmarks/baselines/micro.json` (ignored by
+git) on the host that runs the comparison, before the change being measured.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .common import compare, load_json, print_comparison, run_metadata, use_temp_database, write_json
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'micro.json')
+
+
+def _cases() -> Dict[str, Tuple[Callable[[], object], str]]:
+    """name -> (zero-argument callable, what one call processes)."""
+    import numpy as np
+    from . import datagen
+    from ..app import _serializable_value
+    from ..db import members_collection
+    from ..ingest import derive_s1, fill_s1, guess_s1_column, map_upload_frame
+    from ..init_members import map_columns
+
+    matoleo = datagen.matoleo_frame(1000)
+    collection = datagen.members_collection_frame(1000)
+    labelled = datagen.labelled_collection_frame(collection)
+    members_headers = list(datagen.members_frame(10).columns)
+    messy_headers = ['S/NO', 'Member Name', 'Church', 'Member Id', 'Family', 'Official ID', 'Pledge', 'Group',
+                     'Leader', 'Status', 'Phone', 'Phone 2', 'E-mail', 'Residence', 'Notes']
+    target_cols = [c.name for c in members_collection.columns if c.name not in ('id', 'added_at')]
+    uploader = {'id': 1, 'name': 'bench', 'church': 1}
+
+    bulk = datagen.bulk_rows(collection.head(200))
+    for r in bulk:
+        r.pop('s1', None)
+    # a report row as pandas hands it to the serializer: numpy scalars, NaN, Timestamp, str, None
+    report_row = collection.head(1).to_dict(orient='records')[0]
+    report_row.update({f'l{i}': np.float64('nan') for i in range(1, 42) if f'l{i}' not in report_row})
+    report_values = list(report_row.values())
+    s2 = collection['s2'].iloc[0].to_pydatetime()
+
+    return {
+        'guess_s1_column/matoleo': (lambda: guess_s1_column(matoleo), 'frame'),
+        'guess_s1_column/members_collection': (lambda: guess_s1_column(labelled), 'frame'),
+        'serializable_value/report_row': (lambda: [_serializable_value(v) for v in report_values], f'row of {len(report_values)} cells'),
+        'derive_s1/datetime': (lambda: derive_s1(s2, 17, 3), 'value'),
+        'derive_s1/iso_string': (lambda: derive_s1('2024-02-14T00:00:00', '17', 3), 'value'),
+        'fill_s1/bulk_200_rows': (lambda: [fill_s1(dict(r)) for r in bulk], '200 rows'),
+        'map_columns/members_xlsx': (lambda: map_columns(members_headers), 'header row'),
+        'map_columns/messy_headers': (lambda: map_columns(messy_headers), 'header row'),
+        'map_upload_frame/1k_rows': (lambda: map_upload_frame(collection, target_cols, uploader), '1000-row frame'),
+    }
+
+
+def _measure(fn: Callable, repeat: int, min_time: float) -> Tuple[float, int]:
+    """Best-of-`repeat` seconds per call, auto-sizing loops so each timing lasts >= `min_time`."""
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or loops >= 10_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    best = elapsed / loops
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat - 1):
+            t0 = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            best = min(best, (time.perf_counter() - t0) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best, loops
+
+
+def run(pattern: Optional[str] = None, repeat: int = 5, min_time: float = 0.2, cases: Optional[dict] = None) -> dict:
+    if cases is None:
+        use_temp_database('ksc-micro-')
+        cases = _cases()
+    results = {}
+    for name, (fn, unit) in cases.items():
+        if pattern and pattern not in name:
+            continue
+        seconds, loops = _measure(fn, repeat, min_time)
+        results[name] = {'ns_per_call': round(seconds * 1e9, 1), 'loops': loops, 'repeat': repeat, 'unit': unit}
+        print(f'{name:<40} {seconds * 1e6:>12.2f} us/call  ({unit})', file=sys.stderr)
+    return {'meta': run_metadata(benchmark='micro'), 'cases': results}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='pattern', help='only run cases whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per timing')
+    parser.add_argument('--save', nargs='?', const=BASELINE_PATH, help='write results as the baseline (default path if no value)')
+    parser.add_argument('--compare', nargs='?', const=BASELINE_PATH, help='compare with a baseline (default path if no value)')
+    parser.add_argument('--threshold', type=float, default=0.3, help='allowed slowdown per case (0.3 = 30%%)')
+    parser.add_argument('--out', help='write results JSON here')
+    args = parser.parse_args(argv)
+
+    if args.compare and not os.path.exists(args.compare):
+        parser.error(f"no baseline at {args.compare}; run with --save on this machine first")
+
+    use_temp_database('ksc-micro-')
+    cases = _cases()
+    result = run(args.pattern, args.repeat, args.min_time, cases)
+    if args.out:
+        write_json(args.out, result)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        if os.path.exists(args.save) and args.pattern:
+            # keep the baseline of cases that were not re-run
+            saved = load_json(args.save)
+            saved['cases'].update(result['cases'])
+            saved['meta'] = result['meta']
+            result = saved
+        write_json(args.save, result)
+    if args.compare:
+        baseline = load_json(args.compare).get('cases', {})
+        # a single slow timing on a busy host is not a regression: re-measure suspects before failing
+        for _ in range(2):
+            suspects = {r['scenario'] for r in compare(baseline, result['cases'], args.threshold) if r['regressed']}
+            if not suspects:
+                break
+            retry = run(None, args.repeat * 2, args.min_time, {k: v for k, v in cases.items() if k in suspects})
+            for name, res in retry['cases'].items():
+                if res['ns_per_call'] < result['cases'][name]['ns_per_call']:
+                    result['cases'][name] = res
+        if print_comparison(compare(baseline, result['cases'], args.threshold)):
+            sys.exit(1)
+    if not (args.out or args.save or args.compare):
+        write_json(None, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import importlib
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def fresh_backend(tmp_path, monkeypatch):
+    """Load backend modules against a new SQLite database under tmp_path.
+
+    `fresh_backend('app', NAME='value')` sets the environment, re-imports the package, creates
+    the tables and returns `backend.app`. Tables are created here rather than by the startup
+    hook, which would also seed members from Members.xlsx; use the TestClient without `with`.
+    """
+    def load(module: str = 'db', **env):
+        monkeypatch.setenv('DB_ENGINE', 'sqlite')
+        monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'test.db'))
+        monkeypatch.delenv('DATABASE_URL', raising=False)
+        for k, v in env.items():
+            monkeypatch.setenv(k, v)
+        for name in [m for m in sys.modules if m == 'backend' or m.startswith('backend.')]:
+            monkeypatch.delitem(sys.modules, name)
+        importlib.import_module('backend.db').create_tables()
+        return importlib.import_module(f'backend.{module}')
+    return load
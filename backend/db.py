@@ -1,23 +1,32 @@
 import os
-import hashlib
 import binascii
+import logging
 import uuid
 from datetime import datetime, timedelta
+from decimal import Decimal
 from typing import List
 import pandas as pd
 from dotenv import load_dotenv
 
 # Use SQLAlchemy to support both SQLite and Postgres via a single API
 from sqlalchemy import create_engine, inspect
-from sqlalchemy import Table, Column, Integer, String, MetaData, ForeignKey, DateTime, func, text, Numeric
+from sqlalchemy import Table, Column, Integer, String, MetaData, ForeignKey, DateTime, func, text, Numeric, UniqueConstraint
 from sqlalchemy import insert as sql_insert
 from sqlalchemy.exc import SQLAlchemyError
 from typing import Optional
 
 load_dotenv()
 
+# imported after load_dotenv: money.py reads MONEY_STORAGE / MONEY_SCALE and passwords.py
+# PASSWORD_HASH_ITERATIONS at import time
+from . import money
+from .money import MONEY
+from .passwords import hash_password, check_password, needs_rehash
+
 BASE_DIR = os.path.dirname(__file__)
 
+logger = logging.getLogger(__name__)
+
 # Config: DB_ENGINE can be 'sqlite' or 'postgres' (or 'postgresql')
 DB_ENGINE = os.getenv("DB_ENGINE", "sqlite").lower()
 
@@ -59,21 +68,384 @@ def ensure_db_exists():
         conn.close()
 
 
+# table name -> column names, filled on first reflection and dropped when the schema is altered
+_columns_cache = {}
+
+
 def get_target_columns(table_name: str = "members_collection") -> List[str]:
     """Return target table column names. Empty list if table doesn't exist."""
+    cached = _columns_cache.get(table_name)
+    if cached is not None:
+        return list(cached)
     ensure_db_exists()
     inspector = inspect(engine)
     if table_name not in inspector.get_table_names():
         return []
     cols = [c["name"] for c in inspector.get_columns(table_name)]
-    return cols
+    _columns_cache[table_name] = cols
+    return list(cols)
+
+
+def invalidate_columns_cache(table_name: Optional[str] = None) -> None:
+    """Forget cached column names for one table (or all tables)."""
+    if table_name is None:
+        _columns_cache.clear()
+    else:
+        _columns_cache.pop(table_name, None)
+
+
+def resolve_fields(fields: Optional[str], table_name: str = "members_collection") -> Optional[List[str]]:
+    """Parse a comma-separated `fields` parameter and check it against the table's columns.
+
+    Returns None when no projection was requested. Raises ValueError on unknown column names.
+    """
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    if not requested:
+        return None
+    cols = get_target_columns(table_name)
+    by_lower = {c.lower(): c for c in cols}
+    out = []
+    unknown = []
+    for f in requested:
+        c = by_lower.get(f.lower())
+        if c is None:
+            unknown.append(f)
+        elif c not in out:
+            out.append(c)
+    if unknown:
+        raise ValueError(f"Unknown field(s) for {table_name}: {', '.join(unknown)}")
+    return out
+
+
+def non_null_columns_sql(table_name: str, columns: List[str]):
+    """`SELECT COUNT(col1), COUNT(col2), ... FROM table` for already validated column names."""
+    q = engine.dialect.identifier_preparer.quote
+    counts = ', '.join(f'COUNT({q(c)})' for c in columns)
+    return text(f'SELECT {counts} FROM {q(table_name)}')
+
+
+def non_null_columns(table_name: str, columns: List[str]) -> List[str]:
+    """Return the subset of `columns` holding at least one non-NULL value, using one COUNT(col) query."""
+    if not columns:
+        return []
+    with engine.connect() as conn:
+        row = conn.execute(non_null_columns_sql(table_name, columns)).fetchone()
+    if row is None:
+        return []
+    return [c for c, n in zip(columns, row) if n]
+
+
+def read_table(table_name: str, columns: Optional[List[str]] = None, drop_null_columns: bool = False) -> pd.DataFrame:
+    """Read a table with an explicit SELECT list instead of `SELECT *`.
+
+    `columns` must already be validated (see `resolve_fields`). With `drop_null_columns`
+    the columns that are NULL in every row are left out of the query entirely.
+    """
+    ensure_db_exists()
+    cols = list(columns) if columns else get_target_columns(table_name)
+    if not cols:
+        raise ValueError(f"Table not found: {table_name}")
+    if drop_null_columns:
+        cols = non_null_columns(table_name, cols)
+        if not cols:
+            return pd.DataFrame()
+    # read_sql_table emits `SELECT <cols> FROM table` and keeps the reflected column types (dates, numerics)
+    return money.frame_from_storage(pd.read_sql_table(table_name, con=engine, columns=cols), table_name)
 
 
 def insert_dataframe(df: pd.DataFrame, table_name: str = "members_collection") -> None:
     """Insert rows from a DataFrame into the configured database table."""
     ensure_db_exists()
     # Use pandas to_sql which works with SQLAlchemy engines for both sqlite and postgres
-    df.to_sql(table_name, engine, if_exists="append", index=False)
+    money.frame_to_storage(df, table_name).to_sql(table_name, engine, if_exists="append", index=False)
+    bump_table_version(table_name)
+
+
+# Natural keys that ingestion upserts on, and the unique indexes behind them
+UPSERT_KEYS = {'members_collection': ('s1', 'church')}
+UPSERT_INDEXES = {'members_collection': 'ix_members_collection_s1_church'}
+_upsert_indexes_found = set()
+_UPSERT_BATCH = 500
+
+
+def _dialect_insert(table):
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(table)
+
+
+def _comparable(v):
+    """Normalize a value so a frame cell and the stored value compare equal when they mean the same."""
+    if v is None:
+        return None
+    if isinstance(v, (int, float, Decimal)) and not isinstance(v, bool):
+        return float(v)
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    return v
+
+
+# Columns the database maintains itself; an upsert must never write them (see ensure_change_tracking)
+_MANAGED_COLUMNS = ('added_at', 'updated_at')
+
+
+def _frame_records(df: pd.DataFrame, table) -> List[dict]:
+    """DataFrame rows as plain dicts typed for `table`'s columns (NaN -> None); unknown and managed columns are dropped."""
+    out = pd.DataFrame(index=df.index)
+    for name in df.columns:
+        if name not in table.c or name in _MANAGED_COLUMNS:
+            continue
+        col = table.c[name]
+        if col.primary_key and col.autoincrement in (True, 'auto'):
+            continue
+        series = df[name]
+        if col.server_default is not None and series.isna().all():
+            continue
+        if isinstance(col.type, DateTime):
+            series = pd.to_datetime(series, errors='coerce')
+        elif isinstance(col.type, (Integer, Numeric)) and not pd.api.types.is_numeric_dtype(series):
+            series = pd.to_numeric(series, errors='coerce')
+        out[name] = series
+    out = money.frame_to_storage(out, table.name)
+    out = out.astype(object).where(out.notna(), None)
+    records = out.to_dict(orient='records')
+    for r in records:
+        for k, v in r.items():
+            if isinstance(v, pd.Timestamp):
+                r[k] = v.to_pydatetime()
+            elif isinstance(v, float) and v.is_integer() and isinstance(table.c[k].type, Integer):
+                r[k] = int(v)
+    return records
+
+
+def _upsert_index_ready(conn, table_name: str) -> bool:
+    """Whether the unique index behind UPSERT_KEYS exists; it is not created while duplicates remain."""
+    if table_name not in _upsert_indexes_found:
+        if UPSERT_INDEXES[table_name] not in {ix['name'] for ix in inspect(conn).get_indexes(table_name)}:
+            return False
+        _upsert_indexes_found.add(table_name)
+    return True
+
+
+def _upsert_records(conn, table, records: List[dict], key, outcomes: Optional[list] = None) -> dict:
+    """Upsert same-shaped `records`; when `outcomes` is given, it receives each record's result in order."""
+    from sqlalchemy import select, tuple_
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    if not records:
+        return counts
+    result = [None] * len(records)
+    columns = list(records[0])
+    # rows without a complete key are not matched: they are plain inserts
+    unkeyed, keyed = [], {}
+    for i, r in enumerate(records):
+        k = tuple(r.get(c) for c in key)
+        if None in k:
+            unkeyed.append(r)
+            result[i] = 'inserted'
+            continue
+        if k in keyed:
+            # the same key twice in one batch: the later row wins
+            counts['skipped'] += 1
+            result[keyed[k][0]] = 'skipped'
+        keyed[k] = (i, r)
+
+    existing = {}
+    key_cols = [table.c[c] for c in key]
+    cols = [table.c[c] for c in columns]
+    keys = list(keyed)
+    for i in range(0, len(keys), _UPSERT_BATCH):
+        batch = keys[i:i + _UPSERT_BATCH]
+        stmt = select(*cols).where(tuple_(*key_cols).in_(batch))
+        for row in conn.execute(stmt).mappings():
+            existing[tuple(_comparable(row[c]) for c in key)] = row
+
+    to_write = []
+    for k, (i, r) in keyed.items():
+        old = existing.get(tuple(_comparable(v) for v in k))
+        if old is None:
+            result[i] = 'inserted'
+        elif all(_comparable(old[c]) == _comparable(r[c]) for c in columns):
+            result[i] = 'skipped'
+        else:
+            result[i] = 'updated'
+        counts[result[i]] += 1
+        if result[i] != 'skipped':
+            to_write.append(r)
+
+    if to_write:
+        ins = _dialect_insert(table)
+        if ins is not None and all(c in columns for c in key) and _upsert_index_ready(conn, table.name):
+            # ON CONFLICT keeps a concurrent upload of the same rows from failing on the unique index
+            stmt = ins.on_conflict_do_update(index_elements=list(key), set_={c: ins.excluded[c] for c in columns
+                                                                             if c not in key and c not in _MANAGED_COLUMNS})
+            conn.execute(stmt, to_write)
+        else:
+            # without the unique index (duplicate keys not yet resolved) every matching row is updated
+            for r in to_write:
+                where = [table.c[c] == r[c] for c in key]
+                if not conn.execute(table.update().where(*where).values(**r)).rowcount:
+                    conn.execute(table.insert().values(**r))
+    if unkeyed:
+        conn.execute(table.insert(), unkeyed)
+        counts['inserted'] += len(unkeyed)
+    if outcomes is not None:
+        outcomes.extend(result)
+    return counts
+
+
+def upsert_dataframes(frames, table_name: str = "members_collection") -> dict:
+    """Upsert an iterable of DataFrames on the table's natural key in one transaction.
+
+    Rows whose key already exists are updated, or skipped when nothing changed; the rest are
+    inserted. Returns `{'inserted', 'updated', 'skipped'}`.
+    """
+    ensure_db_exists()
+    table = metadata.tables[table_name]
+    key = UPSERT_KEYS[table_name]
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    with engine.begin() as conn:
+        for df in frames:
+            if len(df):
+                for k, v in _upsert_records(conn, table, _frame_records(df, table), key).items():
+                    counts[k] += v
+    if counts['inserted'] or counts['updated']:
+        bump_table_version(table_name)
+    return counts
+
+
+def upsert_dataframe(df: pd.DataFrame, table_name: str = "members_collection") -> dict:
+    """`upsert_dataframes` for a single DataFrame."""
+    return upsert_dataframes([df], table_name)
+
+
+def coerce_row(table_name: str, row: dict) -> dict:
+    """A submitted row (form strings or JSON values) typed for `table_name`'s columns.
+
+    Raises ValueError for unknown columns or values that do not parse. Empty strings become
+    NULL except in text columns.
+    """
+    table = metadata.tables[table_name]
+    out = {}
+    for name, v in row.items():
+        if name not in table.c:
+            raise ValueError(f"Unknown column for {table_name}: {name}")
+        typ = table.c[name].type
+        if isinstance(v, str) and not v.strip() and not isinstance(typ, String):
+            v = None
+        try:
+            if v is None:
+                pass
+            elif money.MINOR and name in money.MONEY_COLUMNS.get(table_name, ()):
+                v = money.to_minor(v)
+            elif isinstance(typ, DateTime) and not isinstance(v, datetime):
+                v = pd.Timestamp(v).to_pydatetime()
+            elif isinstance(typ, Integer) and not isinstance(v, int):
+                v = Decimal(str(v).strip())
+                if v != v.to_integral_value():
+                    raise ValueError(v)
+                v = int(v)
+            elif isinstance(typ, Numeric) and not isinstance(v, (int, float, Decimal)):
+                v = Decimal(str(v).strip())
+            elif isinstance(typ, String) and not isinstance(v, str):
+                v = str(v)
+        except (ValueError, TypeError, ArithmeticError):
+            raise ValueError(f"Invalid value for {table_name}.{name}: {v!r}")
+        out[name] = v
+    return out
+
+
+def write_rows(items: List[tuple]) -> List[dict]:
+    """Write `(op, table_name, row)` items in one transaction and return one result per item.
+
+    `op` is 'insert' (result `{'id': pk}`) or 'upsert' on the table's UPSERT_KEYS (result
+    `{'inserted', 'updated', 'skipped'}` for that row). Rows must already be coerced.
+    """
+    ensure_db_exists()
+    results: List[Optional[dict]] = [None] * len(items)
+    upserts = {}
+    written = set()
+    with engine.begin() as conn:
+        for i, (op, table_name, row) in enumerate(items):
+            table = metadata.tables[table_name]
+            if op == 'upsert':
+                upserts.setdefault((table_name, tuple(row)), []).append(i)
+                continue
+            res = conn.execute(table.insert().values(**row))
+            pk = res.inserted_primary_key
+            results[i] = {'id': pk[0] if pk else None}
+            written.add(table_name)
+        # upserts of the same shape share one existing-key lookup and one statement
+        for (table_name, _), idx in upserts.items():
+            outcomes = []
+            counts = _upsert_records(conn, metadata.tables[table_name], [items[i][2] for i in idx],
+                                     UPSERT_KEYS[table_name], outcomes)
+            for i, outcome in zip(idx, outcomes):
+                results[i] = {'inserted': 0, 'updated': 0, 'skipped': 0, outcome: 1}
+            if counts['inserted'] or counts['updated']:
+                written.add(table_name)
+    if written:
+        bump_table_version(*sorted(written))
+    return results
+
+
+def update_rows(table_name: str, updates: List[tuple]) -> List[str]:
+    """Apply `(id, changes)` pairs in one transaction and return 'updated' or 'not_found' per pair.
+
+    Pairs are grouped by their set of changed columns and each group runs as one executemany
+    UPDATE. Changes must already be coerced; a database error rolls back every pair.
+    """
+    from sqlalchemy import bindparam, select
+    ensure_db_exists()
+    table = metadata.tables[table_name]
+    ids = list({pk for pk, _ in updates})
+    groups = {}
+    for i, (_, changes) in enumerate(updates):
+        groups.setdefault(tuple(changes), []).append(i)
+    with engine.begin() as conn:
+        found = set()
+        for i in range(0, len(ids), _UPSERT_BATCH):
+            found.update(conn.execute(select(table.c.id).where(table.c.id.in_(ids[i:i + _UPSERT_BATCH]))).scalars())
+        for columns, idx in groups.items():
+            params = [dict({f'_v_{c}': updates[i][1][c] for c in columns}, _id=updates[i][0])
+                      for i in idx if updates[i][0] in found]
+            if params:
+                stmt = table.update().where(table.c.id == bindparam('_id')).values({c: bindparam(f'_v_{c}') for c in columns})
+                conn.execute(stmt, params)
+    if found:
+        bump_table_version(table_name)
+    return ['updated' if pk in found else 'not_found' for pk, _ in updates]
+
+
+def find_upload(content_hash: str, church: Optional[int], table_name: str = "members_collection") -> Optional[dict]:
+    """The earlier ingestion of a file with this content hash for this church, if any."""
+    ensure_db_exists()
+    from sqlalchemy import select
+    with engine.connect() as conn:
+        row = conn.execute(select(upload_hashes).where(
+            upload_hashes.c.content_hash == content_hash,
+            upload_hashes.c.church == (church or 0),
+            upload_hashes.c.table_name == table_name,
+        )).mappings().first()
+    return dict(row) if row else None
+
+
+def record_upload(content_hash: str, church: Optional[int], counts: dict, filename: Optional[str] = None,
+                  uploader: Optional[str] = None, table_name: str = "members_collection") -> None:
+    """Remember an ingested file; a concurrent identical upload that recorded it first wins."""
+    ensure_db_exists()
+    try:
+        with engine.begin() as conn:
+            conn.execute(sql_insert(upload_hashes).values(
+                content_hash=content_hash, church=church or 0, table_name=table_name, filename=filename, uploader=uploader,
+                inserted=counts.get('inserted', 0), updated=counts.get('updated', 0), skipped=counts.get('skipped', 0)))
+    except SQLAlchemyError:
+        pass
 
 
 # --- Table definitions and helpers ---
@@ -82,14 +454,15 @@ metadata = MetaData()
 members = Table(
     'members', metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
-    Column('sno', Integer, primary_key=True, nullable=False),
+    # uniqueness of sno is enforced by ix_members_sno_unique (see create_tables)
+    Column('sno', Integer, nullable=True),
     Column('MEMBER_NAME', String(300), nullable=True),
     Column('church', Integer, nullable=True),
     Column('MEMBER_ID', Integer, nullable=True),
     Column('FAMILY_ID', Integer, nullable=True),
     Column('DEFAULT_FAMILY_ID', Integer, nullable=True),
     Column('OFFICIAL_MEMBER_ID', Integer, nullable=True),
-    Column('pledge', Numeric, nullable=True),
+    Column('pledge', MONEY, nullable=True),
     Column('GROUP_NAME', String(200), nullable=True),
     Column('GROUP_ALIAS', String(200), nullable=True),
     Column('DEFAULT_GROUP_ALIAS', String(200), nullable=True),
@@ -101,6 +474,8 @@ members = Table(
     Column('EMAIL', String(320), nullable=True),
     Column('RESIDENCE', String(400), nullable=True),
     Column('created_at', DateTime, server_default=func.now()),
+    # maintained by triggers (see ensure_change_tracking)
+    Column('updated_at', DateTime, nullable=True),
 )
 
 
@@ -120,79 +495,80 @@ members_collection = Table(
     Column('s2', DateTime, nullable=True),
     Column('s3', Numeric, nullable=True),
     Column('s4', String(255), nullable=True),
-    Column('s5', Numeric, nullable=True),
-    Column('s6', Numeric, nullable=True),
-    Column('s7', Numeric, nullable=True),
-    Column('s8', Numeric, nullable=True),
-    Column('s9', Numeric, nullable=True),
+    Column('s5', MONEY, nullable=True),
+    Column('s6', MONEY, nullable=True),
+    Column('s7', MONEY, nullable=True),
+    Column('s8', MONEY, nullable=True),
+    Column('s9', MONEY, nullable=True),
     Column('s10', String(255), nullable=True),
     Column('s11', String(255), nullable=True),
     Column('s12', String(255), nullable=True),
-    Column('s13', Numeric, nullable=True),
-    Column('c1', Numeric, nullable=True),
-    Column('c2', Numeric, nullable=True),
-    Column('c3', Numeric, nullable=True),
-    Column('c4', Numeric, nullable=True),
-    Column('c5', Numeric, nullable=True),
-    Column('c6', Numeric, nullable=True),
-    Column('c7', Numeric, nullable=True),
-    Column('c8', Numeric, nullable=True),
-    Column('c9', Numeric, nullable=True),
-    Column('c10', Numeric, nullable=True),
-    Column('c11', Numeric, nullable=True),
-    Column('c12', Numeric, nullable=True),
-    Column('c13', Numeric, nullable=True),
-    Column('c14', Numeric, nullable=True),
-    Column('c15', Numeric, nullable=True),
-    Column('c16', Numeric, nullable=True),
-    Column('c17', Numeric, nullable=True),
-    Column('c18', Numeric, nullable=True),
-    Column('c19', Numeric, nullable=True),
-    Column('c20', Numeric, nullable=True),
-    Column('l1', Numeric, nullable=True),
-    Column('l2', Numeric, nullable=True),
-    Column('l3', Numeric, nullable=True),
-    Column('l4', Numeric, nullable=True),
-    Column('l5', Numeric, nullable=True),
-    Column('l6', Numeric, nullable=True),
-    Column('l7', Numeric, nullable=True),
-    Column('l8', Numeric, nullable=True),
-    Column('l9', Numeric, nullable=True),
-    Column('l10', Numeric, nullable=True),
-    Column('l11', Numeric, nullable=True),
-    Column('l12', Numeric, nullable=True),
-    Column('l13', Numeric, nullable=True),
-    Column('l14', Numeric, nullable=True),
-    Column('l15', Numeric, nullable=True),
-    Column('l16', Numeric, nullable=True),
-    Column('l17', Numeric, nullable=True),
-    Column('l18', Numeric, nullable=True),
-    Column('l19', Numeric, nullable=True),
-    Column('l20', Numeric, nullable=True),
-    Column('l21', Numeric, nullable=True),
-    Column('l22', Numeric, nullable=True),
-    Column('l23', Numeric, nullable=True),
-    Column('l24', Numeric, nullable=True),
-    Column('l25', Numeric, nullable=True),
-    Column('l26', Numeric, nullable=True),
-    Column('l27', Numeric, nullable=True),
-    Column('l28', Numeric, nullable=True),
-    Column('l29', Numeric, nullable=True),
-    Column('l30', Numeric, nullable=True),
-    Column('l31', Numeric, nullable=True),
-    Column('l32', Numeric, nullable=True),
-    Column('l33', Numeric, nullable=True),
-    Column('l34', Numeric, nullable=True),
-    Column('l35', Numeric, nullable=True),
-    Column('l36', Numeric, nullable=True),
-    Column('l37', Numeric, nullable=True),
-    Column('l38', Numeric, nullable=True),
-    Column('l39', Numeric, nullable=True),
-    Column('l40', Numeric, nullable=True),
-    Column('l41', Numeric, nullable=True),
+    Column('s13', MONEY, nullable=True),
+    Column('c1', MONEY, nullable=True),
+    Column('c2', MONEY, nullable=True),
+    Column('c3', MONEY, nullable=True),
+    Column('c4', MONEY, nullable=True),
+    Column('c5', MONEY, nullable=True),
+    Column('c6', MONEY, nullable=True),
+    Column('c7', MONEY, nullable=True),
+    Column('c8', MONEY, nullable=True),
+    Column('c9', MONEY, nullable=True),
+    Column('c10', MONEY, nullable=True),
+    Column('c11', MONEY, nullable=True),
+    Column('c12', MONEY, nullable=True),
+    Column('c13', MONEY, nullable=True),
+    Column('c14', MONEY, nullable=True),
+    Column('c15', MONEY, nullable=True),
+    Column('c16', MONEY, nullable=True),
+    Column('c17', MONEY, nullable=True),
+    Column('c18', MONEY, nullable=True),
+    Column('c19', MONEY, nullable=True),
+    Column('c20', MONEY, nullable=True),
+    Column('l1', MONEY, nullable=True),
+    Column('l2', MONEY, nullable=True),
+    Column('l3', MONEY, nullable=True),
+    Column('l4', MONEY, nullable=True),
+    Column('l5', MONEY, nullable=True),
+    Column('l6', MONEY, nullable=True),
+    Column('l7', MONEY, nullable=True),
+    Column('l8', MONEY, nullable=True),
+    Column('l9', MONEY, nullable=True),
+    Column('l10', MONEY, nullable=True),
+    Column('l11', MONEY, nullable=True),
+    Column('l12', MONEY, nullable=True),
+    Column('l13', MONEY, nullable=True),
+    Column('l14', MONEY, nullable=True),
+    Column('l15', MONEY, nullable=True),
+    Column('l16', MONEY, nullable=True),
+    Column('l17', MONEY, nullable=True),
+    Column('l18', MONEY, nullable=True),
+    Column('l19', MONEY, nullable=True),
+    Column('l20', MONEY, nullable=True),
+    Column('l21', MONEY, nullable=True),
+    Column('l22', MONEY, nullable=True),
+    Column('l23', MONEY, nullable=True),
+    Column('l24', MONEY, nullable=True),
+    Column('l25', MONEY, nullable=True),
+    Column('l26', MONEY, nullable=True),
+    Column('l27', MONEY, nullable=True),
+    Column('l28', MONEY, nullable=True),
+    Column('l29', MONEY, nullable=True),
+    Column('l30', MONEY, nullable=True),
+    Column('l31', MONEY, nullable=True),
+    Column('l32', MONEY, nullable=True),
+    Column('l33', MONEY, nullable=True),
+    Column('l34', MONEY, nullable=True),
+    Column('l35', MONEY, nullable=True),
+    Column('l36', MONEY, nullable=True),
+    Column('l37', MONEY, nullable=True),
+    Column('l38', MONEY, nullable=True),
+    Column('l39', MONEY, nullable=True),
+    Column('l40', MONEY, nullable=True),
+    Column('l41', MONEY, nullable=True),
     Column('source', String(200), nullable=True),
     Column('notes', String(1000), nullable=True),
     Column('added_at', DateTime, server_default=func.now()),
+    Column('updated_at', DateTime, nullable=True),
 )
 
 
@@ -241,10 +617,124 @@ tokens = Table(
     Column('created_at', DateTime, server_default=func.now()),
 )
 
+
+# Small key/value store for instance-wide settings (e.g. the token signing secret)
+app_settings = Table(
+    'app_settings', metadata,
+    Column('key', String(100), primary_key=True),
+    Column('value', String(1000), nullable=True),
+)
+
+# Revoked signed access tokens: either one token (`jti`) or every token of a user issued before `not_before`
+revoked_tokens = Table(
+    'revoked_tokens', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('jti', String(64), nullable=True),
+    Column('user_id', Integer, nullable=True),
+    Column('not_before', DateTime, nullable=True),
+    Column('expires_at', DateTime, nullable=False),
+)
+
+# One row per table; `version` is incremented on every write so readers can build cheap ETags
+table_versions = Table(
+    'table_versions', metadata,
+    Column('table_name', String(100), primary_key=True),
+    Column('version', Integer, nullable=False, server_default='0'),
+)
+
+# Files already ingested, by content hash and church: an identical re-upload is answered from here
+upload_hashes = Table(
+    'upload_hashes', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('content_hash', String(64), nullable=False),
+    Column('church', Integer, nullable=False, server_default='0'),
+    Column('table_name', String(100), nullable=False),
+    Column('filename', String(400), nullable=True),
+    Column('uploader', String(200), nullable=True),
+    Column('inserted', Integer, nullable=False, server_default='0'),
+    Column('updated', Integer, nullable=False, server_default='0'),
+    Column('skipped', Integer, nullable=False, server_default='0'),
+    Column('created_at', DateTime, server_default=func.now()),
+    UniqueConstraint('content_hash', 'church', 'table_name', name='uq_upload_hashes_content'),
+)
+
+# Long-format copy of the sparse amount columns of members_collection, one row per non-NULL
+# amount (COLLECTION_ITEMS=1, see ensure_collection_items)
+members_collection_items = Table(
+    'members_collection_items', metadata,
+    Column('collection_id', Integer, primary_key=True),
+    Column('code_column', String(20), primary_key=True),
+    Column('amount', MONEY, nullable=False),
+    Column('s2', DateTime, nullable=True),
+    Column('church', Integer, nullable=True),
+)
+
+# Linked members_collection rows per member (see ensure_member_ledger) and their running totals
+member_ledger = Table(
+    'member_ledger', metadata,
+    Column('collection_id', Integer, primary_key=True),
+    Column('member_id', Integer, nullable=False),
+    Column('s2', DateTime, nullable=True),
+    Column('amount', MONEY, nullable=False),
+)
+
+member_balances = Table(
+    'member_balances', metadata,
+    Column('member_id', Integer, primary_key=True),
+    Column('total', MONEY, nullable=False),
+    Column('entries', Integer, nullable=False),
+)
+
+# Rows deleted from SYNC_TABLES, written by a delete trigger so `?since=` readers can drop them
+sync_tombstones = Table(
+    'sync_tombstones', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('table_name', String(100), nullable=False),
+    Column('row_id', Integer, nullable=False),
+    Column('deleted_at', DateTime, nullable=False),
+)
+
+VERSIONED_TABLES = ['church', 'members', 'members_collection', 'collection_codes', 'header_mappings', 'uploaders', 'users']
+
+
+def bump_table_version(*table_names: str) -> None:
+    """Increment the change version of the given tables. Call after the write has committed."""
+    try:
+        with engine.begin() as conn:
+            for t in table_names:
+                res = conn.execute(text('UPDATE table_versions SET version = version + 1 WHERE table_name=:t'), {'t': t})
+                if getattr(res, 'rowcount', 0) == 0:
+                    conn.execute(sql_insert(table_versions).values(table_name=t, version=1))
+    except Exception:
+        # versions are a cache hint only; never fail the write because of them
+        pass
+
+
+def table_versions_query(table_names: List[str]):
+    params = {f't{i}': t for i, t in enumerate(table_names)}
+    placeholders = ', '.join(f':{k}' for k in params)
+    return text(f'SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders})'), params
+
+
+def get_table_versions(table_names: List[str]) -> dict:
+    """Return {table_name: version} for the given tables (0 when never written)."""
+    out = {t: 0 for t in table_names}
+    if not table_names:
+        return out
+    try:
+        with engine.connect() as conn:
+            stmt, params = table_versions_query(table_names)
+            res = conn.execute(stmt, params)
+            for r in res.fetchall():
+                out[r[0]] = int(r[1] or 0)
+    except Exception:
+        pass
+    return out
+
 def create_tables():
     """Create `members` and `members_collection` tables if they do not exist."""
     ensure_db_exists()
-    metadata.create_all(engine, tables=[church, members, members_collection, collection_codes, header_mappings, uploaders, users, tokens])
+    metadata.create_all(engine, tables=[church, members, members_collection, collection_codes, header_mappings, uploaders, users, tokens, table_versions, app_settings, revoked_tokens, upload_hashes, sync_tombstones])
     # Ensure any new columns are present on existing tables (simple ALTER TABLE add column migration)
     try:
         ensure_members_collection_schema()
@@ -268,6 +758,42 @@ def create_tables():
     except Exception:
         pass
 
+    # Collections are keyed on (s1, church) so re-uploads update rows instead of duplicating them.
+    # Existing duplicates are only reported: `python -m backend.dedupe` resolves them explicitly.
+    try:
+        duplicates = members_collection_s1_duplicates()
+        if duplicates:
+            logger.warning('members_collection: %d (s1, church) keys are shared by more than one row; '
+                           'ix_members_collection_s1_church is not created until `python -m backend.dedupe --apply` '
+                           'resolves them', len(duplicates))
+        else:
+            create_members_collection_key_index()
+    except Exception:
+        pass
+
+    # updated_at / tombstone triggers for delta sync (`GET /members?since=`)
+    try:
+        ensure_change_tracking()
+    except Exception:
+        pass
+    # before the line items: they are rebuilt from the converted amounts
+    try:
+        ensure_money_storage()
+    except Exception:
+        pass
+    try:
+        ensure_collection_items()
+    except Exception:
+        pass
+    try:
+        ensure_member_ledger()
+    except Exception:
+        pass
+    try:
+        ensure_rollup_indexes()
+    except Exception:
+        pass
+
     try:
         seed_collection_codes()
     except Exception:
@@ -276,6 +802,29 @@ def create_tables():
         seed_churches()
     except Exception:
         pass
+    try:
+        seed_table_versions()
+    except Exception:
+        pass
+
+
+def seed_table_versions():
+    """Make sure every versioned table has a row in `table_versions`."""
+    ensure_db_exists()
+    with engine.connect() as conn:
+        res = conn.execute(text('SELECT table_name FROM table_versions'))
+        existing = {r[0] for r in res.fetchall()}
+        for t in VERSIONED_TABLES:
+            if t in existing:
+                continue
+            try:
+                conn.execute(sql_insert(table_versions).values(table_name=t, version=0))
+            except Exception:
+                pass
+        try:
+            conn.commit()
+        except Exception:
+            pass
 
 
 def create_uploader(name: str, church_id: Optional[int] = None) -> str:
@@ -301,14 +850,18 @@ def create_uploader(name: str, church_id: Optional[int] = None) -> str:
                     pass
             except Exception:
                 raise
+    bump_table_version('uploaders')
     return api_key
 
 
+UPLOADER_BY_KEY_SQL = 'SELECT id, name, api_key, church FROM uploaders WHERE api_key=:k'
+
+
 def get_uploader_by_key(api_key: str) -> Optional[dict]:
     ensure_db_exists()
     with engine.connect() as conn:
         try:
-            res = conn.execute(text('SELECT id, name, api_key, church FROM uploaders WHERE api_key=:k'), {'k': api_key})
+            res = conn.execute(text(UPLOADER_BY_KEY_SQL), {'k': api_key})
             row = res.fetchone()
             if not row:
                 return None
@@ -330,15 +883,10 @@ def list_uploaders() -> List[dict]:
     return out
 
 
-def _hash_password(password: str, salt: bytes) -> str:
-    dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100_000)
-    return binascii.hexlify(dk).decode('ascii')
-
-
 def create_user(username: str, password: str, church_id: Optional[int] = None, role: str = 'uploader') -> dict:
     ensure_db_exists()
     salt = os.urandom(16)
-    ph = _hash_password(password, salt)
+    ph = hash_password(password, salt)
     salt_hex = binascii.hexlify(salt).decode('ascii')
     with engine.connect() as conn:
         conn.execute(sql_insert(users).values(username=username, password_hash=ph, salt=salt_hex, church=church_id, role=role))
@@ -350,7 +898,8 @@ def create_user(username: str, password: str, church_id: Optional[int] = None, r
         row = res.fetchone()
         if not row:
             raise RuntimeError('Failed to create user')
-        return {'id': row[0], 'username': row[1], 'church': row[2], 'role': row[3]}
+    bump_table_version('users')
+    return {'id': row[0], 'username': row[1], 'church': row[2], 'role': row[3]}
 
 
 def verify_user(username: str, password: str) -> Optional[dict]:
@@ -358,20 +907,45 @@ def verify_user(username: str, password: str) -> Optional[dict]:
     with engine.connect() as conn:
         res = conn.execute(text('SELECT id, username, password_hash, salt, church, role FROM users WHERE username=:u'), {'u': username})
         row = res.fetchone()
-        if not row:
-            return None
-        salt = binascii.unhexlify(row[3])
-        ph = _hash_password(password, salt)
-        if ph == row[2]:
-            return {'id': row[0], 'username': row[1], 'church': row[4], 'role': row[5]}
+    if not row:
         return None
+    salt = binascii.unhexlify(row[3])
+    if not check_password(password, salt, row[2]):
+        return None
+    if needs_rehash(row[2]):
+        # upgrade legacy / old-cost hashes to the configured cost while we know the password
+        try:
+            with engine.begin() as conn:
+                conn.execute(text('UPDATE users SET password_hash=:ph WHERE id=:id'), {'ph': hash_password(password, salt), 'id': row[0]})
+        except Exception:
+            pass
+    return {'id': row[0], 'username': row[1], 'church': row[4], 'role': row[5]}
+
+
+def update_user_account(user_id: int, username: str, church_id: Optional[int], role: str, password: Optional[str] = None) -> None:
+    """Update a user's username/church/role and, when given, set a new password (fresh salt)."""
+    ensure_db_exists()
+    params = {'u': username, 'c': church_id, 'r': role, 'id': user_id}
+    if password:
+        salt = os.urandom(16)
+        params['ph'] = hash_password(password, salt)
+        params['s'] = binascii.hexlify(salt).decode('ascii')
+        stmt = 'UPDATE users SET username=:u, password_hash=:ph, salt=:s, church=:c, role=:r WHERE id=:id'
+    else:
+        stmt = 'UPDATE users SET username=:u, church=:c, role=:r WHERE id=:id'
+    with engine.begin() as conn:
+        conn.execute(text(stmt), params)
+    bump_table_version('users')
 
 
 def create_token_for_user(user_id: int) -> str:
+    """Create a legacy opaque token stored in `tokens`. Logins now issue signed tokens (see access_tokens.py)."""
     ensure_db_exists()
     tok = uuid.uuid4().hex
     with engine.connect() as conn:
-        conn.execute(sql_insert(tokens).values(token=tok, user_id=user_id))
+        # stamped in UTC here: the server default is local time on a non-UTC PostgreSQL server,
+        # while expiry and purge compare against datetime.utcnow()
+        conn.execute(sql_insert(tokens).values(token=tok, user_id=user_id, created_at=datetime.utcnow()))
         try:
             conn.commit()
         except Exception:
@@ -379,49 +953,106 @@ def create_token_for_user(user_id: int) -> str:
     return tok
 
 
+USER_BY_TOKEN_SQL = 'SELECT t.created_at, u.id, u.username, u.church, u.role FROM tokens t JOIN users u ON t.user_id = u.id WHERE t.token = :tok'
+
+
+def _user_from_token_row(row) -> Optional[dict]:
+    """Turn a USER_BY_TOKEN_SQL row into a user dict, or None if the token has expired."""
+    if not row:
+        return None
+    created_at = row[0]
+    try:
+        # created_at may already be a datetime; if string, parse it
+        if isinstance(created_at, str):
+            created_dt = datetime.fromisoformat(created_at)
+        else:
+            created_dt = created_at
+    except Exception:
+        created_dt = None
+
+    # Enforce 1-hour expiry for tokens
+    if created_dt is not None:
+        if datetime.utcnow() - created_dt > timedelta(hours=1):
+            # token expired
+            return None
+
+    return {'id': row[1], 'username': row[2], 'church': row[3], 'role': row[4]}
+
+
 def get_user_by_token(token: str) -> Optional[dict]:
     ensure_db_exists()
     with engine.connect() as conn:
-        res = conn.execute(text('SELECT t.created_at, u.id, u.username, u.church, u.role FROM tokens t JOIN users u ON t.user_id = u.id WHERE t.token = :tok'), {'tok': token})
+        res = conn.execute(text(USER_BY_TOKEN_SQL), {'tok': token})
+        return _user_from_token_row(res.fetchone())
+
+
+def delete_token(token: str) -> None:
+    """Remove a legacy opaque token (logout)."""
+    ensure_db_exists()
+    with engine.begin() as conn:
+        conn.execute(tokens.delete().where(tokens.c.token == token))
+
+
+def purge_expired_tokens(max_age: timedelta = timedelta(hours=1)) -> int:
+    """Delete `tokens` rows older than `max_age` and revocations that have expired. Returns rows removed."""
+    ensure_db_exists()
+    now = datetime.utcnow()
+    removed = 0
+    with engine.begin() as conn:
+        res = conn.execute(tokens.delete().where(tokens.c.created_at < now - max_age))
+        removed += res.rowcount or 0
+        res = conn.execute(revoked_tokens.delete().where(revoked_tokens.c.expires_at < now))
+        removed += res.rowcount or 0
+    return removed
+
+
+def get_setting(key: str) -> Optional[str]:
+    with engine.connect() as conn:
+        res = conn.execute(text('SELECT value FROM app_settings WHERE key=:k'), {'k': key})
         row = res.fetchone()
-        if not row:
-            return None
-        created_at = row[0]
-        try:
-            # created_at may already be a datetime; if string, parse it
-            if isinstance(created_at, str):
-                created_dt = datetime.fromisoformat(created_at)
-            else:
-                created_dt = created_at
-        except Exception:
-            created_dt = None
+        return row[0] if row else None
 
-        # Enforce 1-hour expiry for tokens
-        if created_dt is not None:
-            if datetime.utcnow() - created_dt > timedelta(hours=1):
-                # token expired
-                return None
 
-        return {'id': row[1], 'username': row[2], 'church': row[3], 'role': row[4]}
+def set_setting(key: str, value: str) -> None:
+    with engine.begin() as conn:
+        res = conn.execute(text('UPDATE app_settings SET value=:v WHERE key=:k'), {'k': key, 'v': value})
+        if getattr(res, 'rowcount', 0) == 0:
+            conn.execute(sql_insert(app_settings).values(key=key, value=value))
 
 
-def seed_collection_codes():
-    """Seed `collection_codes` with default mappings if table is empty."""
+def get_or_create_setting(key: str, factory) -> str:
+    """Return the stored value for `key`, creating it with `factory()` if missing.
+
+    Safe when several workers race: the first insert wins and everyone reads it back.
+    """
+    value = get_setting(key)
+    if value is not None:
+        return value
+    try:
+        with engine.begin() as conn:
+            conn.execute(sql_insert(app_settings).values(key=key, value=factory()))
+    except SQLAlchemyError:
+        # another worker inserted it first
+        pass
+    return get_setting(key)
+
+
+def add_token_revocation(expires_at: datetime, jti: Optional[str] = None, user_id: Optional[int] = None, not_before: Optional[datetime] = None) -> None:
     ensure_db_exists()
-    inspector = inspect(engine)
-    if 'collection_codes' not in inspector.get_table_names():
-        return
-    # Check if already seeded
+    with engine.begin() as conn:
+        conn.execute(sql_insert(revoked_tokens).values(jti=jti, user_id=user_id, not_before=not_before, expires_at=expires_at))
+
+
+def list_token_revocations() -> List[dict]:
+    """Return revocations that have not expired yet (the list stays small: entries live at most one token lifetime)."""
+    now = datetime.utcnow()
     with engine.connect() as conn:
-        res = conn.execute(text("SELECT COUNT(*) FROM collection_codes"))
-        try:
-            count = res.scalar()
-        except Exception:
-            row = res.fetchone()
-            count = row[0] if row else 0
-        if count and int(count) > 0:
-            return
+        res = conn.execute(revoked_tokens.select().where(revoked_tokens.c.expires_at >= now))
+        return [dict(r._mapping) for r in res.fetchall()]
 
+
+def default_collection_codes() -> List[tuple]:
+    """Default `(column_name, code)` labels for members_collection columns, as seeded into `collection_codes`."""
     # Mapping based on provided spec
     mapping = [
         ('s1','Sno'),
@@ -469,6 +1100,27 @@ def seed_collection_codes():
     # Ensure length 41 by padding if necessary
     for idx, label in enumerate(l_labels, start=1):
         mapping.append((f'l{idx}', label))
+    return mapping
+
+
+def seed_collection_codes():
+    """Seed `collection_codes` with default mappings if table is empty."""
+    ensure_db_exists()
+    inspector = inspect(engine)
+    if 'collection_codes' not in inspector.get_table_names():
+        return
+    # Check if already seeded
+    with engine.connect() as conn:
+        res = conn.execute(text("SELECT COUNT(*) FROM collection_codes"))
+        try:
+            count = res.scalar()
+        except Exception:
+            row = res.fetchone()
+            count = row[0] if row else 0
+        if count and int(count) > 0:
+            return
+
+    mapping = default_collection_codes()
 
     # Insert mapping
     with engine.connect() as conn:
@@ -481,6 +1133,7 @@ def seed_collection_codes():
             conn.commit()
         except Exception:
             pass
+    bump_table_version('collection_codes')
 
 
 def ensure_members_collection_schema():
@@ -510,6 +1163,9 @@ def ensure_members_collection_schema():
     # l1..l41
     for i in range(1,42):
         expected[f'l{i}'] = 'NUMERIC'
+    if money.MINOR:
+        for c in money.MONEY_COLUMNS['members_collection']:
+            expected[c] = 'BIGINT'
     # other text fields
     expected['source'] = 'TEXT'
     expected['notes'] = 'TEXT'
@@ -538,6 +1194,551 @@ def ensure_members_collection_schema():
             except Exception:
                 # some dialects/engines auto-commit
                 pass
+    invalidate_columns_cache('members_collection')
+
+
+# Tables whose rows carry a trigger-maintained `updated_at` and leave tombstones when deleted
+SYNC_TABLES = ('members', 'members_collection')
+# A `since` cursor is re-read this far back so rows committed late by a concurrent writer are not missed
+SYNC_OVERLAP_SECONDS = float(os.getenv('SYNC_OVERLAP_SECONDS', '5'))
+# Tombstones older than this are purged; an older cursor gets a full resync (`reset`)
+SYNC_TOMBSTONE_DAYS = float(os.getenv('SYNC_TOMBSTONE_DAYS', '30'))
+# `app_settings` key set by migrate.py when it replaces a table: its triggers and tombstones are
+# gone with it, so a cursor older than that stamp can only be answered with a full snapshot
+SYNC_RESET_KEY = 'sync_reset:{table}'
+
+
+def _sync_now_sql() -> str:
+    """SQL for the current UTC time (on SQLite, text in the format cursors use)."""
+    if engine.dialect.name == 'postgresql':
+        return "(clock_timestamp() AT TIME ZONE 'UTC')"
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def _sync_stamp(dt: datetime) -> str:
+    return dt.strftime('%Y-%m-%d %H:%M:%S.') + f'{dt.microsecond // 1000:03d}'
+
+
+def ensure_change_tracking():
+    """Add `updated_at` to SYNC_TABLES and install the triggers that maintain it and record deletes."""
+    inspector = inspect(engine)
+    tables = [t for t in SYNC_TABLES if t in inspector.get_table_names()]
+    now = _sync_now_sql()
+    postgres = engine.dialect.name == 'postgresql'
+    with engine.begin() as conn:
+        for t in tables:
+            if 'updated_at' not in {c['name'] for c in inspector.get_columns(t)}:
+                conn.execute(text(f"ALTER TABLE {t} ADD COLUMN updated_at {'TIMESTAMP' if postgres else 'DATETIME'}"))
+            # existing rows count as changed now: every client's first sync is a full one anyway
+            conn.execute(text(f'UPDATE {t} SET updated_at = {now} WHERE updated_at IS NULL'))
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{t}_updated_at ON {t}(updated_at)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_sync_tombstones_table_deleted ON sync_tombstones(table_name, deleted_at)'))
+        if postgres:
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION ksc_touch_updated_at() RETURNS trigger AS $$
+                BEGIN NEW.updated_at := {now}; RETURN NEW; END $$ LANGUAGE plpgsql"""))
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION ksc_record_tombstone() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO sync_tombstones (table_name, row_id, deleted_at) VALUES (TG_TABLE_NAME, OLD.id, {now});
+                    RETURN OLD;
+                END $$ LANGUAGE plpgsql"""))
+            for t in tables:
+                conn.execute(text(f'DROP TRIGGER IF EXISTS {t}_touch ON {t}'))
+                conn.execute(text(f'CREATE TRIGGER {t}_touch BEFORE INSERT OR UPDATE ON {t} FOR EACH ROW EXECUTE FUNCTION ksc_touch_updated_at()'))
+                conn.execute(text(f'DROP TRIGGER IF EXISTS {t}_tombstone ON {t}'))
+                conn.execute(text(f'CREATE TRIGGER {t}_tombstone AFTER DELETE ON {t} FOR EACH ROW EXECUTE FUNCTION ksc_record_tombstone()'))
+            return
+        for t in tables:
+            # SQLite cannot assign NEW in a trigger: stamp the row right after the write instead.
+            # The WHEN clauses skip writes that set updated_at themselves, including these stamps;
+            # a write that sets it to NULL is stamped too. Recreated so older definitions are replaced.
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {t}_touch_insert'))
+            conn.execute(text(f"""
+                CREATE TRIGGER {t}_touch_insert AFTER INSERT ON {t} WHEN NEW.updated_at IS NULL
+                BEGIN UPDATE {t} SET updated_at = {now} WHERE id = NEW.id; END"""))
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {t}_touch_update'))
+            conn.execute(text(f"""
+                CREATE TRIGGER {t}_touch_update AFTER UPDATE ON {t}
+                WHEN NEW.updated_at IS OLD.updated_at OR NEW.updated_at IS NULL
+                BEGIN UPDATE {t} SET updated_at = {now} WHERE id = NEW.id; END"""))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {t}_tombstone AFTER DELETE ON {t}
+                BEGIN INSERT INTO sync_tombstones (table_name, row_id, deleted_at) VALUES ('{t}', OLD.id, {now}); END"""))
+    for t in tables:
+        invalidate_columns_cache(t)
+
+
+def purge_tombstones(days: float = SYNC_TOMBSTONE_DAYS) -> None:
+    """Delete tombstones older than `days`."""
+    ensure_db_exists()
+    cutoff = _sync_stamp(datetime.utcnow() - timedelta(days=days))
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM sync_tombstones WHERE deleted_at < :cutoff'), {'cutoff': cutoff})
+
+
+COLLECTION_ITEMS = os.getenv('COLLECTION_ITEMS', '0').lower() in ('1', 'true', 'yes', 'on')
+# The sparse per-code amount columns of members_collection (labels live in collection_codes)
+AMOUNT_COLUMNS = [f'c{i}' for i in range(1, 21)] + [f'l{i}' for i in range(1, 42)]
+_ITEM_TRIGGERS = ('members_collection_items_insert', 'members_collection_items_update', 'members_collection_items_delete')
+
+
+def _items_select(prefix: str) -> str:
+    """`SELECT` of (collection_id, code_column, amount, s2, church) for every non-NULL amount of one row."""
+    amounts = ' UNION ALL '.join(f"SELECT '{c}' AS code_column, {prefix}.{c} AS amount" for c in AMOUNT_COLUMNS)
+    return (f'SELECT {prefix}.id, a.code_column, a.amount, {prefix}.s2, {prefix}.church '
+            f'FROM ({amounts}) a WHERE a.amount IS NOT NULL')
+
+
+def _drop_foreign_keys(table_name: str):
+    """Drop the foreign keys of a derived table created before they were removed from its schema.
+
+    Rebuildable tables carry no foreign keys, so replacing members or members_collection (see
+    migrate.copy_table) is not blocked by rows that are recomputed from them anyway.
+    """
+    if engine.dialect.name != 'postgresql':
+        # SQLite does not enforce them (foreign_keys pragma is off) and cannot drop them in place
+        return
+    inspector = inspect(engine)
+    if table_name not in inspector.get_table_names():
+        return
+    names = [fk['name'] for fk in inspector.get_foreign_keys(table_name) if fk.get('name')]
+    with engine.begin() as conn:
+        for name in names:
+            conn.execute(text(f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{name}"'))
+
+
+def ensure_collection_items():
+    """Keep `members_collection_items` and the `members_collection_wide` view in step with COLLECTION_ITEMS.
+
+    When enabled, the table is (re)built from the wide columns whenever its triggers are missing,
+    then triggers keep it current on every insert, update and delete of members_collection. When
+    disabled, the triggers and the view are dropped; the table is left for the next rebuild.
+    """
+    inspector = inspect(engine)
+    if 'members_collection' not in inspector.get_table_names():
+        return
+    postgres = engine.dialect.name == 'postgresql'
+    if postgres:
+        installed = {r[0] for r in _fetch_rows("SELECT tgname FROM pg_trigger WHERE tgrelid = 'members_collection'::regclass")}
+    else:
+        installed = {r[0] for r in _fetch_rows("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'members_collection'")}
+    if not COLLECTION_ITEMS:
+        with engine.begin() as conn:
+            conn.execute(text('DROP VIEW IF EXISTS members_collection_wide'))
+            for name in _ITEM_TRIGGERS:
+                if name in installed:
+                    conn.execute(text(f'DROP TRIGGER {name} ON members_collection' if postgres else f'DROP TRIGGER {name}'))
+        return
+    metadata.create_all(engine, tables=[members_collection_items])
+    _drop_foreign_keys('members_collection_items')
+    existing = {c['name'] for c in inspector.get_columns('members_collection')}
+    amounts = [c for c in AMOUNT_COLUMNS if c in existing]
+    with engine.begin() as conn:
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_members_collection_items_code_s2 ON members_collection_items(code_column, s2)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_members_collection_items_s2 ON members_collection_items(s2)'))
+        if not all(name in installed for name in _ITEM_TRIGGERS):
+            # rows written while the triggers were off are unknown: rebuild from the wide columns
+            conn.execute(text('DELETE FROM members_collection_items'))
+            for c in amounts:
+                conn.execute(text(f"INSERT INTO members_collection_items (collection_id, code_column, amount, s2, church) "
+                                  f"SELECT id, '{c}', {c}, s2, church FROM members_collection WHERE {c} IS NOT NULL"))
+            insert = f'INSERT INTO members_collection_items (collection_id, code_column, amount, s2, church) {_items_select("NEW")}'
+            delete = 'DELETE FROM members_collection_items WHERE collection_id = OLD.id'
+            if postgres:
+                conn.execute(text(f"""
+                    CREATE OR REPLACE FUNCTION ksc_sync_collection_items() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP <> 'INSERT' THEN {delete}; END IF;
+                        IF TG_OP <> 'DELETE' THEN {insert}; END IF;
+                        RETURN NULL;
+                    END $$ LANGUAGE plpgsql"""))
+                for name, event in zip(_ITEM_TRIGGERS, ('INSERT', 'UPDATE', 'DELETE')):
+                    conn.execute(text(f'DROP TRIGGER IF EXISTS {name} ON members_collection'))
+                    conn.execute(text(f'CREATE TRIGGER {name} AFTER {event} ON members_collection FOR EACH ROW EXECUTE FUNCTION ksc_sync_collection_items()'))
+            else:
+                # only rewrite a row's items when an amount, its date or its church changed (not on updated_at stamps)
+                changed = ' OR '.join(f'NEW.{c} IS NOT OLD.{c}' for c in amounts + ['s2', 'church'])
+                for name in _ITEM_TRIGGERS:
+                    conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+                conn.execute(text(f'CREATE TRIGGER {_ITEM_TRIGGERS[0]} AFTER INSERT ON members_collection BEGIN {insert}; END'))
+                conn.execute(text(f'CREATE TRIGGER {_ITEM_TRIGGERS[1]} AFTER UPDATE ON members_collection WHEN {changed} '
+                                  f'BEGIN {delete}; {insert}; END'))
+                conn.execute(text(f'CREATE TRIGGER {_ITEM_TRIGGERS[2]} AFTER DELETE ON members_collection BEGIN {delete}; END'))
+        # the wide shape rebuilt from the items, so readers do not depend on the amount columns
+        q = engine.dialect.identifier_preparer.quote
+        select_list = ', '.join(f'p.{c}' if c in AMOUNT_COLUMNS else f'mc.{q(c)}' for c in get_target_columns('members_collection'))
+        pivot = ', '.join(f"MAX(CASE WHEN code_column = '{c}' THEN amount END) AS {c}" for c in amounts)
+        conn.execute(text('DROP VIEW IF EXISTS members_collection_wide'))
+        conn.execute(text(f'CREATE VIEW members_collection_wide AS SELECT {select_list} '
+                          f'FROM members_collection mc LEFT JOIN (SELECT collection_id, {pivot} FROM members_collection_items '
+                          f'GROUP BY collection_id) p ON p.collection_id = mc.id'))
+
+
+def ensure_money_storage():
+    """Convert stored amounts of money.STORED_TABLES whose recorded mode differs from MONEY_STORAGE.
+
+    SQLite rewrites the values in place; PostgreSQL changes the column type with a USING
+    expression. The line-item and ledger triggers are dropped first so `ensure_collection_items`
+    and `ensure_member_ledger` rebuild from the converted values.
+    """
+    inspector = inspect(engine)
+    target = money.storage_mode()
+    new_scale = money.mode_scale(target)
+    postgres = engine.dialect.name == 'postgresql'
+    for t in money.STORED_TABLES:
+        if t not in inspector.get_table_names():
+            continue
+        key = money.SETTING_KEY.format(table=t)
+        current = get_setting(key) or 'decimal'
+        if current == target:
+            continue
+        old_scale = money.mode_scale(current)
+        existing = {c['name'] for c in inspector.get_columns(t)}
+        cols = [c for c in money.MONEY_COLUMNS[t] if c in existing]
+        with engine.begin() as conn:
+            # views over the table block ALTER COLUMN TYPE; both are recreated on demand
+            conn.execute(text('DROP VIEW IF EXISTS members_collection_wide'))
+            conn.execute(text('DROP VIEW IF EXISTS members_view'))
+            for name in _ITEM_TRIGGERS + _LEDGER_TRIGGERS:
+                on = 'members' if name == 'members_ledger_link' else 'members_collection'
+                conn.execute(text(f'DROP TRIGGER IF EXISTS {name} ON {on}' if postgres else f'DROP TRIGGER IF EXISTS {name}'))
+            assignments = []
+            for c in cols:
+                major = c if old_scale is None else (f'(CAST({c} AS NUMERIC) / {old_scale})' if postgres else f'({c} / {old_scale}.0)')
+                expr = major if new_scale is None else f'CAST(ROUND({major} * {new_scale}) AS BIGINT)'
+                if postgres:
+                    conn.execute(text(f"ALTER TABLE {t} ALTER COLUMN {c} TYPE {'NUMERIC' if new_scale is None else 'BIGINT'} USING {expr}"))
+                else:
+                    assignments.append(f'{c} = {expr}')
+            if assignments:
+                conn.execute(text(f'UPDATE {t} SET {", ".join(assignments)}'))
+            res = conn.execute(text('UPDATE app_settings SET value=:v WHERE key=:k'), {'k': key, 'v': target})
+            if not res.rowcount:
+                conn.execute(sql_insert(app_settings).values(key=key, value=target))
+        invalidate_columns_cache(t)
+        bump_table_version(t)
+
+
+# The members_collection column that counts towards a member's pledge (s7 = JUMLA, the receipt total)
+PLEDGE_AMOUNT_COLUMN = os.getenv('PLEDGE_AMOUNT_COLUMN', 's7')
+_LEDGER_TRIGGERS = ('members_collection_ledger_insert', 'members_collection_ledger_update',
+                    'members_collection_ledger_delete', 'members_ledger_link')
+
+
+def ensure_member_ledger():
+    """Install the triggers that keep `member_ledger` and `member_balances` current.
+
+    A members_collection row belongs to the member in `member_id`, or else to the member whose
+    `sno` equals its `s3`, and contributes its PLEDGE_AMOUNT_COLUMN. Both tables are rebuilt
+    when the triggers are missing or the amount column changed; after that every insert,
+    update and delete adjusts the entry and the member's total. A member created after their
+    collection rows picks them up when inserted.
+    """
+    inspector = inspect(engine)
+    names = inspector.get_table_names()
+    if 'members_collection' not in names or 'members' not in names:
+        return
+    col = PLEDGE_AMOUNT_COLUMN
+    if col not in AMOUNT_COLUMNS + ['s6', 's7', 's8', 's9', 's13']:
+        raise ValueError(f"PLEDGE_AMOUNT_COLUMN is not an amount column: {col}")
+    postgres = engine.dialect.name == 'postgresql'
+    if postgres:
+        installed = {r[0] for r in _fetch_rows("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal")}
+    else:
+        installed = {r[0] for r in _fetch_rows("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    if all(name in installed for name in _LEDGER_TRIGGERS) and get_setting('member_ledger_column') == col:
+        _drop_foreign_keys('member_ledger')
+        _drop_foreign_keys('member_balances')
+        return
+
+    ledger_insert = (f'INSERT INTO member_ledger (collection_id, member_id, s2, amount) '
+                     f'SELECT NEW.id, m.id, NEW.s2, NEW.{col} FROM members m WHERE NEW.{col} IS NOT NULL '
+                     f'AND m.id = COALESCE(NEW.member_id, (SELECT id FROM members WHERE sno = NEW.s3))')
+    ledger_delete = 'DELETE FROM member_ledger WHERE collection_id = OLD.id'
+    with engine.begin() as conn:
+        for name in _LEDGER_TRIGGERS:
+            on = 'members' if name == 'members_ledger_link' else 'members_collection'
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {name} ON {on}' if postgres else f'DROP TRIGGER IF EXISTS {name}'))
+        # derived data: recreate so the amount types follow MONEY_STORAGE
+        conn.execute(text('DROP TABLE IF EXISTS member_balances'))
+        conn.execute(text('DROP TABLE IF EXISTS member_ledger'))
+        metadata.create_all(conn, tables=[member_ledger, member_balances])
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_member_ledger_member_s2 ON member_ledger(member_id, s2)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_members_collection_s3 ON members_collection(s3)'))
+        conn.execute(text(f'INSERT INTO member_ledger (collection_id, member_id, s2, amount) '
+                          f'SELECT mc.id, mc.member_id, mc.s2, mc.{col} FROM members_collection mc JOIN members m ON m.id = mc.member_id '
+                          f'WHERE mc.{col} IS NOT NULL'))
+        conn.execute(text(f'INSERT INTO member_ledger (collection_id, member_id, s2, amount) '
+                          f'SELECT mc.id, m.id, mc.s2, mc.{col} FROM members_collection mc JOIN members m ON m.sno = mc.s3 '
+                          f'WHERE mc.member_id IS NULL AND mc.{col} IS NOT NULL'))
+        conn.execute(text('INSERT INTO member_balances (member_id, total, entries) '
+                          'SELECT member_id, SUM(amount), COUNT(*) FROM member_ledger GROUP BY member_id'))
+        if postgres:
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION ksc_member_ledger() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP <> 'INSERT' THEN
+                        UPDATE member_balances b SET total = b.total - l.amount, entries = b.entries - 1
+                            FROM member_ledger l WHERE l.collection_id = OLD.id AND b.member_id = l.member_id;
+                        {ledger_delete};
+                    END IF;
+                    IF TG_OP <> 'DELETE' THEN
+                        {ledger_insert};
+                        INSERT INTO member_balances (member_id, total, entries)
+                            SELECT member_id, amount, 1 FROM member_ledger WHERE collection_id = NEW.id
+                            ON CONFLICT (member_id) DO UPDATE SET total = member_balances.total + EXCLUDED.total,
+                                                                  entries = member_balances.entries + 1;
+                    END IF;
+                    RETURN NULL;
+                END $$ LANGUAGE plpgsql"""))
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION ksc_member_ledger_link() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO member_ledger (collection_id, member_id, s2, amount)
+                        SELECT mc.id, NEW.id, mc.s2, mc.{col} FROM members_collection mc
+                        WHERE mc.member_id IS NULL AND mc.s3 = NEW.sno AND mc.{col} IS NOT NULL
+                        ON CONFLICT (collection_id) DO NOTHING;
+                    INSERT INTO member_balances (member_id, total, entries)
+                        SELECT member_id, SUM(amount), COUNT(*) FROM member_ledger WHERE member_id = NEW.id GROUP BY member_id
+                        ON CONFLICT (member_id) DO UPDATE SET total = EXCLUDED.total, entries = EXCLUDED.entries;
+                    RETURN NULL;
+                END $$ LANGUAGE plpgsql"""))
+            for name, event in zip(_LEDGER_TRIGGERS[:3], ('INSERT', 'UPDATE', 'DELETE')):
+                conn.execute(text(f'CREATE TRIGGER {name} AFTER {event} ON members_collection FOR EACH ROW EXECUTE FUNCTION ksc_member_ledger()'))
+            conn.execute(text('CREATE TRIGGER members_ledger_link AFTER INSERT ON members FOR EACH ROW '
+                              'WHEN (NEW.sno IS NOT NULL) EXECUTE FUNCTION ksc_member_ledger_link()'))
+        else:
+            balance_add = ('INSERT INTO member_balances (member_id, total, entries) '
+                           'SELECT member_id, amount, 1 FROM member_ledger WHERE collection_id = NEW.id '
+                           'ON CONFLICT (member_id) DO UPDATE SET total = total + excluded.total, entries = entries + 1')
+            balance_sub = ('UPDATE member_balances SET total = total - (SELECT amount FROM member_ledger WHERE collection_id = OLD.id), '
+                           'entries = entries - 1 WHERE member_id = (SELECT member_id FROM member_ledger WHERE collection_id = OLD.id)')
+            changed = ' OR '.join(f'NEW.{c} IS NOT OLD.{c}' for c in ('member_id', 's3', 's2', col))
+            conn.execute(text(f'CREATE TRIGGER {_LEDGER_TRIGGERS[0]} AFTER INSERT ON members_collection '
+                              f'BEGIN {ledger_insert}; {balance_add}; END'))
+            conn.execute(text(f'CREATE TRIGGER {_LEDGER_TRIGGERS[1]} AFTER UPDATE ON members_collection WHEN {changed} '
+                              f'BEGIN {balance_sub}; {ledger_delete}; {ledger_insert}; {balance_add}; END'))
+            conn.execute(text(f'CREATE TRIGGER {_LEDGER_TRIGGERS[2]} AFTER DELETE ON members_collection '
+                              f'BEGIN {balance_sub}; {ledger_delete}; END'))
+            conn.execute(text(f"""
+                CREATE TRIGGER members_ledger_link AFTER INSERT ON members WHEN NEW.sno IS NOT NULL
+                BEGIN
+                    INSERT OR IGNORE INTO member_ledger (collection_id, member_id, s2, amount)
+                        SELECT mc.id, NEW.id, mc.s2, mc.{col} FROM members_collection mc
+                        WHERE mc.member_id IS NULL AND mc.s3 = NEW.sno AND mc.{col} IS NOT NULL;
+                    INSERT INTO member_balances (member_id, total, entries)
+                        SELECT member_id, SUM(amount), COUNT(*) FROM member_ledger WHERE member_id = NEW.id GROUP BY member_id
+                        ON CONFLICT (member_id) DO UPDATE SET total = excluded.total, entries = excluded.entries;
+                END"""))
+        res = conn.execute(text("UPDATE app_settings SET value=:v WHERE key='member_ledger_column'"), {'v': col})
+        if not res.rowcount:
+            conn.execute(sql_insert(app_settings).values(key='member_ledger_column', value=col))
+
+
+def member_ledger_entries(member_id: int, limit: int = 100, offset: int = 0) -> List[dict]:
+    """A member's ledger in date order with the running balance after each entry."""
+    ensure_db_exists()
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            'SELECT collection_id, s2, amount, balance FROM ('
+            '  SELECT collection_id, s2, amount, SUM(amount) OVER (ORDER BY s2, collection_id) AS balance'
+            '  FROM member_ledger WHERE member_id = :m) l '
+            'ORDER BY s2, collection_id LIMIT :limit OFFSET :offset').columns(s2=DateTime),
+            {'m': member_id, 'limit': limit, 'offset': offset}).mappings().all()
+    return [dict(r, amount=money.amount_from_storage(r['amount']), balance=money.amount_from_storage(r['balance']))
+            for r in rows]
+
+
+def pledge_progress(member_id: Optional[int] = None, church: Optional[int] = None, group: Optional[str] = None) -> List[dict]:
+    """Pledge, amount given so far, remainder and percentage per member, in one query.
+
+    Filter by `member_id`, `church` and/or `GROUP_NAME` (`group`); members without a pledge
+    or contributions are included with zeros.
+    """
+    ensure_db_exists()
+    where, params = [], {}
+    for column, value in (('id', member_id), ('church', church), ('"GROUP_NAME"', group)):
+        if value is not None:
+            where.append(f'm.{column} = :{len(params)}p')
+            params[f'{len(params)}p'] = value
+    sql = ('SELECT m.id AS member_id, m.sno, m."MEMBER_NAME" AS member_name, m.church, m."GROUP_NAME" AS group_name, '
+           'm.pledge, COALESCE(b.total, 0) AS paid, COALESCE(b.entries, 0) AS contributions, '
+           '(SELECT MAX(l.s2) FROM member_ledger l WHERE l.member_id = m.id) AS last_contribution '
+           'FROM members m LEFT JOIN member_balances b ON b.member_id = m.id')
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql + ' ORDER BY m.id').columns(last_contribution=DateTime), params).mappings().all()
+    out = []
+    for r in rows:
+        r = dict(r)
+        pledge = money.amount_from_storage(r['pledge'])
+        paid = money.amount_from_storage(r['paid'])
+        r['pledge'], r['paid'] = pledge, paid
+        r['remaining'] = max(pledge - paid, 0) if pledge else None
+        r['percent'] = round(float(paid) * 100 / float(pledge), 1) if pledge else None
+        out.append(r)
+    return out
+
+
+def ensure_rollup_indexes():
+    """Indexes behind `contribution_rollups`: ledger entries by date, members by church and hierarchy."""
+    names = inspect(engine).get_table_names()
+    if 'member_ledger' not in names:
+        return
+    with engine.begin() as conn:
+        # covering: a date-range scan reads member and amount without visiting the table
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_member_ledger_s2_member ON member_ledger(s2, member_id, amount)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_members_church_hierarchy '
+                          'ON members(church, "GROUP_NAME", "GROUP_LEADER_ID", "FAMILY_ID")'))
+
+
+def contribution_rollups(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                         church: Optional[int] = None) -> dict:
+    """Ledger totals over s2 in [start, end], rolled up GROUP_NAME > GROUP_LEADER_ID > FAMILY_ID.
+
+    One GROUP BY over `member_ledger` joined to members (filtered on the member's church) gives
+    the family level; the leader and group levels and the grand total are summed from it.
+    Each level has `total`, `contributions` (ledger entries) and `members` (distinct contributors).
+    """
+    from sqlalchemy import select
+    ensure_db_exists()
+    l, m = member_ledger, members
+    keys = (m.c.GROUP_NAME, m.c.GROUP_LEADER_ID, m.c.FAMILY_ID)
+    stmt = (select(*keys, func.sum(l.c.amount), func.count(), func.count(l.c.member_id.distinct()))
+            .select_from(l.join(m, m.c.id == l.c.member_id))
+            .group_by(*keys))
+    if start is not None:
+        stmt = stmt.where(l.c.s2 >= start)
+    if end is not None:
+        stmt = stmt.where(l.c.s2 <= end)
+    if church is not None:
+        stmt = stmt.where(m.c.church == church)
+    with engine.connect() as conn:
+        rows = conn.execute(stmt).fetchall()
+
+    def level(**labels):
+        return {**labels, 'total': 0, 'contributions': 0, 'members': 0}
+
+    def add(node, total, n, people):
+        node['total'] += total
+        node['contributions'] += n
+        node['members'] += people
+
+    root = level()
+    groups = {}
+    for group_name, leader_id, family_id, total, n, people in rows:
+        total = total or 0
+        group = groups.setdefault(group_name, level(group_name=group_name, leaders={}))
+        leader = group['leaders'].setdefault(leader_id, level(group_leader_id=leader_id, families=[]))
+        leader['families'].append({'family_id': family_id, 'total': total, 'contributions': n, 'members': people})
+        # families partition members, so distinct contributors add up along the hierarchy
+        for node in (leader, group, root):
+            add(node, total, n, people)
+
+    def finish(node):
+        if money.MINOR:
+            node['total'] = money.from_minor(node['total'])
+        for child in ('leaders', 'families'):
+            if child in node:
+                items = node[child].values() if isinstance(node[child], dict) else node[child]
+                node[child] = sorted((finish(c) for c in items), key=lambda c: c['total'], reverse=True)
+        return node
+
+    root['groups'] = sorted((finish(g) for g in groups.values()), key=lambda g: g['total'], reverse=True)
+    return finish(root)
+
+
+def _fetch_rows(sql: str) -> list:
+    with engine.connect() as conn:
+        return conn.execute(text(sql)).fetchall()
+
+
+def collection_totals(start: Optional[datetime] = None, end: Optional[datetime] = None, church: Optional[int] = None) -> List[dict]:
+    """Sum and count of each amount column over members_collection rows with s2 in [start, end].
+
+    With MONEY_STORAGE=minor the sums are exact integer sums, converted back to major units.
+
+    Reads `members_collection_items` (indexed on code and date) when COLLECTION_ITEMS is on,
+    otherwise one SUM/COUNT per wide column. Columns with no amounts are left out.
+    """
+    from sqlalchemy import select
+    ensure_db_exists()
+    if COLLECTION_ITEMS:
+        t = members_collection_items
+        stmt = (select(t.c.code_column, func.sum(t.c.amount), func.count())
+                .group_by(t.c.code_column))
+    else:
+        t = members_collection
+        cols = [c for c in AMOUNT_COLUMNS if c in get_target_columns('members_collection')]
+        stmt = select(*[f(t.c[c]) for c in cols for f in (func.sum, func.count)])
+    if start is not None:
+        stmt = stmt.where(t.c.s2 >= start)
+    if end is not None:
+        stmt = stmt.where(t.c.s2 <= end)
+    if church is not None:
+        stmt = stmt.where(t.c.church == church)
+    with engine.connect() as conn:
+        if COLLECTION_ITEMS:
+            rows = [tuple(r) for r in conn.execute(stmt)]
+        else:
+            r = conn.execute(stmt).fetchone()
+            rows = [(c, r[2 * i], r[2 * i + 1]) for i, c in enumerate(cols)]
+        labels = dict(conn.execute(text('SELECT column_name, code FROM collection_codes')).fetchall())
+    order = {c: i for i, c in enumerate(AMOUNT_COLUMNS)}
+    if money.MINOR:
+        rows = [(c, money.from_minor(total), n) for c, total, n in rows]
+    return [{'column_name': c, 'code': labels.get(c), 'total': total, 'rows': n}
+            for c, total, n in sorted(rows, key=lambda r: order.get(r[0], len(order))) if n]
+
+
+def read_changes(table_name: str, since: Optional[str], columns: Optional[List[str]] = None) -> dict:
+    """Rows of a SYNC_TABLES table changed since a cursor, plus the ids deleted since then.
+
+    `since` is a cursor from an earlier call, or None / '0' for everything. Returns
+    `{'cursor', 'reset', 'changed' (DataFrame), 'deleted' (ids)}`; `reset` is True when the
+    answer is a full snapshot that replaces the caller's copy. Raises ValueError for a bad cursor.
+    """
+    from sqlalchemy import select
+    ensure_db_exists()
+    if table_name not in SYNC_TABLES:
+        raise ValueError(f"Table is not change-tracked: {table_name}")
+    table = metadata.tables[table_name]
+    cols = list(columns) if columns else get_target_columns(table_name)
+    if 'id' not in cols:
+        cols = ['id'] + cols
+    start = None
+    if since not in (None, '', '0'):
+        try:
+            start = datetime.fromisoformat(since) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        except ValueError:
+            raise ValueError(f"Invalid since cursor: {since!r}")
+        if start < datetime.utcnow() - timedelta(days=SYNC_TOMBSTONE_DAYS):
+            # deletes that old may already be purged: only a full snapshot is safe
+            start = None
+    with engine.connect() as conn:
+        if start is not None:
+            replaced = conn.execute(text('SELECT value FROM app_settings WHERE key = :k'),
+                                    {'k': SYNC_RESET_KEY.format(table=table_name)}).scalar()
+            if replaced and start < datetime.fromisoformat(replaced):
+                start = None
+        # the new cursor is taken before reading so a write racing this read is seen next time
+        now = conn.execute(text(f'SELECT {_sync_now_sql()}')).scalar()
+        cursor = _sync_stamp(now) if isinstance(now, datetime) else str(now)[:23]
+        stmt = select(*[table.c[c] for c in cols]).order_by(table.c.id)
+        if start is not None:
+            stmt = stmt.where(text('updated_at >= :since').bindparams(since=_sync_stamp(start)))
+        res = conn.execute(stmt)
+        changed = money.frame_from_storage(pd.DataFrame(res.fetchall(), columns=list(res.keys())), table_name)
+        deleted = []
+        if start is not None:
+            res = conn.execute(text('SELECT DISTINCT row_id FROM sync_tombstones WHERE table_name = :t AND deleted_at >= :since'),
+                               {'t': table_name, 'since': _sync_stamp(start)})
+            # an id that was deleted and then reused comes back in `changed`
+            present = set(changed['id'])
+            deleted = sorted(r[0] for r in res if r[0] not in present)
+    return {'cursor': cursor, 'reset': start is None, 'changed': changed, 'deleted': deleted}
 
 
 def insert_member(
@@ -562,6 +1763,7 @@ def insert_member(
 ) -> int:
     """Insert a member and return the new `id`."""
     ensure_db_exists()
+    pledge = money.amount_to_storage(pledge)
     # Ensure `sno` is unique: if missing or already present, assign next available sequence
     try:
         with engine.begin() as conn:
@@ -616,7 +1818,8 @@ def insert_member(
                 pk = res.inserted_primary_key[0]
             except Exception:
                 pk = None
-            return pk
+        bump_table_version('members')
+        return pk
     except SQLAlchemyError:
         raise
 
@@ -652,9 +1855,55 @@ def deduplicate_members_by_sno():
             except Exception:
                 pass
             deleted += 1
+    if deleted:
+        bump_table_version('members')
     return deleted
 
 
+def members_collection_s1_duplicates() -> List[dict]:
+    """`(s1, church)` keys held by more than one `members_collection` row, with their row count.
+    Rows without s1 or church are not keyed and are left out.
+    """
+    ensure_db_exists()
+    inspector = inspect(engine)
+    if 'members_collection' not in inspector.get_table_names():
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            'SELECT s1, church, COUNT(*) AS rows FROM members_collection WHERE s1 IS NOT NULL AND church IS NOT NULL '
+            'GROUP BY s1, church HAVING COUNT(*) > 1 ORDER BY s1, church')).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def create_members_collection_key_index():
+    """Create the unique `(s1, church)` index that ingestion upserts on; fails while duplicates remain."""
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {UPSERT_INDEXES['members_collection']} "
+                          f"ON members_collection(s1, church)"))
+
+
+def deduplicate_members_collection_by_s1(backup_path: str) -> int:
+    """Remove `members_collection` rows that share `(s1, church)`, keeping the latest (highest `id`).
+
+    The removed rows are written to `backup_path` (CSV) first, then the unique index is created.
+    Returns the number of rows removed.
+    """
+    ensure_db_exists()
+    inspector = inspect(engine)
+    if 'members_collection' not in inspector.get_table_names():
+        return 0
+    stale = ('FROM members_collection WHERE s1 IS NOT NULL AND church IS NOT NULL AND id NOT IN ('
+             'SELECT MAX(id) FROM members_collection WHERE s1 IS NOT NULL AND church IS NOT NULL GROUP BY s1, church)')
+    with engine.begin() as conn:
+        removed = money.frame_from_storage(pd.read_sql(text(f'SELECT * {stale} ORDER BY id'), conn), 'members_collection')
+        removed.to_csv(backup_path, index=False)
+        deleted = conn.execute(text(f'DELETE {stale}')).rowcount
+    create_members_collection_key_index()
+    if deleted:
+        bump_table_version('members_collection')
+    return deleted or 0
+
+
 def insert_members_collection(collection_code: str, member_id: Optional[int] = None, church: Optional[int] = None) -> int:
     """Insert into members_collection and return the new `id`."""
     ensure_db_exists()
@@ -667,7 +1916,8 @@ def insert_members_collection(collection_code: str, member_id: Optional[int] = N
                 pk = res.inserted_primary_key[0]
             except Exception:
                 pk = None
-            return pk
+        bump_table_version('members_collection')
+        return pk
     except SQLAlchemyError:
         raise
 
@@ -703,6 +1953,7 @@ def seed_churches():
             conn.commit()
         except Exception:
             pass
+    bump_table_version('church')
 
 
 def get_header_mappings(headers: List[str]) -> dict:
@@ -757,4 +2008,4 @@ def upsert_header_mappings(mappings: List[dict]):
             conn.commit()
         except Exception:
             pass
-
+    bump_table_version('header_mappings')
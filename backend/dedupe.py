@@ -0,0 +1,49 @@
+"""Resolve `members_collection` rows that share an `(s1, church)` key.
+
+Usage:
+  python -m backend.dedupe                                   # report the duplicate keys
+  python -m backend.dedupe --apply --backup removed.csv      # keep the newest row of each key
+
+Ingestion upserts on `(s1, church)`, backed by the unique index ix_members_collection_s1_church.
+The API does not create that index while duplicates remain (it logs a warning instead), and
+until then an upsert updates every row of a repeated key. `--apply` writes the rows it removes
+to `--backup` before deleting them, then creates the index.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+from .db import deduplicate_members_collection_by_s1, members_collection_s1_duplicates
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apply', action='store_true', help='delete all but the newest row of each repeated key')
+    parser.add_argument('--backup', help='CSV file for the removed rows (default: members_collection_duplicates_<time>.csv)')
+    args = parser.parse_args(argv)
+
+    duplicates = members_collection_s1_duplicates()
+    if not duplicates:
+        print("No repeated (s1, church) keys.")
+        return
+    extra = sum(d['rows'] - 1 for d in duplicates)
+    print(f"{len(duplicates)} (s1, church) keys are shared by more than one row ({extra} rows beyond the newest):")
+    for d in duplicates[:20]:
+        print(f"  s1={d['s1']} church={d['church']}: {d['rows']} rows")
+    if len(duplicates) > 20:
+        print(f"  ... and {len(duplicates) - 20} more")
+    if not args.apply:
+        print("Nothing changed. Rerun with --apply to keep the newest row of each key.")
+        return
+    backup = args.backup or f"members_collection_duplicates_{datetime.now():%Y%m%d_%H%M%S}.csv"
+    if os.path.exists(backup):
+        print(f"{backup} already exists; choose another --backup file.")
+        sys.exit(1)
+    removed = deduplicate_members_collection_by_s1(backup)
+    print(f"Removed {removed} rows (saved to {backup}) and created ix_members_collection_s1_church.")
+
+
+if __name__ == '__main__':
+    main()
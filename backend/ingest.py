@@ -0,0 +1,274 @@
+"""CPU-bound parsing and shaping of uploaded spreadsheets.
+
+Everything here is pure pandas (no database, no FastAPI) so it can run in the `parse_pool`
+worker processes. Functions raise ValueError for bad input; the API turns that into a 400.
+"""
+import io
+import re
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+from .metrics import phase
+
+
+# Rows parsed to estimate the in-memory size of a whole upload
+ESTIMATE_SAMPLE_ROWS = 500
+# Row limit of a legacy .xls sheet: the upper bound when the sheet size cannot be read
+XLS_MAX_ROWS = 65535
+
+
+class UploadTooLarge(ValueError):
+    """The parsed upload would need more memory than the per-request budget allows."""
+
+    def __init__(self, estimated: int, budget: int):
+        super().__init__(estimated, budget)
+        self.estimated = estimated
+        self.budget = budget
+
+    def __str__(self):
+        return (f"upload would need about {self.estimated // (1024 * 1024)} MB once parsed, "
+                f"over the {self.budget // (1024 * 1024)} MB per-request budget")
+
+
+def upload_format(data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    """'excel' or 'csv', decided like `read_upload_bytes` (by extension, then content type, then file signature)."""
+    name = (filename or "upload").lower()
+    if name.endswith(('.xls', '.xlsx')):
+        return 'excel'
+    if name.endswith('.csv') or content_type == 'text/csv':
+        return 'csv'
+    # xlsx is a zip archive, xls an OLE2 compound file
+    return 'excel' if data[:2] == b'PK' or data[:4] == b'\xd0\xcf\x11\xe0' else 'csv'
+
+
+def _excel_row_count(data: bytes) -> Optional[int]:
+    """Data rows of the first sheet of an xlsx file, read in streaming mode; None if unreadable."""
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(io.BytesIO(data), read_only=True)
+        try:
+            ws = wb.worksheets[0]
+            rows = ws.max_row
+            if rows is None:
+                # no dimension record in the file: count rows without keeping them
+                rows = sum(1 for _ in ws.iter_rows(values_only=True))
+        finally:
+            wb.close()
+        return max(rows - 1, 0)
+    except Exception:
+        return None
+
+
+def estimate_upload_memory(data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> dict:
+    """Estimate the size of the parsed DataFrame from a sample of rows, without parsing the whole file.
+
+    Returns `format`, `rows` (data rows, an upper bound for CSV), `row_bytes` and `bytes`.
+    """
+    fmt = upload_format(data, filename, content_type)
+    with phase('estimate'):
+        try:
+            if fmt == 'csv':
+                sample = pd.read_csv(io.BytesIO(data), nrows=ESTIMATE_SAMPLE_ROWS)
+                # lines minus the header; quoted newlines make this an overcount, which errs on the safe side
+                lines = data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+                rows = max(lines - 1, len(sample))
+            else:
+                sample = pd.read_excel(io.BytesIO(data), nrows=ESTIMATE_SAMPLE_ROWS)
+                if len(sample) < ESTIMATE_SAMPLE_ROWS:
+                    rows = len(sample)
+                else:
+                    rows = _excel_row_count(data) or XLS_MAX_ROWS
+        except Exception as e:
+            raise ValueError(str(e))
+        row_bytes = int(sample.memory_usage(index=True, deep=True).sum() / len(sample)) if len(sample) else 0
+    return {'format': fmt, 'rows': rows, 'row_bytes': row_bytes, 'bytes': row_bytes * rows}
+
+
+def read_upload_bytes(data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> pd.DataFrame:
+    """Parse an uploaded Excel or CSV file from its raw bytes."""
+    name = (filename or "upload").lower()
+    with phase('read_file'):
+        return _read_upload_bytes(data, name, content_type)
+
+
+def _read_upload_bytes(data: bytes, name: str, content_type: Optional[str]) -> pd.DataFrame:
+    try:
+        if name.endswith(('.xls', '.xlsx')):
+            return pd.read_excel(io.BytesIO(data))
+        if name.endswith('.csv') or content_type == 'text/csv':
+            return pd.read_csv(io.BytesIO(data))
+        # try excel first
+        try:
+            return pd.read_excel(io.BytesIO(data))
+        except Exception:
+            return pd.read_csv(io.BytesIO(data))
+    except Exception as e:
+        raise ValueError(str(e))
+
+
+def guess_s1_column(df):
+    """Guess which dataframe column holds the serial number (s1/sno).
+    Heuristics: look for header names containing 's1', 'sno', 'serial', 's.no', or 'sno.' (case-insensitive).
+    Fallback: use the first column name.
+    """
+    if df is None or df.shape[1] == 0:
+        return None
+    for c in df.columns:
+        lc = str(c).lower()
+        if 's1' in lc or 'sno' in lc or 'serial' in lc or 's.no' in lc or 'sr#' in lc or 's no' in lc:
+            return c
+    # fallback to first column
+    return df.columns[0]
+
+
+# Church for collection rows that name none and come from a caller without one
+DEFAULT_CHURCH = 1
+
+
+def derive_s1(s2, s3, church) -> Optional[int]:
+    """Serial number `YYYYMMDD` + church (3 digits) + s3 (3 digits), or None if s2/s3 are unusable."""
+    if isinstance(s2, str):
+        s2 = datetime.fromisoformat(s2)
+    elif not isinstance(s2, datetime):
+        return None
+    if s3 is None or str(s3).strip() == '':
+        return None
+    return int(f"{s2.strftime('%Y%m%d')}{int(church):03d}{int(s3):03d}")
+
+
+def fill_s1(row: dict, default_church: int = DEFAULT_CHURCH) -> dict:
+    """Compute `row['s1']` when it is missing or the placeholder 1, then coerce it to int (in place).
+
+    A row without a church gets `default_church`, the church `s1` is derived with: NULL never
+    matches in the (s1, church) upsert key, so a resubmitted row would be inserted again.
+    """
+    if row.get('church') in (None, ''):
+        row['church'] = default_church
+    s1_raw = row.get('s1')
+    if not s1_raw or (isinstance(s1_raw, (int, str)) and str(s1_raw).strip() == '1'):
+        try:
+            s1 = derive_s1(row.get('s2'), row.get('s3'), row.get('church') or default_church)
+            if s1 is not None:
+                row['s1'] = s1
+        except Exception:
+            pass
+    # coerce s1 to int for numeric s1 requirement
+    if row.get('s1') is not None and not isinstance(row.get('s1'), int):
+        try:
+            row['s1'] = int(row['s1'])
+        except Exception:
+            # fallback: remove non-digits then parse
+            digs = re.sub(r'[^0-9]', '', str(row['s1']))
+            row['s1'] = int(digs) if digs else row['s1']
+    return row
+
+
+def filter_s1_rows(df: pd.DataFrame, s1_col) -> pd.DataFrame:
+    """Keep rows where the serial column has a non-empty value; return `df` unchanged on any error."""
+    if s1_col is None:
+        return df
+    with phase('s1_filter'):
+        try:
+            mask = df[s1_col].notna() & (df[s1_col].astype(str).str.strip() != '')
+            return df[mask]
+        except Exception:
+            return df
+
+
+def map_upload_frame(df: pd.DataFrame, target_cols: List[str], uploader: Optional[dict] = None,
+                     church: Optional[int] = None) -> pd.DataFrame:
+    """Map uploaded columns onto `members_collection` columns (case-insensitive) and drop rows without a serial.
+
+    Rows without a church get `church` (default: the uploader's, else DEFAULT_CHURCH) so that
+    the (s1, church) upsert key is complete. Rows with a date and s3 are keyed on `derive_s1`
+    rather than the file's serial, which restarts at 1 in every file.
+    """
+    with phase('map_columns'):
+        df_cols_map = {c.lower(): c for c in df.columns}
+        mapped = {}
+        for tc in target_cols:
+            lc = tc.lower()
+            if lc in df_cols_map:
+                mapped[tc] = df[df_cols_map[lc]]
+            else:
+                mapped[tc] = pd.Series([None] * len(df))
+
+        out_df = pd.DataFrame(mapped)
+        # fill the church and, for uploader keys, the source where the file leaves them empty
+        defaults = {'church': church or (uploader or {}).get('church') or DEFAULT_CHURCH,
+                    'source': (uploader or {}).get('name')}
+        for col, value in defaults.items():
+            if value is None:
+                continue
+            try:
+                if col in out_df.columns:
+                    out_df[col] = out_df[col].where(out_df[col].notna(), value)
+                else:
+                    out_df[col] = value
+            except Exception:
+                pass
+        out_df = filter_s1_rows(out_df, guess_s1_column(out_df))
+        if {'s1', 's2', 's3', 'church'} <= set(out_df.columns) and len(out_df):
+            derived = pd.Series([_derived_s1(*v) for v in zip(out_df['s2'], out_df['s3'], out_df['church'])],
+                                index=out_df.index, dtype=object)
+            out_df['s1'] = derived.where(derived.notna(), out_df['s1'])
+    return out_df
+
+
+def _derived_s1(s2, s3, church) -> Optional[int]:
+    """`derive_s1` for a frame cell: None when the date or s3 is missing or unusable."""
+    try:
+        return derive_s1(s2, s3, church)
+    except (TypeError, ValueError):
+        return None
+
+
+def prepare_upload_frame(data: bytes, filename: Optional[str], content_type: Optional[str], target_cols: List[str],
+                         uploader: Optional[dict] = None, church: Optional[int] = None) -> pd.DataFrame:
+    """Parse + map + filter an upload in one call (one round-trip to the worker process)."""
+    df = read_upload_bytes(data, filename, content_type)
+    if df is None:
+        raise ValueError("No data parsed from file")
+    return map_upload_frame(df, target_cols, uploader, church)
+
+
+def iter_upload_chunks(data: bytes, target_cols: List[str], uploader: Optional[dict] = None, chunk_rows: int = 50000,
+                       church: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Parse a CSV upload `chunk_rows` rows at a time, yielding mapped and S1-filtered frames."""
+    try:
+        reader = pd.read_csv(io.BytesIO(data), chunksize=max(1, chunk_rows))
+    except Exception as e:
+        raise ValueError(str(e))
+    with reader:
+        while True:
+            with phase('read_file'):
+                try:
+                    chunk = next(reader)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    raise ValueError(str(e))
+            yield map_upload_frame(chunk.reset_index(drop=True), target_cols, uploader, church)
+
+
+def prepare_preview(data: bytes, filename: Optional[str], content_type: Optional[str]) -> dict:
+    """Headers, full rows and S1-filtered rows of an upload for the mapping preview."""
+    df = read_upload_bytes(data, filename, content_type)
+    if df is None:
+        raise ValueError("No data parsed from file")
+    headers = list(df.columns)
+    # Provide both the full dataset and a filtered preview (rows with guessed S1 non-empty)
+    s1_col = guess_s1_column(df)
+    df_filtered = filter_s1_rows(df, s1_col)
+    with phase('serialize'):
+        full_preview = df.fillna('').to_dict(orient='records')
+        # Return the filtered dataset (filled) so the client can preview and edit all rows by default.
+        # The filtered rows are the same dicts as in full_preview, not a second copy of the frame.
+        positions = df.index.get_indexer(df_filtered.index) if df.index.is_unique else None
+        if positions is not None and (positions >= 0).all():
+            preview = [full_preview[i] for i in positions]
+        else:
+            preview = df_filtered.fillna('').to_dict(orient='records')
+    return {"headers": headers, "full_preview": full_preview, "preview": preview, "s1_column": s1_col}
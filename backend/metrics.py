@@ -0,0 +1,347 @@
+"""Per-request phase timing, `Server-Timing` headers and Prometheus-format metrics.
+
+A request gets a `RequestStats` object in a context variable (set by the middleware in app.py).
+Code marks phases with `with phase('insert'): ...` and reports processed rows with `add_rows(n)`;
+SQL statements are counted through SQLAlchemy cursor events. Thread pools copy the context, so
+work done there is attributed to the request. Process pools do not share it: call through
+`run_timed`, which returns the worker's phases so the caller can merge them.
+
+With `MEMORY_PROFILE=1` every phase also records tracemalloc peak and retained bytes. Tracing
+slows allocation-heavy code, and the counters are per process, so concurrent requests in the
+same worker inflate each other's numbers. Use it to find out which stage grows, not as a budget.
+
+The metrics text is produced here (no prometheus_client dependency) and served at `/metrics`.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MEMORY_PROFILE = os.getenv('MEMORY_PROFILE', '0').lower() in ('1', 'true', 'yes')
+# Requests whose largest phase peak reaches this many MB are logged (0 logs every profiled request)
+MEMORY_PROFILE_LOG_MB = float(os.getenv('MEMORY_PROFILE_LOG_MB', '10'))
+
+
+class RequestStats:
+    __slots__ = ('phases', 'queries', 'db_time', 'rows', 'memory', 'mem_stack')
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        # phase -> [peak bytes, retained bytes] above the traced memory at phase start
+        self.memory: Dict[str, List[int]] = {}
+        self.mem_stack: List[List[int]] = []
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_memory(self, name: str, peak: int, retained: int) -> None:
+        cur = self.memory.get(name)
+        if cur is None:
+            self.memory[name] = [peak, retained]
+        else:
+            cur[0] = max(cur[0], peak)
+            cur[1] += retained
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('ksc_request_stats', default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def start_request() -> Tuple[RequestStats, contextvars.Token]:
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def _memory_enter(stats: RequestStats) -> None:
+    current, peak = tracemalloc.get_traced_memory()
+    if stats.mem_stack:
+        # the peak is reset below: keep what the enclosing phase has seen so far
+        outer = stats.mem_stack[-1]
+        outer[1] = max(outer[1], peak)
+    tracemalloc.reset_peak()
+    stats.mem_stack.append([current, current])
+
+
+def _memory_exit(stats: RequestStats, name: str) -> None:
+    current, peak = tracemalloc.get_traced_memory()
+    start, seen = stats.mem_stack.pop()
+    peak = max(peak, seen)
+    if stats.mem_stack:
+        outer = stats.mem_stack[-1]
+        outer[1] = max(outer[1], peak)
+    stats.add_memory(name, peak - start, current - start)
+
+
+def ensure_tracing() -> bool:
+    """Start tracemalloc if `MEMORY_PROFILE` is on (also in pool worker processes)."""
+    if MEMORY_PROFILE and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return MEMORY_PROFILE
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block and add it to the current request's phase `name` (no-op outside a request)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    tracing = MEMORY_PROFILE and tracemalloc.is_tracing()
+    if tracing:
+        _memory_enter(stats)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_phase(name, time.perf_counter() - started)
+        if tracing:
+            _memory_exit(stats, name)
+
+
+def add_rows(n: int) -> None:
+    stats = _current.get()
+    if stats is not None:
+        try:
+            stats.rows += int(n)
+        except (TypeError, ValueError):
+            pass
+
+
+def run_timed(fn: Callable, *args, **kwargs):
+    """Run `fn` with its own stats and return `(result, phases, memory)`; picklable for process pools."""
+    ensure_tracing()
+    stats, token = start_request()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        end_request(token)
+    return result, stats.phases, stats.memory
+
+
+def merge_phases(phases: Dict[str, float], memory: Optional[Dict[str, List[int]]] = None) -> None:
+    stats = _current.get()
+    if stats is None:
+        return
+    for name, seconds in (phases or {}).items():
+        stats.add_phase(name, seconds)
+    for name, (peak, retained) in (memory or {}).items():
+        stats.add_memory(name, peak, retained)
+
+
+async def run_pool_timed(pool, fn: Callable, *args, **kwargs):
+    """`pool.run_async(fn, ...)` that also brings back the phases timed inside the worker."""
+    result, phases, memory = await pool.run_async(run_timed, fn, *args, **kwargs)
+    merge_phases(phases, memory)
+    return result
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    """Render a `Server-Timing` header value (durations in milliseconds)."""
+    parts = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in stats.phases.items()]
+    if stats.queries:
+        parts.append(f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"')
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+# --- SQL statement counting ------------------------------------------------------------------
+
+_instrumented = set()
+# callables `(statement, seconds, executemany)` run after every statement (see profiler.py)
+_statement_hooks = []
+
+
+def add_statement_hook(fn: Callable) -> None:
+    if fn not in _statement_hooks:
+        _statement_hooks.append(fn)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('ksc_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('ksc_query_start')
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    for hook in _statement_hooks:
+        hook(statement, elapsed, executemany)
+
+
+def instrument_engine(engine) -> None:
+    """Count statements and DB time per request on `engine` (sync or async engine)."""
+    from sqlalchemy import event
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    if id(sync_engine) in _instrumented:
+        return
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    _instrumented.add(id(sync_engine))
+
+
+# --- Prometheus text format --------------------------------------------------------------------
+
+def _fmt_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    inner = ','.join('{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n, v in zip(names, values))
+    return '{' + inner + '}'
+
+
+def _fmt_value(v: float) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Sequence = (), amount: float = 1) -> None:
+        key = tuple(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            yield f'{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}'
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Sequence, value: float) -> None:
+        key = tuple(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        names = self.labelnames + ('le',)
+        for key, s in items:
+            for i, b in enumerate(self.buckets):
+                yield f'{self.name}_bucket{_fmt_labels(names, key + (_fmt_value(b),))} {s[i]}'
+            yield f'{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(s[-2])}'
+            yield f'{self.name}_count{_fmt_labels(self.labelnames, key)} {s[-1]}'
+
+
+class GaugeSource:
+    """Gauges computed at scrape time: `fn()` yields `(labels tuple, value)` pairs."""
+
+    def __init__(self, name: str, doc: str, fn: Callable[[], Iterable[Tuple[tuple, float]]], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} gauge'
+        try:
+            for key, v in self.fn():
+                yield f'{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}'
+        except Exception:
+            # a broken source must not take the whole scrape down
+            pass
+
+
+def _mb(n: int) -> str:
+    return f'{n / (1024 * 1024):.1f}MB'
+
+
+def log_memory(route: str, method: str, stats: RequestStats) -> None:
+    """Log a request's per-phase memory when its largest phase peak reaches `MEMORY_PROFILE_LOG_MB`."""
+    if not stats.memory:
+        return
+    largest = max(peak for peak, _ in stats.memory.values())
+    if largest < MEMORY_PROFILE_LOG_MB * 1024 * 1024:
+        return
+    parts = ', '.join(f'{name} peak={_mb(peak)} retained={_mb(retained)}' for name, (peak, retained) in stats.memory.items())
+    logger.info('memory %s %s: %s', method, route, parts)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROWS_PER_SECOND_BUCKETS = (10, 100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+BYTES_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(0, 13))  # 1 MB .. 4 GB
+
+request_duration = Histogram('ksc_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS, ('route', 'method', 'status'))
+phase_duration = Histogram('ksc_phase_duration_seconds', 'Time spent per request phase.', LATENCY_BUCKETS, ('route', 'phase'))
+db_queries = Counter('ksc_db_queries_total', 'SQL statements executed, by route.', ('route',))
+db_time = Counter('ksc_db_time_seconds_total', 'Time spent executing SQL, by route.', ('route',))
+rows_processed = Counter('ksc_rows_processed_total', 'Rows parsed, inserted or returned, by route.', ('route',))
+rows_per_second = Histogram('ksc_rows_per_second', 'Row throughput of requests that processed rows.', ROWS_PER_SECOND_BUCKETS, ('route',))
+phase_memory_peak = Histogram('ksc_phase_memory_peak_bytes', 'tracemalloc peak above the start of a phase (MEMORY_PROFILE=1).', BYTES_BUCKETS, ('route', 'phase'))
+phase_memory_retained = Histogram('ksc_phase_memory_retained_bytes', 'Traced memory still allocated when a phase ends (MEMORY_PROFILE=1).', BYTES_BUCKETS, ('route', 'phase'))
+
+REGISTRY = [request_duration, phase_duration, db_queries, db_time, rows_processed, rows_per_second, phase_memory_peak, phase_memory_retained]
+
+
+def register(metric) -> None:
+    REGISTRY.append(metric)
+
+
+def observe_request(route: str, method: str, status: int, total: float, stats: RequestStats) -> None:
+    request_duration.observe((route, method, status), total)
+    for name, seconds in stats.phases.items():
+        phase_duration.observe((route, name), seconds)
+    if stats.queries:
+        db_queries.inc((route,), stats.queries)
+        db_time.inc((route,), stats.db_time)
+    if stats.rows:
+        rows_processed.inc((route,), stats.rows)
+        if total > 0:
+            rows_per_second.observe((route,), stats.rows / total)
+    for name, (peak, retained) in stats.memory.items():
+        phase_memory_peak.observe((route, name), peak)
+        phase_memory_retained.observe((route, name), max(retained, 0))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
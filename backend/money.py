@@ -0,0 +1,118 @@
+"""Storage representation of monetary columns.
+
+MONEY_STORAGE=decimal (the default) stores amounts as `Numeric`, as they are entered.
+MONEY_STORAGE=minor stores them as BIGINT minor units (amount * MONEY_SCALE): values are
+converted once when they are written and back when frames are read, so sums are exact
+integer math and read paths never see `Decimal`. The API always speaks major units.
+
+`db.ensure_money_storage` converts existing data when the mode or scale changes.
+"""
+import os
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Optional
+
+import pandas as pd
+from sqlalchemy import BigInteger, Numeric
+
+MONEY_STORAGE = os.getenv('MONEY_STORAGE', 'decimal').lower()
+MONEY_SCALE = int(os.getenv('MONEY_SCALE', '100'))
+MINOR = MONEY_STORAGE == 'minor'
+
+# column type for amounts in the table definitions
+MONEY = BigInteger if MINOR else Numeric
+
+_AMOUNTS = [f'c{i}' for i in range(1, 21)] + [f'l{i}' for i in range(1, 42)]
+MONEY_COLUMNS = {
+    'members': ('pledge',),
+    'members_view': ('pledge',),
+    'members_collection': ('s5', 's6', 's7', 's8', 's9', 's13', *_AMOUNTS),
+    'members_collection_wide': ('s5', 's6', 's7', 's8', 's9', 's13', *_AMOUNTS),
+    'members_collection_items': ('amount',),
+}
+
+
+# `app_settings` key holding a table's current mode; a missing key means 'decimal'
+SETTING_KEY = 'money_storage:{table}'
+# tables whose stored values are converted (views and the line items are rebuilt from them)
+STORED_TABLES = ('members', 'members_collection')
+
+
+def storage_mode() -> str:
+    """The configured mode as recorded in `app_settings`: 'decimal' or 'minor:<scale>'."""
+    return f'minor:{MONEY_SCALE}' if MINOR else 'decimal'
+
+
+def mode_scale(mode: Optional[str]) -> Optional[int]:
+    """The scale of a recorded mode, None for 'decimal'."""
+    if mode and mode.startswith('minor:'):
+        return int(mode.split(':', 1)[1])
+    return None
+
+
+def to_minor(v, scale: int = MONEY_SCALE) -> Optional[int]:
+    """A major-unit amount (number or numeric string) as integer minor units, rounding half up."""
+    if isinstance(v, str):
+        if not v.strip():
+            return None
+    elif v is None or pd.isna(v):
+        return None
+    try:
+        return int((Decimal(str(v).strip()) * scale).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Not an amount: {v!r}")
+
+
+def from_minor(v, scale: int = MONEY_SCALE):
+    """Integer minor units as a JSON-friendly major amount (int when whole)."""
+    if v is None:
+        return None
+    v = int(v)
+    return v // scale if v % scale == 0 else v / scale
+
+
+def amount_to_storage(v):
+    """One major-unit amount in storage units."""
+    return to_minor(v) if MINOR else v
+
+
+def amount_from_storage(v):
+    """One stored amount in major units."""
+    return from_minor(v) if MINOR and v is not None else v
+
+
+def row_to_storage(table_name: str, row: dict) -> dict:
+    """`row` with its money columns in storage units (in place; a no-op unless MINOR)."""
+    if MINOR:
+        for c in MONEY_COLUMNS.get(table_name, ()):
+            if c in row:
+                row[c] = to_minor(row[c])
+    return row
+
+
+def frame_to_storage(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    """A copy of `df` with its money columns in storage units (`df` itself unless MINOR)."""
+    cols = [c for c in MONEY_COLUMNS.get(table_name, ()) if c in df.columns] if MINOR else []
+    if not cols:
+        return df
+    df = df.copy()
+    for c in cols:
+        # through to_minor like single rows, so a frame rounds half up exactly as /submit does
+        df[c] = pd.array([_frame_minor(v) for v in df[c]], dtype='Int64')
+    return df
+
+
+def _frame_minor(v) -> Optional[int]:
+    """`to_minor` for a frame cell; a value that is not an amount is stored as NULL."""
+    try:
+        return to_minor(v)
+    except ValueError:
+        return None
+
+
+def frame_from_storage(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    """`df` with its money columns back in major units (floats, as `Numeric` columns read)."""
+    if MINOR:
+        for c in MONEY_COLUMNS.get(table_name, ()):
+            if c in df.columns:
+                df[c] = pd.to_numeric(df[c], errors='coerce') / MONEY_SCALE
+    return df
@@ -0,0 +1,53 @@
+"""PBKDF2-SHA256 password hashing, run on the bounded `hash_pool`.
+
+Hashes are stored as `pbkdf2_sha256$<iterations>$<hex digest>` so the cost can be raised
+later without invalidating existing passwords. Hashes written before the prefix existed
+are plain hex digests computed with 100,000 iterations.
+"""
+import binascii
+import hashlib
+import hmac
+import os
+from typing import Tuple
+
+from .workers import hash_pool
+
+HASH_SCHEME = 'pbkdf2_sha256'
+LEGACY_ITERATIONS = 100_000
+# Cost for newly written hashes; existing hashes are upgraded on the next successful login
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', str(LEGACY_ITERATIONS)))
+
+
+def _hash_password(password: str, salt: bytes, iterations: int = LEGACY_ITERATIONS) -> str:
+    dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return binascii.hexlify(dk).decode('ascii')
+
+
+def encode_password_hash(iterations: int, digest_hex: str) -> str:
+    return f'{HASH_SCHEME}${iterations}${digest_hex}'
+
+
+def parse_password_hash(stored: str) -> Tuple[int, str]:
+    """Return (iterations, hex digest) for a stored hash, accepting the legacy bare-hex format."""
+    if stored and stored.startswith(HASH_SCHEME + '$'):
+        _, iterations, digest_hex = stored.split('$', 2)
+        return int(iterations), digest_hex
+    return LEGACY_ITERATIONS, stored
+
+
+def hash_password(password: str, salt: bytes, iterations: int = None) -> str:
+    """Hash on the bounded pool and return the encoded value to store. Raises PoolBusy when saturated."""
+    iterations = iterations or PASSWORD_HASH_ITERATIONS
+    digest_hex = hash_pool.run(_hash_password, password, salt, iterations)
+    return encode_password_hash(iterations, digest_hex)
+
+
+def check_password(password: str, salt: bytes, stored: str) -> bool:
+    iterations, expected = parse_password_hash(stored)
+    digest_hex = hash_pool.run(_hash_password, password, salt, iterations)
+    return hmac.compare_digest(digest_hex, expected or '')
+
+
+def needs_rehash(stored: str) -> bool:
+    iterations, _ = parse_password_hash(stored)
+    return not stored.startswith(HASH_SCHEME + '$') or iterations != PASSWORD_HASH_ITERATIONS
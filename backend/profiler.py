@@ -0,0 +1,149 @@
+"""Opt-in SQL profiler: statements per request, DB time and the most repeated statement shapes.
+
+Enable with `QUERY_PROFILE=1`. Every request then records each statement under its *shape*
+(whitespace collapsed, literals and IN-lists replaced by `?`). A request over its query budget
+is logged as a warning with its top shapes. Shapes repeated `QUERY_REPEAT_THRESHOLD` times or
+more are flagged as likely N+1 loops. The most recent offenders are kept for
+`GET /debug/query_profile`.
+
+Outside the API, profile any block with `with profiled() as prof: ...`.
+"""
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .metrics import add_statement_hook
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILE = os.getenv('QUERY_PROFILE', '0').lower() in ('1', 'true', 'yes')
+# Statements a request may issue before it is reported
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '50'))
+# Per-route overrides, e.g. "/members_collections/bulk=200,/upload=20"
+QUERY_BUDGET_ROUTES = os.getenv('QUERY_BUDGET_ROUTES', '')
+# A shape executed this many times in one request is flagged as a likely N+1 pattern
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '10'))
+QUERY_PROFILE_TOP = int(os.getenv('QUERY_PROFILE_TOP', '5'))
+QUERY_PROFILE_KEEP = int(os.getenv('QUERY_PROFILE_KEEP', '50'))
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def statement_shape(statement: str, max_len: int = 240) -> str:
+    """Normalize a SQL statement so executions that differ only in literals compare equal."""
+    s = _SPACE_RE.sub(' ', statement or '').strip()
+    s = _STRING_RE.sub('?', s)
+    s = _NUMBER_RE.sub('?', s)
+    s = _IN_LIST_RE.sub('(?...)', s)
+    return s if len(s) <= max_len else s[:max_len] + '...'
+
+
+def _parse_budgets(raw: str) -> Dict[str, int]:
+    out = {}
+    for part in raw.split(','):
+        route, sep, n = part.strip().rpartition('=')
+        if sep and route:
+            try:
+                out[route] = int(n)
+            except ValueError:
+                pass
+    return out
+
+
+_route_budgets = _parse_budgets(QUERY_BUDGET_ROUTES)
+
+
+def budget_for(route: str) -> int:
+    return _route_budgets.get(route, QUERY_BUDGET)
+
+
+class QueryProfile:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Dict[str, List] = {}  # shape -> [count, seconds]
+        self._lock = threading.Lock()  # statements may arrive from db_pool threads
+
+    def record(self, statement: str, seconds: float) -> None:
+        shape = statement_shape(statement)
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            entry = self.shapes.get(shape)
+            if entry is None:
+                self.shapes[shape] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def top(self, n: int = QUERY_PROFILE_TOP) -> List[dict]:
+        with self._lock:
+            items = sorted(self.shapes.items(), key=lambda kv: (kv[1][0], kv[1][1]), reverse=True)[:n]
+        return [{'statement': shape, 'count': c, 'ms': round(sec * 1000, 2)} for shape, (c, sec) in items]
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[dict]:
+        return [t for t in self.top(len(self.shapes)) if t['count'] >= threshold]
+
+    def summary(self) -> dict:
+        return {'queries': self.count, 'db_ms': round(self.seconds * 1000, 2), 'top': self.top(), 'repeated': self.repeated()}
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('ksc_query_profile', default=None)
+_recent = deque(maxlen=QUERY_PROFILE_KEEP)
+_recent_lock = threading.Lock()
+
+
+def _on_statement(statement: str, seconds: float, executemany: bool) -> None:
+    prof = _current.get()
+    if prof is not None:
+        prof.record(statement, seconds)
+
+
+add_statement_hook(_on_statement)
+
+
+@contextmanager
+def profiled():
+    """Collect statements executed in this block (and threads it starts via copied context)."""
+    prof = QueryProfile()
+    token = _current.set(prof)
+    try:
+        yield prof
+    finally:
+        _current.reset(token)
+
+
+def report(route: str, method: str, prof: QueryProfile, elapsed: float) -> Optional[dict]:
+    """Log and remember a request that went over its budget or repeated a statement shape."""
+    budget = budget_for(route)
+    repeated = prof.repeated()
+    if prof.count <= budget and not repeated:
+        return None
+    entry = {
+        'route': route,
+        'method': method,
+        'at': time.time(),
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'budget': budget,
+        **prof.summary(),
+    }
+    with _recent_lock:
+        _recent.append(entry)
+    hint = '; possible N+1: ' + ' | '.join(f"{r['count']}x {r['statement']}" for r in repeated[:3]) if repeated else ''
+    logger.warning('%s %s issued %d queries (budget %d, %.1f ms in DB)%s',
+                   method, route, prof.count, budget, prof.seconds * 1000, hint)
+    return entry
+
+
+def recent_reports() -> List[dict]:
+    with _recent_lock:
+        return list(_recent)
@@ -0,0 +1,187 @@
+"""Admission control for ingestion endpoints: token buckets plus in-flight caps.
+
+Each ingestion request is charged against the caller (uploader API key or user) and its church.
+A caller may start at most `INGEST_RATE` ingestions per second, with bursts up to `INGEST_BURST`,
+and hold at most `INGEST_MAX_INFLIGHT_UPLOADER` of them at once. Each church has its own
+bucket and in-flight cap. A value of `0` (the default) disables that limit.
+
+State lives in a store object. `MemoryStore` keeps it in this process; a shared store (Redis,
+database, ...) only needs `consume`, `acquire` and `release`. Install one with
+`ingest_limiter.set_store(...)`.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class RateLimited(Exception):
+    """Raised when an ingestion request is over a rate or concurrency limit."""
+
+    def __init__(self, scope: str, retry_after: int = 1, reason: str = 'rate'):
+        super().__init__(f"{reason} limit reached for {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class MemoryStore:
+    """In-process store: token buckets keyed by string, plus in-flight counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, last refill time)
+        self._inflight: Dict[str, int] = {}
+
+    def consume(self, buckets: Sequence[Tuple[str, float, float]], cost: float = 1.0) -> float:
+        """Take `cost` tokens from every `(key, rate, burst)` bucket, or from none of them.
+
+        Returns 0.0 on success, otherwise the number of seconds until all buckets could pay.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = {}
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, last = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                levels[key] = tokens
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate)
+            if wait > 0:
+                for key, tokens in levels.items():
+                    self._buckets[key] = (tokens, now)
+                return wait
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - cost, now)
+            return 0.0
+
+    def acquire(self, slots: Sequence[Tuple[str, int]]) -> Optional[str]:
+        """Take one in-flight slot under every `(key, limit)`; return the first full key (taking nothing) or None."""
+        with self._lock:
+            for key, limit in slots:
+                if self._inflight.get(key, 0) >= limit:
+                    return key
+            for key, _ in slots:
+                self._inflight[key] = self._inflight.get(key, 0) + 1
+            return None
+
+    def release(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            for key in keys:
+                n = self._inflight.get(key, 0) - 1
+                if n > 0:
+                    self._inflight[key] = n
+                else:
+                    self._inflight.pop(key, None)
+
+    def inflight(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._inflight)
+
+
+class IngestLimiter:
+    def __init__(self, rate: float, burst: float, church_rate: float, church_burst: float,
+                 max_inflight: int, max_inflight_church: int, store=None):
+        self.rate = rate
+        self.burst = burst
+        self.church_rate = church_rate
+        self.church_burst = church_burst
+        self.max_inflight = max_inflight
+        self.max_inflight_church = max_inflight_church
+        self.store = store or MemoryStore()
+        self._lock = threading.Lock()
+        # moving average of how long an ingestion holds its slot, for Retry-After on concurrency rejects
+        self._avg_hold = 1.0
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_inflight = 0
+
+    def set_store(self, store) -> None:
+        self.store = store
+
+    def _buckets(self, subject: str, church: Optional[str]) -> List[Tuple[str, float, float]]:
+        out = []
+        if self.rate > 0:
+            out.append((f'rate:{subject}', self.rate, max(1.0, self.burst)))
+        if church and self.church_rate > 0:
+            out.append((f'rate:{church}', self.church_rate, max(1.0, self.church_burst)))
+        return out
+
+    def _slots(self, subject: str, church: Optional[str]) -> List[Tuple[str, int]]:
+        out = []
+        if self.max_inflight > 0:
+            out.append((f'inflight:{subject}', self.max_inflight))
+        if church and self.max_inflight_church > 0:
+            out.append((f'inflight:{church}', self.max_inflight_church))
+        return out
+
+    @contextmanager
+    def admit(self, subject: str, church: Optional[str] = None):
+        """Hold an ingestion slot for `subject` (and its `church`) or raise RateLimited."""
+        slots = self._slots(subject, church)
+        if slots:
+            full = self.store.acquire(slots)
+            if full is not None:
+                with self._lock:
+                    self.rejected_inflight += 1
+                    hold = self._avg_hold
+                raise RateLimited(full.split(':', 1)[1], max(1, math.ceil(hold)), reason='concurrency')
+        keys = [k for k, _ in slots]
+        try:
+            wait = self.store.consume(self._buckets(subject, church))
+        except BaseException:
+            self.store.release(keys)
+            raise
+        if wait > 0:
+            self.store.release(keys)
+            with self._lock:
+                self.rejected_rate += 1
+            raise RateLimited(subject, max(1, math.ceil(wait)), reason='rate')
+        with self._lock:
+            self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.store.release(keys)
+            with self._lock:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {
+                'admitted': self.admitted,
+                'rejected_rate': self.rejected_rate,
+                'rejected_inflight': self.rejected_inflight,
+                'avg_hold_seconds': round(self._avg_hold, 3),
+            }
+        if hasattr(self.store, 'inflight'):
+            out['inflight'] = self.store.inflight()
+        return out
+
+
+def ingest_subject(auth: dict) -> Tuple[str, Optional[str]]:
+    """(caller key, church key) for an auth dict returned by `require_api_key_or_user`."""
+    uploader = auth.get('uploader') if isinstance(auth, dict) else None
+    user = auth.get('user') if isinstance(auth, dict) else None
+    if uploader:
+        subject, church = f"uploader:{uploader.get('id')}", uploader.get('church')
+    elif user:
+        subject, church = f"user:{user.get('id')}", user.get('church')
+    else:
+        return 'anonymous', None
+    return subject, (f'church:{church}' if church is not None else None)
+
+
+# every limit is off unless configured
+ingest_limiter = IngestLimiter(
+    rate=float(os.getenv('INGEST_RATE', '0')),
+    burst=float(os.getenv('INGEST_BURST', '10')),
+    church_rate=float(os.getenv('INGEST_CHURCH_RATE', '0')),
+    church_burst=float(os.getenv('INGEST_CHURCH_BURST', '40')),
+    max_inflight=int(os.getenv('INGEST_MAX_INFLIGHT_UPLOADER', '0')),
+    max_inflight_church=int(os.getenv('INGEST_MAX_INFLIGHT_CHURCH', '0')),
+)
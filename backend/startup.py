@@ -0,0 +1,149 @@
+"""One-time startup initialization shared by all workers.
+
+With `uvicorn --workers N` every worker runs the startup hook. `run_startup_once` makes
+exactly one of them do the schema/seed work while holding a lock (a file lock next to the
+SQLite database, or a PostgreSQL advisory lock); the others block on the same lock and then
+find the readiness flag in `app_settings` and skip the work.
+
+The flag stores a digest of the declared schema and of the settings that change what startup
+does (money storage, line items, the pledge column). A start whose digest matches skips the work,
+whether it is a sibling worker or a later restart; a schema or setting change initializes once.
+A full copy by migrate.py clears the flag, since replaced tables lose their indexes and triggers.
+"""
+import hashlib
+import json
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+from . import money
+from .db import COLLECTION_ITEMS, DB_ENGINE, PLEDGE_AMOUNT_COLUMN, engine, metadata, get_setting, set_setting
+
+READY_KEY = 'startup_ready'
+# Seconds a worker waits for the lock before initializing anyway (init is idempotent)
+STARTUP_LOCK_TIMEOUT = float(os.getenv('STARTUP_LOCK_TIMEOUT', '300'))
+_POLL = 0.1
+
+# 32-bit key for pg_advisory_lock (a crc32), stable across processes
+_ADVISORY_KEY = zlib.crc32(b'saypy-startup-init')
+
+
+def schema_digest() -> str:
+    """Hash of the declared tables and columns and the startup settings; changes with either."""
+    parts = []
+    for name in sorted(metadata.tables):
+        t = metadata.tables[name]
+        parts.append(name + ':' + ','.join(f'{c.name} {c.type}' for c in t.columns))
+    parts.append(f'money={money.storage_mode()} items={COLLECTION_ITEMS} pledge={PLEDGE_AMOUNT_COLUMN}')
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def read_ready_flag() -> Optional[dict]:
+    try:
+        raw = get_setting(READY_KEY)
+    except Exception:
+        # app_settings does not exist yet on a brand new database
+        return None
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def is_ready(flag: Optional[dict], digest: str) -> bool:
+    return bool(flag) and flag.get('digest') == digest
+
+
+def mark_ready(digest: str) -> None:
+    set_setting(READY_KEY, json.dumps({'digest': digest, 'pid': os.getpid(), 'at': time.time()}))
+
+
+@contextmanager
+def _file_lock(path: str, timeout: float):
+    fh = open(path, 'a+b')
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(_POLL)
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            except OSError:
+                pass
+        fh.close()
+
+
+@contextmanager
+def _advisory_lock(timeout: float):
+    conn = engine.connect()
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired = bool(conn.execute(text('SELECT pg_try_advisory_lock(:k)'), {'k': _ADVISORY_KEY}).scalar())
+            conn.commit()
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(_POLL)
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                conn.execute(text('SELECT pg_advisory_unlock(:k)'), {'k': _ADVISORY_KEY})
+                conn.commit()
+            except Exception:
+                pass
+        conn.close()
+
+
+def startup_lock(timeout: float = STARTUP_LOCK_TIMEOUT):
+    """Cross-process lock for startup work. Yields True if acquired, False on timeout."""
+    if DB_ENGINE in ('sqlite', 'sqlite3'):
+        from .db import SQLITE_PATH
+        return _file_lock(os.path.abspath(SQLITE_PATH) + '.init.lock', timeout)
+    return _advisory_lock(timeout)
+
+
+def run_startup_once(init: Callable[[], None]) -> bool:
+    """Run `init` in exactly one worker. Returns True if this process ran it."""
+    digest = schema_digest()
+    if is_ready(read_ready_flag(), digest):
+        return False
+    with startup_lock():
+        # another worker may have finished while we waited for the lock
+        if is_ready(read_ready_flag(), digest):
+            return False
+        init()
+        try:
+            mark_ready(digest)
+        except Exception:
+            pass
+    return True
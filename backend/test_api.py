@@ -1,6 +1,10 @@
+import importlib
 import json
+import time
 import urllib.request
 
+from fastapi.testclient import TestClient
+
 BASE = 'http://127.0.0.1:8000'
 
 def post(path, data):
@@ -10,6 +14,328 @@ def post(path, data):
     with urllib.request.urlopen(req) as resp:
         return resp.read().decode('utf-8')
 
+
+def _login(client, app_module, username, role='admin'):
+    app_module.create_user(username, 'secret-pass', church_id=1, role=role)
+    resp = client.post('/users/login', json={'username': username, 'password': 'secret-pass'})
+    assert resp.status_code == 200
+    return resp.json()['token']
+
+
+def test_logout_revokes_signed_token(fresh_backend):
+    app_module = fresh_backend('app')
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    assert client.get('/users', headers=headers).status_code == 200
+    assert client.post('/users/logout', headers=headers).status_code == 200
+    assert client.get('/users', headers=headers).status_code == 401
+    # a worker that only knows the database sees the revocation too
+    tokens = importlib.import_module('backend.access_tokens')
+    tokens._revoked_jti.clear()
+    tokens.refresh_revocations(force=True)
+    assert client.get('/users', headers=headers).status_code == 401
+
+
+def test_expired_signed_token_is_rejected(fresh_backend, monkeypatch):
+    app_module = fresh_backend('app')
+    monkeypatch.setattr(importlib.import_module('backend.access_tokens'), 'TOKEN_TTL', -1)
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    assert client.get('/users', headers=headers).status_code == 401
+
+
+def test_token_issued_before_user_cutoff_is_rejected(fresh_backend):
+    app_module = fresh_backend('app')
+    tokens = importlib.import_module('backend.access_tokens')
+    client = TestClient(app_module.app)
+    admin = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    old = {'Authorization': 'Bearer ' + _login(client, app_module, 'clerk')}
+    clerk_id = app_module.verify_user('clerk', 'secret-pass')['id']
+    resp = client.put(f'/users/{clerk_id}', headers=admin,
+                      json={'username': 'clerk', 'password': 'secret-pass', 'church': 1, 'role': 'admin'})
+    assert resp.status_code == 200
+    assert client.get('/users', headers=old).status_code == 401
+    tokens._revoked_users.clear()
+    tokens.refresh_revocations(force=True)
+    assert client.get('/users', headers=old).status_code == 401
+    # tokens issued in the cutoff second are revoked too; one issued later is accepted
+    time.sleep(1.1)
+    new = {'Authorization': 'Bearer ' + client.post('/users/login', json={'username': 'clerk', 'password': 'secret-pass'}).json()['token']}
+    assert client.get('/users', headers=new).status_code == 200
+
+
+def test_reupload_without_church_updates_instead_of_duplicating(fresh_backend):
+    app_module = fresh_backend('app')
+    db = importlib.import_module('backend.db')
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    csv = b's1,s2,s3,s4,s5,collection_code\n55,2024-02-14,1,Alice,100,import\n56,2024-02-14,2,Bob,200,import\n'
+    for expected in ({'inserted': 2}, {'inserted': 0}):
+        resp = client.post('/upload', params={'force': 'true'}, headers=headers,
+                           files={'batch': ('collection.csv', csv, 'text/csv')})
+        assert resp.status_code == 200
+        assert {k: resp.json()[k] for k in expected} == expected
+    row = {'s2': '2024-02-15', 's3': 7, 's4': 'Carol', 'collection_code': 'import'}
+    assert client.post('/submit/members_collection', json=row).json()['inserted'] == 1
+    assert client.post('/submit/members_collection', json=row).json()['inserted'] == 0
+    with db.engine.connect() as conn:
+        rows = conn.execute(db.text('SELECT s1, church FROM members_collection ORDER BY s1')).fetchall()
+    assert [tuple(r) for r in rows] == [(20240214001001, 1), (20240214001002, 1), (20240215001007, 1)]
+
+
+def test_uploads_of_different_files_do_not_overwrite_each_other(fresh_backend):
+    app_module = fresh_backend('app')
+    db = importlib.import_module('backend.db')
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    # both files number their rows from 1
+    for day, names in (('2024-02-14', ('Alice', 'Bob')), ('2024-02-21', ('Carol', 'Dan'))):
+        csv = f's1,s2,s3,s4,collection_code\n1,{day},1,{names[0]},import\n2,{day},2,{names[1]},import\n'.encode()
+        resp = client.post('/upload', headers=headers, files={'batch': (f'{day}.csv', csv, 'text/csv')})
+        assert resp.json()['inserted'] == 2
+    with db.engine.connect() as conn:
+        rows = conn.execute(db.text('SELECT s1, s4 FROM members_collection ORDER BY s1')).fetchall()
+    assert [tuple(r) for r in rows] == [(20240214001001, 'Alice'), (20240214001002, 'Bob'),
+                                        (20240221001001, 'Carol'), (20240221001002, 'Dan')]
+
+
+def test_startup_reports_duplicate_keys_instead_of_deleting(fresh_backend, tmp_path):
+    db = fresh_backend()
+    with db.engine.begin() as conn:
+        conn.execute(db.text('DROP INDEX ix_members_collection_s1_church'))
+        for name in ('Alice', 'Alicia'):
+            conn.execute(db.members_collection.insert().values(s1=7, church=1, s4=name, collection_code='import'))
+    db._upsert_indexes_found.clear()
+    db.create_tables()
+    assert db.members_collection_s1_duplicates() == [{'s1': 7, 'church': 1, 'rows': 2}]
+    # upserts still work without the index, updating every row of the repeated key
+    db.upsert_dataframe(db.pd.DataFrame([{'s1': 7, 'church': 1, 's4': 'Alison', 'collection_code': 'import'}]))
+    with db.engine.connect() as conn:
+        assert conn.execute(db.text('SELECT s4 FROM members_collection')).scalars().all() == ['Alison', 'Alison']
+
+    dedupe = importlib.import_module('backend.dedupe')
+    dedupe.main(['--apply', '--backup', str(tmp_path / 'removed.csv')])
+    assert db.members_collection_s1_duplicates() == []
+    assert len(db.pd.read_csv(tmp_path / 'removed.csv')) == 1
+    with db.engine.connect() as conn:
+        assert conn.execute(db.text('SELECT COUNT(*) FROM members_collection')).scalar() == 1
+    assert 'ix_members_collection_s1_church' in {ix['name'] for ix in db.inspect(db.engine).get_indexes('members_collection')}
+
+
+def test_upsert_update_restamps_updated_at(fresh_backend):
+    app_module = fresh_backend('app')
+    db = importlib.import_module('backend.db')
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+
+    def upload(name):
+        csv = f's1,s2,s3,s4,collection_code\n55,2024-02-14,1,{name},import\n'.encode()
+        return client.post('/upload', params={'force': 'true'}, headers=headers,
+                           files={'batch': ('collection.csv', csv, 'text/csv')}).json()
+
+    assert upload('Alice')['inserted'] == 1
+    cursor = db.read_changes('members_collection', '0')['cursor']
+    assert upload('Alicia')['updated'] == 1
+    with db.engine.connect() as conn:
+        assert conn.execute(db.text('SELECT updated_at FROM members_collection WHERE s3 = 1')).scalar() is not None
+    changed = db.read_changes('members_collection', cursor)['changed']
+    assert list(changed['s4']) == ['Alicia']
+
+
+def test_upload_and_submit_round_minor_units_alike(fresh_backend):
+    app_module = fresh_backend('app', MONEY_STORAGE='minor')
+    db = importlib.import_module('backend.db')
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    csv = b's1,s2,s3,s5,collection_code\n1,2024-02-14,1,12.345,import\n2,2024-02-14,2,0.125,import\n'
+    resp = client.post('/upload', params={'force': 'true'}, headers=headers,
+                       files={'batch': ('collection.csv', csv, 'text/csv')})
+    assert resp.json()['inserted'] == 2
+    for s1, amount in ((3, '12.345'), (4, '0.125')):
+        row = {'s1': s1, 's2': '2024-02-14', 's3': s1, 's5': amount, 'collection_code': 'import'}
+        assert client.post('/submit/members_collection', json=row).json()['inserted'] == 1
+    with db.engine.connect() as conn:
+        stored = conn.execute(db.text('SELECT s5 FROM members_collection ORDER BY s1')).scalars().all()
+    assert stored == [1235, 13, 1235, 13]
+
+
+def test_ingest_burst_over_limit_gets_429_with_retry_after(fresh_backend):
+    app_module = fresh_backend('app', INGEST_RATE='0.01', INGEST_BURST='2')
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    csv = b's1,s2,s3,collection_code\n1,2024-02-14,1,import\n'
+    # previews are not charged
+    for _ in range(3):
+        preview = client.post('/upload/headers', headers=headers, files={'batch': ('c.csv', csv, 'text/csv')})
+        assert preview.status_code == 200
+    statuses = [client.post('/upload', params={'force': 'true'}, headers=headers,
+                            files={'batch': ('c.csv', csv, 'text/csv')}) for _ in range(3)]
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert int(statuses[-1].headers['Retry-After']) >= 1
+
+
+def test_ingest_slot_is_released_when_the_upload_fails(fresh_backend):
+    app_module = fresh_backend('app', INGEST_MAX_INFLIGHT_UPLOADER='1')
+    limiter = importlib.import_module('backend.ratelimit').ingest_limiter
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    for _ in range(2):
+        resp = client.post('/upload', headers=headers, files={'batch': ('c.csv', b'', 'text/csv')})
+        assert resp.status_code == 400
+    assert limiter.store.inflight() == {}
+    assert limiter.rejected_inflight == 0
+
+
+def test_etag_revalidates_until_a_write(fresh_backend):
+    app_module = fresh_backend('app')
+    client = TestClient(app_module.app)
+    first = client.get('/collection_codes')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    again = client.get('/collection_codes', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+    assert client.post('/collection_codes', json={'column_name': 'c99', 'code': 'X'}).status_code == 200
+    changed = client.get('/collection_codes', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert {'column_name': 'c99', 'code': 'X'}.items() <= changed.json()[-1].items()
+
+
+def test_report_fields_and_drop_empty(fresh_backend):
+    app_module = fresh_backend('app')
+    client = TestClient(app_module.app)
+    for s3, name in ((1, 'Alice'), (2, 'Bob')):
+        row = {'s2': '2024-02-14', 's3': s3, 's4': name, 'c1': 10, 'collection_code': 'import'}
+        assert client.post('/submit/members_collection', json=row).json()['inserted'] == 1
+    picked = client.get('/reports/members_collections', params={'fields': 's4,c1'}).json()
+    assert picked == [{'s4': 'Alice', 'c1': 10}, {'s4': 'Bob', 'c1': 10}]
+    unknown = client.get('/reports/members_collections', params={'fields': 's4,nope'})
+    assert unknown.status_code == 400
+    assert 'nope' in unknown.json()['detail']
+    assert client.get('/members', params={'fields': 'nope'}).status_code == 400
+    full = client.get('/reports/members_collections').json()
+    trimmed = client.get('/reports/members_collections', params={'drop_empty': 'true'}).json()
+    assert 'c2' in full[0] and full[0]['c2'] is None
+    assert {'s4', 'c1'} <= set(trimmed[0]) and 'c2' not in trimmed[0]
+    assert len(trimmed) == len(full) == 2
+
+
+def test_auth_cache_follows_role_changes_and_logout(fresh_backend):
+    app_module = fresh_backend('app')
+    db = importlib.import_module('backend.db')
+    client = TestClient(app_module.app)
+    admin = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    app_module.create_user('clerk', 'secret-pass', church_id=1, role='admin')
+    clerk_id = app_module.verify_user('clerk', 'secret-pass')['id']
+    # legacy opaque tokens are resolved through the cache
+    clerk = {'Authorization': 'Bearer ' + db.create_token_for_user(clerk_id)}
+    hits = app_module.auth_cache.hits
+    assert client.get('/users', headers=clerk).status_code == 200
+    assert client.get('/users', headers=clerk).status_code == 200
+    assert app_module.auth_cache.hits == hits + 1
+    resp = client.put(f'/users/{clerk_id}', headers=admin,
+                      json={'username': 'clerk', 'password': 'new-secret', 'church': 1, 'role': 'uploader'})
+    assert resp.status_code == 200
+    # the cached admin principal is gone, so the new role applies at once
+    assert client.get('/users', headers=clerk).status_code == 403
+    assert client.post('/users/logout', headers=clerk).status_code == 200
+    assert client.get('/users', headers=clerk).status_code == 401
+
+
+def test_full_parse_pool_answers_503_with_retry_after(fresh_backend):
+    app_module = fresh_backend('app', PARSE_WORKERS='0', PARSE_QUEUE='0', PARSE_RETRY_AFTER='7')
+    pool = app_module.parse_pool
+    client = TestClient(app_module.app)
+    headers = {'Authorization': 'Bearer ' + _login(client, app_module, 'admin')}
+    csv = b's1,s2,s3,collection_code\n1,2024-02-14,1,import\n'
+    # hold the pool's only slot, as a long parse would
+    assert pool._slots.acquire(blocking=False)
+    try:
+        busy = client.post('/upload/headers', headers=headers, files={'batch': ('c.csv', csv, 'text/csv')})
+    finally:
+        pool._slots.release()
+    assert busy.status_code == 503
+    assert busy.headers['Retry-After'] == '7'
+    assert pool.stats()['rejected'] == 1
+    resp = client.post('/upload/headers', headers=headers, files={'batch': ('c.csv', csv, 'text/csv')})
+    assert resp.status_code == 200
+
+
+def test_server_timing_header_and_metrics(fresh_backend):
+    app_module = fresh_backend('app')
+    client = TestClient(app_module.app)
+    for _ in range(2):
+        resp = client.get('/reports/members_collections')
+        assert resp.status_code == 200
+    phases = [p.split(';')[0] for p in resp.headers['Server-Timing'].split(', ')]
+    assert {'query', 'shape', 'total'} <= set(phases)
+    assert phases[-1] == 'total'
+    text = client.get('/metrics').text
+    labels = '{route="/reports/members_collections",method="GET",status="200"}'
+    assert f'ksc_request_duration_seconds_count{labels} 2' in text.splitlines()
+    assert 'ksc_phase_duration_seconds_count{route="/reports/members_collections",phase="query"} 2' in text
+    assert 'ksc_db_queries_total{route="/reports/members_collections"}' in text
+
+
+def test_patch_changes_only_the_given_columns(fresh_backend):
+    app_module = fresh_backend('app')
+    db = importlib.import_module('backend.db')
+    client = TestClient(app_module.app)
+    for s3, name in ((1, 'Alice'), (2, 'Bob')):
+        row = {'s2': '2024-02-14', 's3': s3, 's4': name, 'c1': 10, 'collection_code': 'import'}
+        assert client.post('/submit/members_collection', json=row).json()['inserted'] == 1
+    with db.engine.connect() as conn:
+        ids = conn.execute(db.text('SELECT id FROM members_collection ORDER BY s3')).scalars().all()
+    resp = client.patch('/members_collection', json=[{'id': ids[0], 'changes': {'c1': '12.5'}},
+                                                     {'id': ids[1], 'changes': {'s4': 'Robert'}},
+                                                     {'id': 9999, 'changes': {'s4': 'Nobody'}}])
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body['updated'], body['not_found'], body['invalid']) == (2, 1, 0)
+    assert [r['status'] for r in body['results']] == ['updated', 'updated', 'not_found']
+    with db.engine.connect() as conn:
+        rows = conn.execute(db.text('SELECT s3, s4, c1 FROM members_collection ORDER BY s3')).fetchall()
+    assert [tuple(r) for r in rows] == [(1, 'Alice', 12.5), (2, 'Robert', 10)]
+    missing = client.patch('/members_collection', json=[{'id': 9999, 'changes': {'s4': 'Nobody'}}])
+    assert missing.status_code == 404
+    assert missing.json()['detail']['results'] == [{'id': 9999, 'status': 'not_found'}]
+
+
+def test_rollups_match_collection_totals_after_writes(fresh_backend):
+    app_module = fresh_backend('app', PLEDGE_AMOUNT_COLUMN='c1')
+    db = importlib.import_module('backend.db')
+    client = TestClient(app_module.app)
+    for sno, group, family in ((1, 'North', 10), (2, 'North', 11), (3, 'South', 20)):
+        db.insert_member(sno=sno, MEMBER_NAME=f'member {sno}', GROUP_NAME=group, GROUP_LEADER_ID=1, FAMILY_ID=family, church=1)
+
+    def totals():
+        rollups = client.get('/reports/rollups').json()
+        c1 = [t['total'] for t in client.get('/reports/collection_totals').json() if t['column_name'] == 'c1']
+        return rollups, (c1 or [0])[0]
+
+    for s3, amount in ((1, 10), (2, 5), (3, '7.5')):
+        row = {'s2': '2024-02-14', 's3': s3, 'c1': amount, 'church': 1, 'collection_code': 'import'}
+        assert client.post('/submit/members_collection', json=row).json()['inserted'] == 1
+    rollups, c1 = totals()
+    assert rollups['total'] == c1 == 22.5
+    assert [(g['group_name'], g['total'], g['members']) for g in rollups['groups']] == [('North', 15, 2), ('South', 7.5, 1)]
+
+    with db.engine.connect() as conn:
+        ids = conn.execute(db.text('SELECT id FROM members_collection ORDER BY s3')).scalars().all()
+    assert client.patch('/members_collection', json=[{'id': ids[2], 'changes': {'c1': 20}}]).status_code == 200
+    rollups, c1 = totals()
+    assert rollups['total'] == c1 == 35
+    assert rollups['groups'][0]['group_name'] == 'South'
+
+    with db.engine.begin() as conn:
+        conn.execute(db.members_collection.delete().where(db.members_collection.c.id == ids[0]))
+    db.bump_table_version('members_collection')
+    rollups, c1 = totals()
+    assert rollups['total'] == c1 == 25
+    assert [(g['group_name'], g['total']) for g in rollups['groups']] == [('South', 20), ('North', 5)]
+
+
 if __name__ == '__main__':
     rows = [{"collection_code":"import","s2":"2024-02-14T00:00:00","s3":1,"s4":"Tester"}]
     print('POST /members_collections/validate')
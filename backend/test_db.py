@@ -1,7 +1,7 @@
 """Small script to exercise the DB layer for SQLite or Postgres.
 
-Usage:
-  python test_db.py
+Usage (from the repository root):
+  python -m backend.test_db
 
 It will create a small `members_collection` table (if not exists), insert two sample rows,
 then print the detected columns and row count.
@@ -9,9 +9,15 @@ then print the detected columns and row count.
 This script uses the same environment variables as `db.py`: `DB_ENGINE`, `DATABASE_URL`, `SQLITE_PATH`.
 """
 
+import importlib
 import os
+import sqlite3
+from datetime import datetime
+from decimal import Decimal
+
 import pandas as pd
-from db import insert_dataframe, get_target_columns, get_sqlite_path
+from sqlalchemy import text
+from backend.db import insert_dataframe, get_target_columns, get_sqlite_path
 
 
 def main():
@@ -34,7 +40,7 @@ def main():
     try:
         # Prefer using the configured SQLAlchemy engine from db.py
         from sqlalchemy import text
-        from db import engine
+        from backend.db import engine
 
         with engine.connect() as conn:
             res = conn.execute(text("SELECT COUNT(*) AS c FROM members_collection"))
@@ -60,5 +66,158 @@ def main():
             print("Could not query row count (maybe driver missing). You can open the DB manually to verify.")
 
 
+def _insert_collection(db, **row):
+    row = dict({'collection_code': 'import', 'church': 1, 's2': datetime(2024, 1, 5)}, **row)
+    money = importlib.import_module('backend.money')
+    return db.write_rows([('insert', 'members_collection', money.row_to_storage('members_collection', row))])[0]['id']
+
+
+def _progress(db, member_id):
+    row = db.pledge_progress(member_id=member_id)[0]
+    return row['paid'], row['contributions']
+
+
+def test_ledger_follows_insert_update_and_delete(fresh_backend):
+    db = fresh_backend()
+    member_id = db.insert_member(sno=501, MEMBER_NAME='Alice', pledge=100)
+    cid = _insert_collection(db, s3=501, s7=Decimal('40'))
+    assert _progress(db, member_id) == (40, 1)
+    assert [(e['collection_id'], e['balance']) for e in db.member_ledger_entries(member_id)] == [(cid, 40)]
+
+    assert db.update_rows('members_collection', [(cid, {'s7': None})]) == ['updated']
+    assert _progress(db, member_id) == (0, 0)
+    assert db.member_ledger_entries(member_id) == []
+
+    db.update_rows('members_collection', [(cid, {'s7': Decimal('25')})])
+    assert _progress(db, member_id) == (25, 1)
+    with db.engine.begin() as conn:
+        conn.execute(db.members_collection.delete().where(db.members_collection.c.id == cid))
+    assert _progress(db, member_id) == (0, 0)
+
+
+def test_ledger_links_rows_by_s3_when_member_arrives_later(fresh_backend):
+    db = fresh_backend()
+    other = db.insert_member(sno=600, MEMBER_NAME='Bob')
+    _insert_collection(db, s3=777, s7=Decimal('10'))
+    # an explicit member_id wins over the s3 match
+    _insert_collection(db, s3=777, member_id=other, s7=Decimal('5'))
+    assert _progress(db, other) == (5, 1)
+
+    late = db.insert_member(sno=777, MEMBER_NAME='Carol')
+    assert _progress(db, late) == (10, 1)
+    assert _progress(db, other) == (5, 1)
+
+
+def test_ledger_in_minor_units(fresh_backend):
+    db = fresh_backend(MONEY_STORAGE='minor')
+    member_id = db.insert_member(sno=501, MEMBER_NAME='Alice', pledge=20)
+    cid = _insert_collection(db, s3=501, s7='12.345')
+    with db.engine.connect() as conn:
+        stored = conn.execute(text('SELECT amount FROM member_ledger WHERE collection_id = :c'), {'c': cid}).scalar()
+    assert stored == 1235
+    assert _progress(db, member_id) == (12.35, 1)
+    assert db.pledge_progress(member_id=member_id)[0]['remaining'] == 7.65
+
+
+def _merge(migrate, source_path, target_path, **options):
+    source = migrate.open_source(str(source_path))
+    try:
+        return migrate.merge_tables(source, str(target_path), workers=1, **options)
+    finally:
+        source.close()
+
+
+def test_delta_without_key_or_watermark_fails(tmp_path):
+    migrate = importlib.import_module('backend.migrate')
+    with sqlite3.connect(tmp_path / 'source.db') as conn:
+        conn.execute('CREATE TABLE notes (body TEXT)')
+        conn.execute("INSERT INTO notes VALUES ('a')")
+    results, errors = _merge(migrate, tmp_path / 'source.db', tmp_path / 'target.db')
+    assert results == [] and '--watermark notes=' in errors['notes']
+
+
+def test_delta_date_watermark_merges_edits(tmp_path):
+    migrate = importlib.import_module('backend.migrate')
+    source = tmp_path / 'source.db'
+    with sqlite3.connect(source) as conn:
+        conn.execute('CREATE TABLE members (id INTEGER PRIMARY KEY, sno INTEGER, MEMBER_NAME TEXT, updated TIMESTAMP)')
+        conn.executemany('INSERT INTO members (sno, MEMBER_NAME, updated) VALUES (?, ?, ?)',
+                         [(i, f'member {i}', '2024-01-01 00:00:00') for i in range(1, 6)])
+    options = {'chunk_rows': 2, 'watermark_columns': {'members': 'updated'}}
+    results, errors = _merge(migrate, source, tmp_path / 'target.db', **options)
+    assert not errors and results[0]['inserted'] == 5
+    with sqlite3.connect(source) as conn:
+        conn.execute("UPDATE members SET MEMBER_NAME = 'renamed', updated = '2024-03-01 00:00:00' WHERE sno = 2")
+    results, errors = _merge(migrate, source, tmp_path / 'target.db', **options)
+    assert (results[0]['inserted'], results[0]['updated']) == (0, 1)
+    with sqlite3.connect(tmp_path / 'target.db') as conn:
+        assert conn.execute('SELECT MEMBER_NAME FROM members WHERE sno = 2').fetchone() == ('renamed',)
+
+
+def test_startup_runs_once_until_schema_or_copy_changes(fresh_backend, tmp_path):
+    startup = fresh_backend('startup')
+    runs = []
+    assert startup.run_startup_once(lambda: runs.append(1)) is True
+    # a restart, in this or any other process, finds the flag for the same digest
+    assert startup.run_startup_once(lambda: runs.append(1)) is False
+    assert len(runs) == 1
+
+    migrate = importlib.import_module('backend.migrate')
+    with sqlite3.connect(tmp_path / 'source.db') as conn:
+        conn.execute('CREATE TABLE church (id INTEGER PRIMARY KEY, name TEXT)')
+    source = migrate.open_source(str(tmp_path / 'source.db'))
+    try:
+        _, errors = migrate.copy_tables(source, str(tmp_path / 'test.db'), ['church'], workers=1)
+    finally:
+        source.close()
+    assert not errors
+    assert startup.run_startup_once(lambda: runs.append(1)) is True
+    assert len(runs) == 2
+
+
+def test_group_commit_flushes_on_stop_and_fails_only_the_bad_row(fresh_backend):
+    db = fresh_backend()
+    writebehind = importlib.import_module('backend.writebehind')
+    # a long delay: nothing is written until stop() flushes the queue
+    committer = writebehind.GroupCommitter(db.write_rows, max_delay=60, max_rows=100)
+    good = [committer.submit('insert', 'members_collection', {'collection_code': 'import', 's4': name})
+            for name in ('Alice', 'Bob')]
+    bad = committer.submit('insert', 'members_collection', {'collection_code': 'import', 'no_such_column': 1})
+    assert not any(f.done() for f in good + [bad])
+    committer.stop()
+    assert all(f.done() for f in good + [bad])
+    assert all(f.result()['id'] for f in good)
+    assert bad.exception() is not None
+    assert {k: committer.stats()[k] for k in ('pending', 'rows', 'failed')} == {'pending': 0, 'rows': 2, 'failed': 1}
+    with db.engine.connect() as conn:
+        names = conn.execute(text('SELECT s4 FROM members_collection ORDER BY id')).scalars().all()
+    assert names == ['Alice', 'Bob']
+
+
+def _items(db):
+    with db.engine.connect() as conn:
+        return [tuple(r) for r in conn.execute(text(
+            'SELECT collection_id, code_column, amount FROM members_collection_items ORDER BY collection_id, code_column'))]
+
+
+def test_collection_items_and_wide_view_follow_writes(fresh_backend):
+    db = fresh_backend(COLLECTION_ITEMS='1')
+    first = _insert_collection(db, s3=1, c1=Decimal('10'), l2=Decimal('5'))
+    second = _insert_collection(db, s3=2, c3=Decimal('2.5'))
+    assert _items(db) == [(first, 'c1', 10), (first, 'l2', 5), (second, 'c3', 2.5)]
+    with db.engine.connect() as conn:
+        wide = conn.execute(text('SELECT id, c1, c3, l2, s3 FROM members_collection_wide ORDER BY id')).fetchall()
+    assert [tuple(r) for r in wide] == [(first, 10, None, 5, 1), (second, None, 2.5, None, 2)]
+    assert [(t['column_name'], t['total']) for t in db.collection_totals()] == [('c1', 10), ('c3', 2.5), ('l2', 5)]
+
+    db.update_rows('members_collection', [(first, {'c1': None, 'l2': Decimal('7')})])
+    assert _items(db) == [(first, 'l2', 7), (second, 'c3', 2.5)]
+    with db.engine.begin() as conn:
+        conn.execute(db.members_collection.delete().where(db.members_collection.c.id == second))
+    assert _items(db) == [(first, 'l2', 7)]
+    with db.engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM members_collection_wide')).scalar() == 1
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,151 @@
+"""Bounded executors with admission control.
+
+Each pool accepts at most `max_workers + max_queue` jobs at a time. When it is full,
+`submit` raises `PoolBusy` straight away instead of queueing without limit, so the API can
+answer 503 with a Retry-After header and other traffic keeps flowing.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+
+class PoolBusy(Exception):
+    """Raised when a bounded pool has no free slot."""
+
+    def __init__(self, pool: str, retry_after: int = 1):
+        super().__init__(f"{pool} pool is busy")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """A lazily created thread or process pool with a hard cap on in-flight jobs.
+
+    `kind` is 'process' or 'thread'. `max_workers=0` runs jobs inline in the caller
+    (still counted against the cap), which is handy for tests and single-core hosts.
+    """
+
+    def __init__(self, name: str, kind: str = 'thread', max_workers: int = 2, max_queue: int = 8, retry_after: int = 1):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max(1, max_workers + max_queue))
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == 'process':
+                        try:
+                            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                        except (OSError, NotImplementedError):
+                            # no multiprocessing support on this host: fall back to threads
+                            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    def _release(self, _fut=None):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy(self.name, self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+        if self.max_workers <= 0:
+            fut = Future()
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+            self._release()
+            return fut
+        if self.kind == 'thread':
+            # keep request-scoped context (timings, query counters) visible inside the worker thread
+            ctx = contextvars.copy_context()
+            call, args = ctx.run, (fn,) + args
+        else:
+            call = fn
+        try:
+            fut = self._get_executor().submit(call, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        fut.add_done_callback(self._release)
+        return fut
+
+    def run(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        """Run `fn` on the pool and block until it finishes."""
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    async def run_async(self, fn, *args, **kwargs):
+        """Run `fn` on the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            ex, self._executor = self._executor, None
+        if ex is not None:
+            ex.shutdown(wait=wait)
+
+
+# PBKDF2 password hashing: a login burst can use at most HASH_WORKERS cores and HASH_QUEUE waiting threads
+hash_pool = BoundedExecutor(
+    'hash',
+    kind='process',
+    max_workers=int(os.getenv('HASH_WORKERS', str(min(2, os.cpu_count() or 1)))),
+    max_queue=int(os.getenv('HASH_QUEUE', '16')),
+    retry_after=int(os.getenv('HASH_RETRY_AFTER', '1')),
+)
+
+# Spreadsheet parsing / pandas transforms of uploads (CPU-bound, so processes)
+parse_pool = BoundedExecutor(
+    'parse',
+    kind='process',
+    max_workers=int(os.getenv('PARSE_WORKERS', str(min(2, os.cpu_count() or 1)))),
+    max_queue=int(os.getenv('PARSE_QUEUE', '4')),
+    retry_after=int(os.getenv('PARSE_RETRY_AFTER', '5')),
+)
+
+# Blocking database calls made from async endpoints
+db_pool = BoundedExecutor(
+    'db',
+    kind='thread',
+    max_workers=int(os.getenv('DB_WORKERS', '8')),
+    max_queue=int(os.getenv('DB_QUEUE', '32')),
+    retry_after=int(os.getenv('DB_RETRY_AFTER', '2')),
+)
+
+POOLS = {'hash': hash_pool, 'parse': parse_pool, 'db': db_pool}
+
+
+def shutdown_pools() -> None:
+    for pool in POOLS.values():
+        pool.shutdown(wait=False)
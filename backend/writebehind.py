@@ -0,0 +1,157 @@
+"""Write-behind group commit for single-row submissions.
+
+With WRITE_BEHIND=1, `/submit/{table_name}` and `POST /members_collection` hand their row to a
+background writer instead of committing it themselves. The writer collects rows for up to
+WRITE_BEHIND_MS milliseconds or WRITE_BEHIND_ROWS rows, writes them in one transaction and only
+then resolves each request, so a 200 still means the row is committed. If the group fails,
+its rows are retried one by one so a bad row only fails its own request.
+
+At most WRITE_BEHIND_QUEUE rows wait at a time; past that `submit` raises `PoolBusy` (503).
+With WRITE_BEHIND=0 (the default) `write_row` commits straight away on the caller's thread.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from .workers import PoolBusy, db_pool
+
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', '0').lower() in ('1', 'true', 'yes', 'on')
+WRITE_BEHIND_MS = float(os.getenv('WRITE_BEHIND_MS', '20'))
+WRITE_BEHIND_ROWS = int(os.getenv('WRITE_BEHIND_ROWS', '200'))
+WRITE_BEHIND_QUEUE = int(os.getenv('WRITE_BEHIND_QUEUE', '5000'))
+
+_STOP = object()
+
+
+class GroupCommitter:
+    """Coalesces `(op, table_name, row)` items into batches for `flush(items) -> results`."""
+
+    def __init__(self, flush: Callable[[List[tuple]], list], max_delay: float = WRITE_BEHIND_MS / 1000,
+                 max_rows: int = WRITE_BEHIND_ROWS, max_pending: int = WRITE_BEHIND_QUEUE):
+        self.flush = flush
+        self.max_delay = max_delay
+        self.max_rows = max(1, max_rows)
+        self.max_pending = max_pending
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.pending = 0
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+        self.rejected = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def submit(self, op: str, table_name: str, row: dict) -> Future:
+        """Queue a row; the future resolves with its result once the row is committed."""
+        fut: Future = Future()
+        with self._lock:
+            if self.max_pending > 0 and self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusy('write_behind')
+            self.pending += 1
+            self._ensure_started()
+        self._queue.put(((op, table_name, row), fut))
+        return fut
+
+    async def submit_async(self, op: str, table_name: str, row: dict):
+        return await asyncio.wrap_future(self.submit(op, table_name, row))
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            stopping = False
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stopping:
+                # finish the rows queued after the marker, then stop
+                self._queue.put(_STOP)
+
+    def _write(self, batch: list) -> None:
+        try:
+            results = self.flush([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # one bad row must not fail the whole group: retry each row on its own
+                for entry in batch:
+                    self._write([entry])
+                return
+            with self._lock:
+                self.pending -= 1
+                self.failed += 1
+            batch[0][1].set_exception(e)
+            return
+        with self._lock:
+            self.pending -= len(batch)
+            self.batches += 1
+            self.rows += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, fut), res in zip(batch, results):
+            fut.set_result(res)
+
+    def stop(self, timeout: Optional[float] = 10) -> None:
+        """Flush what is queued and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'pending': self.pending,
+                'batches': self.batches,
+                'rows': self.rows,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'largest_batch': self.largest_batch,
+            }
+
+
+def _flush(items: List[tuple]) -> list:
+    from .db import write_rows
+    return write_rows(items)
+
+
+committer = GroupCommitter(_flush)
+
+
+def write_row(op: str, table_name: str, row: dict) -> dict:
+    """Write one coerced row and return its `write_rows` result, via the committer when enabled."""
+    if WRITE_BEHIND:
+        return committer.submit(op, table_name, row).result()
+    return _flush([(op, table_name, row)])[0]
+
+
+async def write_row_async(op: str, table_name: str, row: dict) -> dict:
+    """`write_row` for async endpoints: waits for the group commit, or runs the write on `db_pool`."""
+    if WRITE_BEHIND:
+        return await committer.submit_async(op, table_name, row)
+    return (await db_pool.run_async(_flush, [(op, table_name, row)]))[0]
+
+
+def stop_write_behind() -> None:
+    committer.stop()
@@ -197,7 +197,21 @@ export default function App(){
   }
 
   async function fetchCodes(){ try{ const res = await fetch('http://localhost:8000/collection_codes'); const data = await res.json(); setCollectionCodes(data) }catch(e){} }
-  async function fetchMembersLocal(){ try{ const res = await fetch('http://localhost:8000/members'); const data = await res.json(); setMembersLocal(data) }catch(e){} }
+  // Members are kept in localStorage and refreshed with `?since=`, so a reload only downloads what changed
+  async function fetchMembersLocal(){
+    try{
+      let cached = null
+      try{ cached = JSON.parse(localStorage.getItem('membersSync')||'null') }catch(e){}
+      const res = await fetch('http://localhost:8000/members?since='+encodeURIComponent(cached && cached.cursor ? cached.cursor : '0'))
+      const data = await res.json(); if(!res.ok) return
+      const byId = new Map(cached && !data.reset ? cached.rows.map(r=> [r.id, r]) : [])
+      data.deleted.forEach(id=> byId.delete(id))
+      data.changed.forEach(r=> byId.set(r.id, r))
+      const rows = Array.from(byId.values()).sort((a,b)=> a.id - b.id)
+      try{ localStorage.setItem('membersSync', JSON.stringify({cursor: data.cursor, rows})) }catch(e){}
+      setMembersLocal(rows)
+    }catch(e){}
+  }
 
   async function fetchMembersCollections(){
     try{